@@ -0,0 +1,70 @@
+"""
+預測準確度回測 CLI
+以本機 OHLCV 資料對一或多個股票執行 walk-forward 回測，使用 CPU 執行池的所有 worker；
+中斷後以相同參數重新執行時，沿用已寫入 checkpoint 的起點
+
+用法：
+    python backtest.py 2330.TW
+    python backtest.py 2330.TW 2317.TW --model holt_winters --range 5y --horizon 14 --step 10
+    python backtest.py AAPL --no-resume --json result.json
+"""
+import argparse
+import asyncio
+import json
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="以 walk-forward 回測評估預測模型的準確度")
+    parser.add_argument("symbols", nargs="+", help="股票代號")
+    parser.add_argument("--model", help="預測模型（預設使用 FORECAST_ENGINE）")
+    parser.add_argument("--range", default="2y", help="回測使用的資料期間（預設 2y）")
+    parser.add_argument("--window", default="6mo", help="每個起點的訓練資料期間（預設 6mo）")
+    parser.add_argument("--horizon", type=int, default=7, help="每個起點的預測天數（預設 7）")
+    parser.add_argument("--step", type=int, default=5, help="起點的間隔（工作日，預設 5）")
+    parser.add_argument("--no-resume", action="store_true", help="忽略先前的 checkpoint，重新計算全部起點")
+    parser.add_argument("--json", help="結果 JSON 檔案")
+    return parser.parse_args()
+
+
+async def run(args) -> list:
+    import main as api
+
+    model = api.resolve_model(args.model)
+    try:
+        results = []
+        for symbol in args.symbols:
+            results.append(await api.backtest_symbol(
+                symbol, model, args.range, args.window, args.horizon, args.step, resume=not args.no_resume
+            ))
+        return results
+    finally:
+        api.cache_manager.close()
+        api.model_store.close()
+        api.ohlcv_store.close()
+        api.backtest_store.close()
+        api.executors.shutdown()
+
+
+def print_summary(result: dict):
+    overall = result["overall"]
+    print(f"{result['symbol']} ({result['model']}): {result['origins']} origins "
+          f"{result['first_origin']} .. {result['last_origin']}, {result['resumed']} resumed, "
+          f"{len(result['failed'])} failed, {result['elapsed']:.1f}s")
+    if overall is None:
+        print("  no evaluated points")
+        return
+    print(f"  overall   MAE {overall['mae']:.4f}  MAPE {overall['mape']:.2f}%  "
+          f"coverage {overall['coverage']:.1%}  ({overall['points']} points)")
+    for row in result["by_horizon"]:
+        print(f"  +{row['days']:>2}d      MAE {row['mae']:.4f}  MAPE {row['mape']:.2f}%  "
+              f"coverage {row['coverage']:.1%}  ({row['points']} points)")
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = asyncio.run(run(args))
+    for result in results:
+        print_summary(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
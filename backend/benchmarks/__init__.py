@@ -0,0 +1,5 @@
+"""
+離線效能基準測試
+使用合成的 OHLCV 資料，不需要網路或資料來源，從 backend 目錄執行：
+    python -m benchmarks.<模組名稱>
+"""
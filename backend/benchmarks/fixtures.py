@@ -0,0 +1,58 @@
+"""
+基準測試用的合成 OHLCV 資料
+以固定亂數種子產生帶有趨勢、週與年週期的幾何隨機漫步，每次執行的資料完全相同
+"""
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# 資料期間對應的交易日數
+SPANS = {
+    "1mo": 21,
+    "6mo": 126,
+    "2y": 504,
+    "5y": 1260,
+    "20y": 5040,
+}
+
+
+def synthetic_ohlcv(bars: int, seed: int = 0, end: Optional[str] = None) -> pd.DataFrame:
+    """
+    產生合成的日 K 資料
+
+    Args:
+        bars: K 棒數量（交易日）
+        seed: 亂數種子
+        end: 最後一個交易日（預設 2025-10-31）
+
+    Returns:
+        以 Asia/Taipei 時區交易日為索引、含 Open、High、Low、Close、Volume 欄位的 DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    index = pd.bdate_range(end=end or "2025-10-31", periods=bars, tz="Asia/Taipei")
+
+    day_of_year = index.dayofyear.to_numpy()
+    weekday = index.weekday.to_numpy()
+    log_returns = 0.0003 + rng.normal(0, 0.012, bars)
+    seasonal = 0.04 * np.sin(2 * np.pi * day_of_year / 365.25) + 0.004 * np.cos(2 * np.pi * weekday / 5)
+    close = 100 * np.exp(np.cumsum(log_returns) + seasonal)
+
+    spread = close * rng.uniform(0.002, 0.02, bars)
+    open_ = close * (1 + rng.normal(0, 0.004, bars))
+    high = np.maximum(open_, close) + spread * rng.random(bars)
+    low = np.minimum(open_, close) - spread * rng.random(bars)
+    volume = rng.integers(1_000_000, 50_000_000, bars).astype(float)
+
+    return pd.DataFrame(
+        {"Open": open_, "High": high, "Low": low, "Close": close, "Volume": volume},
+        index=index
+    )
+
+
+def prophet_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """轉換為預測模型使用的 ds / y 格式（與 /predict 相同）"""
+    return pd.DataFrame({
+        'ds': df.index.tz_localize(None),
+        'y': df['Close'].values
+    })
@@ -0,0 +1,151 @@
+"""
+基準測試的計時、結果儲存與比較
+每個項目重複多輪（rounds），每輪執行 number 次，number 自動調整到單輪至少 min_round_seconds；
+結果以 JSON 儲存，可與先前的結果比較並標示變慢的項目
+"""
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+def quiet_logging():
+    """關閉每次訓練與請求都會輸出的記錄，避免影響計時"""
+    logging.getLogger("cmdstanpy").disabled = True
+    for name in ("prophet", "main", "utils", "httpx"):
+        logging.getLogger(name).setLevel(logging.ERROR)
+    logging.getLogger().setLevel(logging.ERROR)
+
+
+def calibrate(fn: Callable[[], object], min_round_seconds: float) -> int:
+    """找出單輪至少需要執行幾次（與 timeit.autorange 相同的 1、2、5、10... 序列）"""
+    number = 1
+    while True:
+        for factor in (1, 2, 5):
+            count = number * factor
+            started = time.perf_counter()
+            for _ in range(count):
+                fn()
+            if time.perf_counter() - started >= min_round_seconds:
+                return count
+        number *= 10
+
+
+def measure(
+    fn: Callable[[], object],
+    rounds: int = 7,
+    number: Optional[int] = None,
+    min_round_seconds: float = 0.05,
+    operations: int = 1
+) -> dict:
+    """
+    測量函式的執行時間
+
+    Args:
+        fn: 要測量的函式（不接受參數）
+        rounds: 重複輪數
+        number: 每輪執行次數（None 表示自動調整）
+        min_round_seconds: 自動調整時單輪的最短秒數
+        operations: 每次呼叫包含的操作數（例如並行請求數），用於計算每秒操作數
+
+    Returns:
+        單次呼叫的秒數統計（min、median、mean、p95、stdev）與 ops_per_second
+    """
+    fn()  # 暖身：排除第一次呼叫的匯入與快取成本
+    if number is None:
+        number = calibrate(fn, min_round_seconds)
+
+    samples = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - started) / number)
+
+    median = statistics.median(samples)
+    return {
+        "rounds": rounds,
+        "number": number,
+        "min": min(samples),
+        "median": median,
+        "mean": statistics.fmean(samples),
+        "p95": float(np.percentile(samples, 95)),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "ops_per_second": operations / median if median else None,
+    }
+
+
+def environment() -> dict:
+    """執行環境資訊（比較不同機器的結果時參考）"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        commit = None
+
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+
+def save_results(path: str, results: Dict[str, dict], options: dict):
+    """將結果與執行環境寫入 JSON"""
+    with open(path, "w") as f:
+        json.dump({"environment": environment(), "options": options, "results": results}, f, indent=2)
+
+
+def load_results(path: str) -> Dict[str, dict]:
+    """讀取 save_results 寫入的結果"""
+    with open(path) as f:
+        return json.load(f)["results"]
+
+
+def compare(baseline: Dict[str, dict], current: Dict[str, dict], threshold: float = 0.2) -> List[dict]:
+    """
+    比較兩次執行的中位數
+
+    Args:
+        baseline: 基準結果
+        current: 本次結果
+        threshold: 變化比例超過此值才標示為變慢（regression）或變快（improvement）
+
+    Returns:
+        每個共同項目的比較（name、baseline、current、ratio、status）
+    """
+    rows = []
+    for name in sorted(baseline.keys() & current.keys()):
+        before = baseline[name]["median"]
+        after = current[name]["median"]
+        ratio = after / before if before else float("inf")
+        if ratio > 1 + threshold:
+            status = "regression"
+        elif ratio < 1 - threshold:
+            status = "improvement"
+        else:
+            status = "unchanged"
+        rows.append({"name": name, "baseline": before, "current": after, "ratio": ratio, "status": status})
+    return rows
+
+
+def format_seconds(seconds: float) -> str:
+    """以適當的單位顯示秒數"""
+    if seconds >= 1:
+        return f"{seconds:.3f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.3f} ms"
+    return f"{seconds * 1e6:.1f} µs"
@@ -0,0 +1,115 @@
+"""
+Prophet 訓練設定檔基準測試
+比較 accurate、balanced、fast 三種設定檔在不同資料期間的訓練時間（從頭訓練與 warm start）
+以及保留最後一段資料驗證的預測誤差
+
+    python -m benchmarks.prophet_profiles [--spans 6mo 2y 5y] [--horizon 20] [--repeat 3] [--json 結果.json]
+"""
+import argparse
+import json
+import statistics
+import time
+from typing import Dict, List
+
+import pandas as pd
+
+from benchmarks.fixtures import SPANS, prophet_frame, synthetic_ohlcv
+from benchmarks.harness import quiet_logging
+from utils.forecast import PROPHET_PROFILES, fit_forecast
+
+
+def forecast_error(predictions: List[dict], actual: pd.DataFrame) -> Dict[str, float]:
+    """
+    以實際有交易的日期比對預測（預測以日曆日計）
+
+    Returns:
+        MAE、MAPE（%）與實際值落在預測區間內的比例
+    """
+    forecast = pd.DataFrame(predictions).set_index("date")
+    actual = actual.assign(date=actual['ds'].dt.strftime("%Y-%m-%d")).set_index("date")
+    joined = actual.join(forecast, how="inner")
+
+    errors = (joined['predicted'] - joined['y']).abs()
+    covered = (joined['y'] >= joined['lower']) & (joined['y'] <= joined['upper'])
+    return {
+        "mae": round(float(errors.mean()), 4),
+        "mape": round(float((errors / joined['y']).mean() * 100), 4),
+        "coverage": round(float(covered.mean()), 4),
+    }
+
+
+def timed(fn, repeat: int) -> tuple:
+    """執行 repeat 次，返回 (中位數秒數, 最後一次的結果)"""
+    durations = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        durations.append(time.perf_counter() - started)
+    return statistics.median(durations), result
+
+
+def run(spans: List[str], horizon: int, repeat: int) -> List[dict]:
+    """
+    對每個資料期間與設定檔測量訓練時間與預測誤差
+
+    warm start 的時間為：先以少一根 K 棒的資料訓練，再以完整訓練資料從該模型的參數開始訓練
+    """
+    # 先訓練一次，排除匯入與編譯快取的時間
+    fit_forecast("prophet", prophet_frame(synthetic_ohlcv(SPANS["6mo"])), horizon)
+
+    results = []
+    for span in spans:
+        frame = prophet_frame(synthetic_ohlcv(SPANS[span] + horizon))
+        train, holdout = frame.iloc[:-horizon], frame.iloc[-horizon:]
+        # 預測以日曆日計，需涵蓋保留期間的所有交易日
+        days = (holdout['ds'].iloc[-1] - train['ds'].iloc[-1]).days
+
+        for profile in PROPHET_PROFILES:
+            cold_seconds, fitted = timed(lambda: fit_forecast("prophet", train, days, profile=profile), repeat)
+            previous = fit_forecast("prophet", train.iloc[:-1], days, profile=profile)["model"]
+            warm_seconds, _ = timed(
+                lambda: fit_forecast("prophet", train, days, previous_model=previous, profile=profile), repeat
+            )
+            results.append({
+                "span": span,
+                "bars": len(train),
+                "profile": profile,
+                "fit_seconds": round(cold_seconds, 4),
+                "warm_fit_seconds": round(warm_seconds, 4),
+                **forecast_error(fitted["predictions"], holdout),
+            })
+    return results
+
+
+def print_table(results: List[dict]):
+    """輸出結果表格"""
+    header = f"{'span':<6}{'bars':>6}  {'profile':<10}{'fit s':>8}{'warm s':>8}{'MAE':>9}{'MAPE %':>8}{'cover':>7}"
+    print(header)
+    print("-" * len(header))
+    for row in results:
+        print(
+            f"{row['span']:<6}{row['bars']:>6}  {row['profile']:<10}"
+            f"{row['fit_seconds']:>8.3f}{row['warm_fit_seconds']:>8.3f}"
+            f"{row['mae']:>9.3f}{row['mape']:>8.2f}{row['coverage']:>7.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prophet 訓練設定檔基準測試")
+    parser.add_argument("--spans", nargs="+", default=["6mo", "2y", "5y"], choices=list(SPANS))
+    parser.add_argument("--horizon", type=int, default=20, help="保留驗證的交易日數")
+    parser.add_argument("--repeat", type=int, default=3, help="每項測量的重複次數（取中位數）")
+    parser.add_argument("--json", help="另將結果寫入 JSON 檔案")
+    args = parser.parse_args()
+
+    quiet_logging()
+    results = run(args.spans, args.horizon, args.repeat)
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"benchmark": "prophet_profiles", "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+基準測試執行程式
+
+    # 執行並儲存結果
+    python -m benchmarks.run --output results.json
+    # 只執行部分項目
+    python -m benchmarks.run --groups indicators cache --spans 6mo 5y
+    # 與先前的結果比較，有項目變慢超過門檻時以狀態碼 1 結束
+    python -m benchmarks.run compare baseline.json results.json --threshold 0.2
+"""
+import argparse
+import sys
+
+from benchmarks.fixtures import SPANS
+from benchmarks.harness import compare, format_seconds, load_results, quiet_logging, save_results
+from benchmarks.suite import GROUPS, bench_auth, bench_cache, bench_endpoints, bench_forecast, bench_indicators
+
+DEFAULT_SPANS = ["1mo", "6mo", "5y", "20y"]
+# Prophet 在 20 年資料上單次訓練需要數秒，預設只測量較短的期間
+DEFAULT_FORECAST_SPANS = ["6mo", "5y"]
+
+
+def print_results(results: dict):
+    """輸出每個項目的中位數與每秒操作數"""
+    width = max(len(name) for name in results)
+    for name, stats in results.items():
+        ops = stats["ops_per_second"]
+        print(f"{name:<{width}}  {format_seconds(stats['median']):>12}  ±{format_seconds(stats['stdev']):>11}  {ops:>12,.1f} ops/s")
+
+
+def run(args) -> int:
+    quiet_logging()
+    spans = args.spans or DEFAULT_SPANS
+    results = {}
+
+    if "indicators" in args.groups:
+        results.update(bench_indicators(spans, args.rounds))
+    if "forecast" in args.groups:
+        results.update(bench_forecast(args.spans or DEFAULT_FORECAST_SPANS, args.rounds))
+    if "cache" in args.groups:
+        results.update(bench_cache(args.rounds, threads=args.concurrency))
+    if "auth" in args.groups:
+        results.update(bench_auth(args.rounds))
+    if "endpoints" in args.groups:
+        try:
+            results.update(bench_endpoints(spans, args.rounds, concurrency=args.concurrency))
+        except ImportError as e:
+            print(f"Skipping endpoints: {e}（需要 pip install httpx）", file=sys.stderr)
+
+    print_results(results)
+    if args.output:
+        save_results(args.output, results, {
+            "groups": args.groups,
+            "spans": spans,
+            "rounds": args.rounds,
+            "concurrency": args.concurrency,
+        })
+        print(f"Results written to {args.output}")
+    return 0
+
+
+def run_compare(args) -> int:
+    rows = compare(load_results(args.baseline), load_results(args.current), args.threshold)
+    if not rows:
+        print("No common benchmarks to compare")
+        return 0
+
+    width = max(len(row["name"]) for row in rows)
+    for row in rows:
+        marker = {"regression": "SLOWER", "improvement": "faster"}.get(row["status"], "")
+        print(
+            f"{row['name']:<{width}}  {format_seconds(row['baseline']):>12} -> "
+            f"{format_seconds(row['current']):>12}  {row['ratio']:>6.2f}x  {marker}"
+        )
+
+    regressions = [row for row in rows if row["status"] == "regression"]
+    print(f"{len(rows)} compared, {len(regressions)} regressions (threshold {args.threshold:.0%})")
+    return 1 if regressions else 0
+
+
+def main() -> int:
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        parser = argparse.ArgumentParser(prog="python -m benchmarks.run compare", description="比較兩次基準測試結果")
+        parser.add_argument("baseline", help="基準結果 JSON")
+        parser.add_argument("current", help="本次結果 JSON")
+        parser.add_argument("--threshold", type=float, default=0.2, help="中位數變慢超過此比例視為 regression")
+        return run_compare(parser.parse_args(sys.argv[2:]))
+
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description="離線基準測試")
+    parser.add_argument("--groups", nargs="+", default=list(GROUPS), choices=GROUPS)
+    parser.add_argument("--spans", nargs="+", choices=list(SPANS), help="資料期間（預設 1mo 6mo 5y 20y，forecast 為 6mo 5y）")
+    parser.add_argument("--rounds", type=int, default=7, help="每個項目的重複輪數")
+    parser.add_argument("--concurrency", type=int, default=8, help="cache 與 endpoints 的並行數")
+    parser.add_argument("--output", help="結果 JSON 檔案")
+    return run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
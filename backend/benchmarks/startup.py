@@ -0,0 +1,106 @@
+"""
+啟動時間基準測試
+在全新的子行程中匯入 main，測量匯入時間並檢查 Prophet、yfinance 等重量級依賴沒有在匯入時載入；
+加上 --warm-up 時另外測量暖機（載入依賴並在 CPU worker 訓練一次）所需的時間。
+匯入時間的中位數超過 --budget 秒或載入了重量級依賴時以狀態碼 1 結束，可作為 CI 的檢查
+
+    python -m benchmarks.startup [--repeat 5] [--budget 3.0] [--warm-up] [--json 結果.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List
+
+# 只有預測與下載路徑需要、不應在匯入 main 時載入的模組
+HEAVY_MODULES = ("prophet", "cmdstanpy", "yfinance", "matplotlib", "plotly")
+
+# 在子行程中執行：匯入 main（與選擇性的暖機）並以 JSON 輸出結果
+_PROBE = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter() - started
+heavy = sorted(name for name in {heavy!r} if name in sys.modules)
+warm_up = None
+if {warm_up!r}:
+    started = time.perf_counter()
+    asyncio.run(main.warm_up_workers())
+    warm_up = time.perf_counter() - started
+main.cache_manager.close()
+main.model_store.close()
+main.ohlcv_store.close()
+main.backtest_store.close()
+main.executors.shutdown()
+print(json.dumps({{"import": imported, "heavy": heavy, "warm_up": warm_up}}))
+"""
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def probe(warm_up: bool = False) -> dict:
+    """在全新的子行程中匯入 main 一次"""
+    with tempfile.TemporaryDirectory() as directory:
+        env = {
+            **os.environ,
+            "PYTHONPATH": BACKEND_DIR,
+            "DATA_SOURCE": "fixture",
+            "FIXTURE_DIR": directory,
+            "OHLCV_DB_PATH": os.path.join(directory, "ohlcv.db"),
+            "SUPABASE_JWT_SECRET": "benchmark-secret",
+            "PRECOMPUTE_ENABLED": "false",
+            "WARMUP_ENABLED": "true" if warm_up else "false",
+        }
+        # main 在匯入時於目前目錄建立資料庫
+        output = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(heavy=HEAVY_MODULES, warm_up=warm_up)],
+            cwd=directory, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_startup(repeat: int, warm_up: bool = False) -> Dict[str, object]:
+    """重複匯入 repeat 次，返回匯入時間（與暖機時間）的統計"""
+    runs: List[dict] = [probe(warm_up) for _ in range(repeat)]
+    imports = [run["import"] for run in runs]
+    result = {
+        "import_median": statistics.median(imports),
+        "import_min": min(imports),
+        "import_max": max(imports),
+        "heavy_modules": sorted({name for run in runs for name in run["heavy"]}),
+    }
+    if warm_up:
+        result["warm_up_median"] = statistics.median(run["warm_up"] for run in runs)
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup", description="啟動時間基準測試")
+    parser.add_argument("--repeat", type=int, default=5, help="重複次數")
+    parser.add_argument("--budget", type=float, default=3.0, help="匯入時間中位數的上限（秒）")
+    parser.add_argument("--warm-up", action="store_true", help="同時測量暖機時間")
+    parser.add_argument("--json", help="結果 JSON 檔案")
+    args = parser.parse_args()
+
+    result = measure_startup(args.repeat, args.warm_up)
+    print(f"import main   median {result['import_median']:.3f}s  "
+          f"(min {result['import_min']:.3f}s, max {result['import_max']:.3f}s, budget {args.budget:.3f}s)")
+    if args.warm_up:
+        print(f"warm-up       median {result['warm_up_median']:.3f}s")
+    if result["heavy_modules"]:
+        print(f"heavy modules imported at startup: {', '.join(result['heavy_modules'])}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({**result, "budget": args.budget}, f, indent=2)
+
+    failed = result["import_median"] > args.budget or bool(result["heavy_modules"])
+    print("FAIL" if failed else "OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
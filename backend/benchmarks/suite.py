@@ -0,0 +1,221 @@
+"""
+基準測試項目
+  indicators: 每個 calculate_* 指標、calculate_all_indicators 與 format_indicators_for_chart
+  forecast:   各預測模型的訓練與預測
+  cache:      CacheManager 的讀寫（單執行緒與多執行緒並行）
+  auth:       JWT 驗證（每次驗證簽章與命中已驗證 Token 快取）
+  endpoints:  透過 ASGI 測試用戶端以固定並行數請求 /history（含 max_points 降採樣）與 /predict
+
+所有項目都使用合成資料，端點測試以 fixture 資料來源取代 yfinance，不需要網路
+"""
+import asyncio
+import inspect
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from functools import partial
+from typing import Callable, Dict, Iterable, List
+
+from benchmarks.fixtures import SPANS, prophet_frame, synthetic_ohlcv
+from benchmarks.harness import measure
+
+# 端點測試的資料期間對應的 /history range 參數
+HISTORY_RANGES = {
+    "1mo": "1mo",
+    "6mo": "6mo",
+    "2y": "2y",
+    "5y": "5y",
+    "20y": "max",
+}
+
+# 降採樣端點測試的點數上限（回應大小應與資料期間無關）
+HISTORY_MAX_POINTS = 500
+
+GROUPS = ("indicators", "forecast", "cache", "auth", "endpoints")
+
+
+def bench_indicators(spans: Iterable[str], rounds: int) -> Dict[str, dict]:
+    """每個指標函式在各資料期間的計算時間"""
+    from utils import indicators
+
+    functions = {
+        name: fn for name, fn in inspect.getmembers(indicators, inspect.isfunction)
+        if name.startswith("calculate_") and fn.__module__ == indicators.__name__
+    }
+
+    results = {}
+    for span in spans:
+        df = synthetic_ohlcv(SPANS[span])
+        for name, fn in sorted(functions.items()):
+            results[f"indicators.{name}[{span}]"] = measure(lambda: fn(df), rounds)
+
+        computed = indicators.calculate_all_indicators(df)
+        results[f"indicators.format_indicators_for_chart[{span}]"] = measure(
+            lambda: indicators.format_indicators_for_chart(df, computed), rounds
+        )
+    return results
+
+
+def bench_forecast(spans: Iterable[str], rounds: int, horizon: int = 30) -> Dict[str, dict]:
+    """每個預測模型的訓練加預測時間（Prophet 使用預設設定檔、不使用 warm start）"""
+    from utils.forecast import ENGINES, fit_forecast
+
+    results = {}
+    for span in spans:
+        frame = prophet_frame(synthetic_ohlcv(SPANS[span]))
+        for name, engine in ENGINES.items():
+            # Prophet 單次就需要數百毫秒，不需要重複執行來累積時間
+            results[f"forecast.{name}[{span}]"] = measure(
+                lambda: fit_forecast(name, frame, horizon),
+                rounds=max(3, rounds // 2) if engine.cpu_bound else rounds,
+                number=1 if engine.cpu_bound else None
+            )
+    return results
+
+
+def bench_cache(rounds: int, threads: int = 8, keys: int = 200) -> Dict[str, dict]:
+    """CacheManager 的讀寫時間；並行項目以 threads 個執行緒各自讀寫 keys 筆"""
+    from utils.cache import CacheManager
+
+    payload = {"symbol": "BENCH", "predictions": [{"date": "2025-01-01", "predicted": 1.0}] * 30}
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        cache = CacheManager(os.path.join(directory, "cache.db"), pool_size=threads)
+        symbols = [f"S{i:04d}" for i in range(keys)]
+        for symbol in symbols:
+            cache.save_prediction(symbol, 7, payload)
+
+        results["cache.get_prediction[threads=1]"] = measure(lambda: cache.get_prediction("S0000", 7), rounds)
+        results["cache.save_prediction[threads=1]"] = measure(
+            lambda: cache.save_prediction("S0000", 7, payload), rounds
+        )
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            def concurrently(fn: Callable[[str], object]) -> Callable[[], None]:
+                return lambda: list(pool.map(fn, symbols))
+
+            results[f"cache.get_prediction[threads={threads}]"] = measure(
+                concurrently(lambda symbol: cache.get_prediction(symbol, 7)), rounds, operations=keys
+            )
+            results[f"cache.save_prediction[threads={threads}]"] = measure(
+                concurrently(lambda symbol: cache.save_prediction(symbol, 7, payload)), rounds, operations=keys
+            )
+
+        cache.close()
+    return results
+
+
+def bench_auth(rounds: int) -> Dict[str, dict]:
+    """每個已驗證請求的認證成本：每次驗證簽章與命中 token_cache"""
+    import time
+    from jose import jwt
+    from utils import auth
+
+    secret = auth.SUPABASE_JWT_SECRET or "benchmark-secret"
+    token = jwt.encode(
+        {"sub": "benchmark", "email": "benchmark@example.com", "exp": int(time.time()) + 3600},
+        secret
+    )
+    original = auth.get_supabase_public_key
+    auth.get_supabase_public_key = lambda: secret
+    try:
+        auth.token_cache.clear()
+        results = {"auth.decode_token[uncached]": measure(lambda: auth._verify(token), rounds)}
+        results["auth.decode_token[cached]"] = measure(lambda: auth.decode_token(token), rounds)
+    finally:
+        auth.get_supabase_public_key = original
+        auth.token_cache.clear()
+    return results
+
+
+def bench_endpoints(spans: Iterable[str], rounds: int, concurrency: int = 8, requests: int = 64) -> Dict[str, dict]:
+    """
+    以 ASGI 測試用戶端請求 /history 與 /predict
+
+    每輪同時送出 requests 個請求（最多 concurrency 個並行）；/predict 先請求一次完成訓練，
+    之後測量的是快取命中的路徑
+    """
+    from jose import jwt
+
+    spans = list(spans)
+    with tempfile.TemporaryDirectory() as directory:
+        fixtures = os.path.join(directory, "fixtures")
+        os.makedirs(fixtures)
+        longest = max(SPANS[span] for span in spans)
+        synthetic_ohlcv(longest, end=date.today().isoformat()).to_csv(
+            os.path.join(fixtures, "BENCH.csv"), index_label="Date"
+        )
+
+        # main 在匯入時讀取環境變數並在目前目錄建立資料庫
+        os.environ.update({
+            "DATA_SOURCE": "fixture",
+            "FIXTURE_DIR": fixtures,
+            "OHLCV_DB_PATH": os.path.join(directory, "ohlcv.db"),
+            "SUPABASE_JWT_SECRET": "benchmark-secret",
+            "PRECOMPUTE_ENABLED": "false",
+        })
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            import main
+            from utils import auth
+
+            # utils.auth 可能已由 auth 項目先匯入，當時讀取的 SUPABASE_JWT_SECRET 不一定是這裡設定的值
+            original = auth.get_supabase_public_key
+            auth.get_supabase_public_key = lambda: "benchmark-secret"
+            auth.token_cache.clear()
+            token = jwt.encode({"sub": "benchmark", "email": "benchmark@example.com"}, "benchmark-secret")
+            headers = {"Authorization": f"Bearer {token}"}
+            try:
+                return asyncio.run(_bench_endpoints(main.app, headers, spans, rounds, concurrency, requests))
+            finally:
+                auth.get_supabase_public_key = original
+                auth.token_cache.clear()
+                main.cache_manager.close()
+                main.model_store.close()
+                main.ohlcv_store.close()
+                main.backtest_store.close()
+                main.executors.shutdown()
+        finally:
+            os.chdir(cwd)
+
+
+async def _bench_endpoints(app, headers: dict, spans: List[str], rounds: int, concurrency: int, requests: int) -> Dict[str, dict]:
+    import httpx
+
+    results = {}
+    loop = asyncio.get_running_loop()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark", timeout=300) as client:
+        limit = asyncio.Semaphore(concurrency)
+
+        async def get(url: str, **kwargs):
+            async with limit:
+                response = await client.get(url, **kwargs)
+                response.raise_for_status()
+
+        def burst(url: str, **kwargs) -> Callable[[], None]:
+            # measure 是同步函式，從事件迴圈以外的執行緒提交請求
+            async def run():
+                await asyncio.gather(*(get(url, **kwargs) for _ in range(requests)))
+            return lambda: asyncio.run_coroutine_threadsafe(run(), loop).result()
+
+        targets = [
+            (f"endpoints.history[{span},c={concurrency}]", f"/history?symbol=BENCH&range={HISTORY_RANGES[span]}", {})
+            for span in spans
+        ]
+        targets += [
+            (
+                f"endpoints.history[{span},max_points={HISTORY_MAX_POINTS},c={concurrency}]",
+                f"/history?symbol=BENCH&range={HISTORY_RANGES[span]}&max_points={HISTORY_MAX_POINTS}",
+                {}
+            )
+            for span in spans
+        ]
+        targets.append((f"endpoints.predict[cached,c={concurrency}]", "/predict?symbol=BENCH&days=7", {"headers": headers}))
+
+        for name, url, kwargs in targets:
+            results[name] = await asyncio.to_thread(
+                partial(measure, burst(url, **kwargs), rounds, number=1, operations=requests)
+            )
+    return results
@@ -1,21 +1,114 @@
-from fastapi import FastAPI, HTTPException, Depends
+import asyncio
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from prophet import Prophet
-import yfinance as yf
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
-from typing import Optional
+from datetime import date, datetime, timedelta
+from typing import List, Optional
 import logging
 import pytz
-from utils.cache import CacheManager
-from utils.auth import verify_token, get_current_user
-from utils.indicators import calculate_all_indicators, get_latest_indicators, format_indicators_for_chart
+from utils.cache import CacheManager, CacheEntry
+from utils.response_cache import ResponseCache
+from utils.auth import verify_token, decode_token, get_current_user
+from utils.executor import ExecutorManager, ExecutorBusyError, TaskTimeoutError, ClientDisconnectedError
+from utils.forecast import ENGINES, PROPHET_PROFILES, fit_forecast, get_engine, warm_up
+from utils.data_sources import create_data_source
+from utils.ohlcv_store import OHLCVStore, PERIOD_OFFSETS, period_start
+from utils.http_cache import make_etag, etag_matches, not_modified
+from utils.downsampling import (
+    DOWNSAMPLE_METHODS,
+    INTERVALS,
+    MAX_POINTS,
+    MIN_POINTS,
+    downsample,
+    resample_bars,
+    resolve_interval
+)
+from utils.serialization import (
+    RESPONSE_FORMATS,
+    encode_json,
+    history_records,
+    history_columns,
+    indicator_columns,
+    payload_to_columns
+)
+from utils.singleflight import SingleFlight
+from utils.admission import AdmissionController, AdmissionRejected, PRIORITY_MISS, PRIORITY_REFRESH
+from utils.metrics import metrics
+from utils.profiling import ProfileStore, ProfilingMiddleware
+from utils.precompute import PrecomputeScheduler
+from utils.model_store import ModelStore
+from utils.backtest import BacktestStore, run_backtest
+from utils.indicators import (
+    compute_indicator_matrix,
+    latest_indicators_from_matrix,
+    format_indicator_matrix_for_chart,
+    parse_indicators,
+    selection_key
+)
 
 # 設定日誌
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Stock Insight API", version="1.0.0")
+# 暖機：啟動後預先載入 Prophet 與 yfinance，並在每個 CPU worker 以小型資料訓練一次，完成前 /health 回傳 503
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "false").lower() == "true"
+CPU_ENGINES = [name for name, engine in ENGINES.items() if engine.cpu_bound]
+IO_ENGINES = [name for name, engine in ENGINES.items() if not engine.cpu_bound]
+
+# 背景執行器（I/O thread pool 與 Prophet process pool）；啟用暖機時重建的 worker 也會先暖機
+executors = ExecutorManager(
+    cpu_initializer=warm_up if WARMUP_ENABLED else None,
+    cpu_initargs=(CPU_ENGINES,)
+)
+
+# worker 是否可以接收流量（未啟用暖機時一開始就是 ready）
+readiness = {"ready": not WARMUP_ENABLED, "warm_up_seconds": None}
+
+
+async def warm_up_workers():
+    """預先載入資料來源與預測引擎的依賴，完成（或失敗）後將 worker 標記為 ready"""
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(
+            executors.run_io(ohlcv_store.source.warm_up),
+            executors.run_io(warm_up, IO_ENGINES),
+            executors.run_cpu_all(warm_up, CPU_ENGINES),
+        )
+    except Exception as e:
+        # 暖機只是避免第一個請求變慢，失敗時仍然接收流量
+        logger.error(f"Error warming up workers: {str(e)}")
+    readiness["warm_up_seconds"] = round(time.perf_counter() - started, 3)
+    readiness["ready"] = True
+    logger.info(f"Worker ready after {readiness['warm_up_seconds']}s warm-up")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    cache_manager.start_sweeper(CACHE_SWEEP_INTERVAL)
+    warm_up_task = asyncio.create_task(warm_up_workers()) if WARMUP_ENABLED else None
+    precompute_task = None
+    if PRECOMPUTE_ENABLED:
+        precompute_task = asyncio.create_task(precompute_scheduler.run_forever())
+    yield
+    if precompute_task is not None:
+        precompute_task.cancel()
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    cache_manager.close()
+    model_store.close()
+    ohlcv_store.close()
+    backtest_store.close()
+    executors.shutdown()
+
+
+app = FastAPI(title="Stock Insight API", version="1.0.0", lifespan=lifespan)
 
 # CORS 設定
 app.add_middleware(
@@ -24,10 +117,892 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Age", "X-Profile-Id"],
 )
 
+# 效能指標：啟用後記錄各階段與各端點的延遲，並由 /metrics 以 Prometheus 格式輸出
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+metrics.enable(METRICS_ENABLED)
+
+if METRICS_ENABLED:
+    @app.middleware("http")
+    async def record_request_latency(request: Request, call_next):
+        """記錄每個端點的延遲（以路由樣板分組，串流回應只計到開始輸出為止）"""
+        started = time.perf_counter()
+        response = await call_next(request)
+        route = request.scope.get("route")
+        endpoint = route.path if route is not None else "unmatched"
+        metrics.observe_request(request.method, endpoint, response.status_code, time.perf_counter() - started)
+        return response
+
+# 請求剖析：管理員可以 X-Profile: 1 標頭或 ?_profile=1 剖析單一請求，
+# PROFILE_SAMPLE_RATE > 0 時另依比例抽樣，保留每小時最慢的 PROFILE_SLOWEST_N 個請求
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+# 不檢查管理員身分，任何人都可以觸發單次剖析（僅供本機開發使用）
+PROFILING_OPEN = os.getenv("PROFILING_OPEN", "false").lower() == "true"
+
+
+def profiling_authorized(headers: dict) -> bool:
+    """請求是否可以觸發單次剖析（Bearer token 需具有管理員角色）"""
+    if PROFILING_OPEN:
+        return True
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        return get_current_user(decode_token(token))["is_admin"]
+    except HTTPException:
+        return False
+
+
+if PROFILING_ENABLED:
+    app.add_middleware(
+        ProfilingMiddleware,
+        store=ProfileStore(
+            os.getenv("PROFILE_DIR", "profiles"),
+            slowest_n=int(os.getenv("PROFILE_SLOWEST_N", "10"))
+        ),
+        authorize=profiling_authorized,
+        sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+        interval=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+    )
+
+# Stale-while-revalidate：過期未超過 STALE_MAX_SECONDS 的結果先回傳，並在背景重新計算
+STALE_WHILE_REVALIDATE = os.getenv("STALE_WHILE_REVALIDATE", "false").lower() == "true"
+STALE_MAX_SECONDS = float(os.getenv("STALE_MAX_SECONDS", "21600")) if STALE_WHILE_REVALIDATE else 0
+
 # 初始化快取管理器
-cache_manager = CacheManager()
+CACHE_SWEEP_INTERVAL = float(os.getenv("CACHE_SWEEP_INTERVAL", "300"))
+cache_manager = CacheManager(
+    pool_size=int(os.getenv("CACHE_POOL_SIZE", "4")),
+    max_rows=int(os.getenv("CACHE_MAX_ROWS", "5000")) or None,
+    max_bytes=int(os.getenv("CACHE_MAX_BYTES", str(256 * 1024 * 1024))) or None,
+    intraday_ttl_seconds=float(os.getenv("CACHE_INTRADAY_TTL", "3600")),
+    max_stale_seconds=STALE_MAX_SECONDS,
+)
+
+# 行程內的回應快取，熱門股票直接回傳已編碼的 bytes
+response_cache = ResponseCache(
+    max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    max_ttl=float(os.getenv("RESPONSE_CACHE_MAX_TTL", "60")) or None,
+)
+
+# 已訓練模型儲存：每個股票每根新 K 棒只訓練一次，較短的天數直接切片
+model_store = ModelStore()
+MAX_FORECAST_DAYS = int(os.getenv("MAX_FORECAST_DAYS", "30"))
+
+# 未指定 ?model= 時使用的預測模型（prophet、holt_winters、drift、ar）
+DEFAULT_FORECAST_ENGINE = get_engine(os.getenv("FORECAST_ENGINE", "prophet")).name
+
+# Prophet 訓練設定檔（accurate、balanced、fast）
+PROPHET_PROFILE = os.getenv("PROPHET_PROFILE", "balanced")
+if PROPHET_PROFILE not in PROPHET_PROFILES:
+    raise ValueError(f"Unknown PROPHET_PROFILE: {PROPHET_PROFILE}")
+
+# 預測請求合併（行程內 single-flight + 跨 worker 租約）
+prediction_flights = SingleFlight("prediction")
+model_flights = SingleFlight("model")
+PREDICTION_LEASE_TTL = float(os.getenv("PREDICTION_LEASE_TTL", "180"))
+PREDICTION_LEASE_POLL_INTERVAL = float(os.getenv("PREDICTION_LEASE_POLL_INTERVAL", "0.5"))
+
+# 收盤後的預測預先計算
+PRECOMPUTE_ENABLED = os.getenv("PRECOMPUTE_ENABLED", "false").lower() == "true"
+PRECOMPUTE_SYMBOLS = [s.strip() for s in os.getenv("PRECOMPUTE_SYMBOLS", "").split(",") if s.strip()]
+PRECOMPUTE_DAYS = [int(d) for d in os.getenv("PRECOMPUTE_DAYS", "7").split(",") if d.strip()]
+PRECOMPUTE_TOP_N = int(os.getenv("PRECOMPUTE_TOP_N", "20"))
+
+# 預測的准入控制：同時進行的計算數（全域與每個使用者）與每個使用者 force_refresh 的頻率，
+# 超過時排隊，佇列已滿或等待逾時回傳 429；MAX_CONCURRENT_FITS=0 停用
+admission = AdmissionController(
+    max_concurrent=int(os.getenv("MAX_CONCURRENT_FITS", str(executors.cpu.max_workers))),
+    per_user=int(os.getenv("PER_USER_MAX_FITS", "2")),
+    queue_size=int(os.getenv("ADMISSION_QUEUE_SIZE", "32")),
+    max_wait=float(os.getenv("ADMISSION_MAX_WAIT", "30")),
+    refresh_rate=float(os.getenv("REFRESH_RATE_PER_MINUTE", "6")) / 60,
+    refresh_burst=float(os.getenv("REFRESH_BURST", "3"))
+)
+
+# 回測：checkpoint 與模型儲存共用 cache.db；每次最多 BACKTEST_MAX_ORIGINS 個起點，
+# 每 BACKTEST_CHUNK_SIZE 個起點一組在 CPU 執行池中訓練，最多同時 BACKTEST_CONCURRENCY 組（0 表示 CPU worker 數）
+backtest_store = BacktestStore()
+BACKTEST_MAX_ORIGINS = int(os.getenv("BACKTEST_MAX_ORIGINS", "500"))
+BACKTEST_CHUNK_SIZE = int(os.getenv("BACKTEST_CHUNK_SIZE", "8"))
+BACKTEST_CONCURRENCY = int(os.getenv("BACKTEST_CONCURRENCY", "0")) or executors.cpu.max_workers
+
+# 批次預測單次請求的上限
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+
+# 串流預測等待模型訓練時輸出 heartbeat 的間隔秒數
+PREDICT_STREAM_HEARTBEAT = float(os.getenv("PREDICT_STREAM_HEARTBEAT", "5"))
+
+
+class BatchPredictItem(BaseModel):
+    """批次預測的單一項目"""
+    symbol: str
+    days: int = 7
+
+
+class BatchPredictRequest(BaseModel):
+    """批次預測請求：symbols 皆使用 days 天數，items 可個別指定天數"""
+    symbols: List[str] = []
+    days: int = 7
+    items: List[BatchPredictItem] = []
+    model: Optional[str] = None
+
+
+# 本機 OHLCV 資料庫，只向資料來源補抓缺少的尾端資料
+ohlcv_store = OHLCVStore(
+    create_data_source(),
+    db_path=os.getenv("OHLCV_DB_PATH", "ohlcv.db"),
+    refresh_seconds=float(os.getenv("OHLCV_REFRESH_SECONDS", "300")),
+    max_stale_seconds=STALE_MAX_SECONDS
+)
+
+
+def build_history_body(
+    symbol: str,
+    range: str,
+    df: pd.DataFrame,
+    format: str,
+    stale: bool = False,
+    selection: Optional[list] = None,
+    interval: str = "1d",
+    max_points: Optional[int] = None,
+    method: str = "ohlc"
+) -> bytes:
+    """
+    計算選取的技術指標並將 /history 回應編碼為 JSON bytes（stale 時加上 stale 欄位）
+
+    日 K 先依 interval 合併為週 K 或月 K，技術指標在合併後的解析度上計算，
+    超過 max_points 時再縮減點數；指定 interval 或 max_points 時回應加上實際的 interval 與點數
+    """
+    source_points = len(df)
+    resolved_interval = resolve_interval(df.index, interval, max_points)
+    with metrics.timer("downsample"):
+        df = resample_bars(df, resolved_interval)
+    
+    with metrics.timer("indicators"):
+        matrix, columns = compute_indicator_matrix(df, selection)
+        latest_indicators = latest_indicators_from_matrix(matrix, columns)
+    
+    with metrics.timer("downsample"):
+        df, matrix = downsample(df, matrix, max_points, method)
+    
+    with metrics.timer("format"):
+        if format == "columnar":
+            history_data = history_columns(df)
+            indicators_data = indicator_columns(df.index, matrix, columns)
+        else:
+            history_data = history_records(df)
+            indicators_data = format_indicator_matrix_for_chart(df, matrix, columns)
+    
+    payload = {
+        "symbol": symbol,
+        "range": range,
+        "data": history_data,
+        "indicators": indicators_data,
+        "latest_indicators": latest_indicators
+    }
+    if interval != "1d" or max_points is not None:
+        payload["interval"] = resolved_interval
+        payload["points"] = len(df)
+        payload["source_points"] = source_points
+    if stale:
+        payload["stale"] = True
+    with metrics.timer("encode"):
+        return encode_json(payload)
+
+
+def encode_prediction(result: dict, format: str) -> bytes:
+    """將預測結果編碼為 JSON bytes"""
+    with metrics.timer("encode"):
+        if format == "columnar":
+            result = payload_to_columns(result)
+        return encode_json(result)
+
+
+# 預測需要驗證，只允許瀏覽器私有快取；兩者都要求每次以 ETag 重新驗證
+PREDICT_CACHE_CONTROL = "private, no-cache"
+HISTORY_CACHE_CONTROL = "no-cache"
+# 過期的預測結果：背景重新計算期間可繼續使用，期限與伺服器端的 STALE_MAX_SECONDS 相同
+STALE_PREDICT_CACHE_CONTROL = f"{PREDICT_CACHE_CONTROL}, stale-while-revalidate={int(STALE_MAX_SECONDS)}"
+
+
+def prediction_etag(symbol: str, days: int, model: str, format: str, entry: CacheEntry, indicators: str = "") -> str:
+    """預測回應的 ETag：快取項目的識別碼與產生時間在每次重新預測（含新 K 棒）時都會改變"""
+    return make_etag("predict", symbol, days, model, format, indicators, entry.id, entry.created_at.isoformat())
+
+
+def history_etag(
+    symbol: str,
+    range: str,
+    format: str,
+    start,
+    version: str,
+    indicators: str = "",
+    sampling: tuple = ()
+) -> str:
+    """歷史資料回應的 ETag：由期間起始日與本機 K 棒版本（最後一根 K 棒的時間與數值）組成"""
+    return make_etag("history", symbol, range, format, indicators, *sampling, start, version)
+
+
+def prediction_response(
+    symbol: str,
+    days: int,
+    model: str,
+    format: str,
+    result: dict,
+    entry: Optional[CacheEntry],
+    indicators: str = ""
+) -> Response:
+    """
+    編碼預測結果，並在 SQLite 快取的有效期限內保留於行程內回應快取
+
+    indicators 為選取的技術指標（selection_key），不同選取分別快取
+    """
+    body = encode_prediction(result, format)
+    headers = {"Cache-Control": PREDICT_CACHE_CONTROL}
+    if entry is not None:
+        etag = prediction_etag(symbol, days, model, format, entry, indicators)
+        headers["ETag"] = etag
+        response_cache.put((symbol, days, model, format, indicators), body, entry.expires_at, etag)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def sync_history(symbol: str, range: str, allow_stale: bool) -> tuple:
+    """
+    同步本機 OHLCV 資料（不讀取 K 棒）
+
+    Returns:
+        (期間起始日期, 本機資料版本, stale 資料的經過秒數)
+    """
+    age = ohlcv_store.refresh(symbol, range, allow_stale)
+    start = period_start(range)
+    return start, ohlcv_store.version(symbol, start), age
+
+
+def load_latest_indicators(symbol: str, allow_stale: bool) -> tuple:
+    """
+    同步本機 OHLCV 資料並取得串流指標狀態的最新數值
+
+    Returns:
+        (本機全部資料的版本, {'last_update', 'latest_indicators'}, stale 資料的經過秒數)
+    """
+    age = ohlcv_store.refresh(symbol, "6mo", allow_stale)
+    return ohlcv_store.version(symbol), ohlcv_store.latest_indicators(symbol), age
+
+
+def build_history_response(
+    symbol: str,
+    range: str,
+    start,
+    format: str,
+    stale: bool,
+    selection: Optional[list] = None,
+    interval: str = "1d",
+    max_points: Optional[int] = None,
+    method: str = "ohlc"
+) -> bytes:
+    """讀取本機 K 棒並編碼 /history 回應"""
+    df = ohlcv_store.read_range(symbol, start)
+    return build_history_body(symbol, range, df, format, stale, selection, interval, max_points, method)
+
+
+def revalidate_prediction(symbol: str, days: int, model: str):
+    """在背景重新計算已過期的預測（相同的預測同時只有一個重新計算工作）"""
+    if prediction_flights.spawn((symbol, days, model), lambda: lead_prediction(symbol, days, model)):
+        logger.info(f"Serving stale prediction for {symbol} ({days} days), revalidating in background")
+
+
+def stale_prediction_response(
+    symbol: str,
+    days: int,
+    model: str,
+    format: str,
+    entry: CacheEntry,
+    data: Optional[dict] = None,
+    indicators: str = ""
+) -> Response:
+    """
+    回傳已過期的快取結果（標記 stale 並附上 Age），同時在背景重新計算
+
+    與新鮮的回應相同帶有 ETag 與 private 的 Cache-Control（另加上 stale-while-revalidate），
+    重新計算完成前客戶端仍可以 ETag 重新驗證；data 為替換過技術指標的結果（未指定時使用快取內容）
+    """
+    revalidate_prediction(symbol, days, model)
+    body = encode_prediction({**(data or entry.data), "stale": True}, format)
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers={
+            "ETag": prediction_etag(symbol, days, model, format, entry, indicators),
+            "Cache-Control": STALE_PREDICT_CACHE_CONTROL,
+            "Age": str(entry.age_seconds()),
+        }
+    )
+
+
+def build_indicator_payload(df: pd.DataFrame, selection: Optional[list] = None) -> tuple:
+    """計算選取的技術指標並格式化為圖表資料與最新數值（兩者共用同一份指標矩陣）"""
+    with metrics.timer("indicators"):
+        matrix, columns = compute_indicator_matrix(df, selection)
+        latest_indicators = latest_indicators_from_matrix(matrix, columns)
+    with metrics.timer("format"):
+        indicators_data = format_indicator_matrix_for_chart(df, matrix, columns)
+    return indicators_data, latest_indicators
+
+
+def executor_error_to_http(e: Exception) -> HTTPException:
+    """將執行器的例外轉換為對應的 HTTP 錯誤"""
+    if isinstance(e, ExecutorBusyError):
+        return HTTPException(status_code=503, detail="伺服器忙碌中，請稍後再試")
+    if isinstance(e, TaskTimeoutError):
+        return HTTPException(status_code=504, detail="處理逾時，請稍後再試")
+    return HTTPException(status_code=499, detail="客戶端已中斷連線")
+
+
+def admission_error_to_http(e: AdmissionRejected) -> HTTPException:
+    """將准入控制的拒絕轉換為 429"""
+    return HTTPException(status_code=429, detail=e.reason, headers={"Retry-After": str(e.retry_after)})
+
+
+def resolve_model(model: Optional[str]) -> str:
+    """取得請求指定的預測模型（未指定時使用部署預設值）"""
+    if model is None:
+        return DEFAULT_FORECAST_ENGINE
+    if model not in ENGINES:
+        raise HTTPException(status_code=400, detail=f"不支援的預測模型: {model}（可用：{', '.join(ENGINES)}）")
+    return model
+
+
+def validate_days(days: int):
+    """檢查預測天數（1 到 MAX_FORECAST_DAYS 天），超出範圍時回傳 400"""
+    if not 1 <= days <= MAX_FORECAST_DAYS:
+        raise HTTPException(status_code=400, detail=f"預測天數必須介於 1 與 {MAX_FORECAST_DAYS} 之間")
+
+
+def resolve_indicators(indicators: Optional[str]) -> Optional[list]:
+    """解析請求的 ?indicators=（未指定時返回 None，表示全部指標）"""
+    try:
+        return parse_indicators(indicators)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def fit_and_store_model(
+    symbol: str,
+    model: str,
+    last_bar: str,
+    horizon: int,
+    prophet_df: pd.DataFrame
+) -> list:
+    """
+    訓練模型（Prophet 在 process pool，輕量模型在 thread pool），預測到 horizon 天並存入模型儲存
+    
+    支援 warm start 的模型以同一股票上一次訓練的參數作為起點
+    """
+    engine = get_engine(model)
+    previous = model_store.get_model(symbol, model) if engine.warm_start else None
+    previous_model = previous["model"] if previous else None
+    run = executors.run_cpu if engine.cpu_bound else executors.run_io
+    with metrics.timer("fit_total"):
+        fitted = await run(fit_forecast, model, prophet_df, horizon, previous_model, profile=PROPHET_PROFILE)
+    # 訓練在執行池中進行，由回傳的時間記錄實際的訓練與預測時間（fit_total 另含排隊與傳輸時間）
+    for stage, seconds in fitted.get("timings", {}).items():
+        metrics.observe_stage(stage, seconds)
+    model_store.save(symbol, last_bar, horizon, fitted["predictions"], fitted["model"], engine=model)
+    return fitted["predictions"]
+
+
+HISTORY_SECTION_KEYS = ("current_price", "last_update", "historical", "indicators", "latest_indicators")
+
+
+def build_history_section(df: pd.DataFrame, selection: Optional[list] = None) -> dict:
+    """預測回應中不需要模型的部分：目前價格、最近 30 天歷史資料與技術指標"""
+    indicators_data, latest_indicators = build_indicator_payload(df, selection)
+
+    # 取得歷史資料（最近 30 天）
+    recent_df = df.tail(30)
+    historical_data = [
+        {"date": date, "actual": close, "type": "historical"}
+        for date, close in zip(
+            recent_df.index.strftime("%Y-%m-%d"),
+            np.round(recent_df['Close'].to_numpy(dtype=float), 2).tolist()
+        )
+    ]
+
+    return {
+        "current_price": round(float(df['Close'].iloc[-1]), 2),
+        "last_update": df.index[-1].strftime("%Y-%m-%d"),
+        "historical": historical_data,
+        "indicators": indicators_data,
+        "latest_indicators": latest_indicators
+    }
+
+
+async def load_history_section(
+    symbol: str,
+    request: Optional[Request] = None,
+    selection: Optional[list] = None
+) -> tuple:
+    """取得最近六個月的股價資料並計算歷史與選取的指標部分，返回 (DataFrame, section)"""
+    with metrics.timer("history_load"):
+        df = await executors.run_io(ohlcv_store.get_history, symbol, "6mo", request=request)
+
+    if df.empty:
+        raise HTTPException(status_code=404, detail=f"找不到股票代號 {symbol} 的資料")
+
+    section = await executors.run_io(build_history_section, df, selection, request=request)
+    return df, section
+
+
+def select_prediction_indicators(symbol: str, result: dict, selection: list) -> dict:
+    """
+    以選取的技術指標取代預測結果中的指標部分
+
+    預測結果快取的是全部指標；選取時改以本機 K 棒（截至預測的最後一根 K 棒）重新計算，
+    只計算選取的指標與它們依賴的中間結果，不會向資料來源下載
+    """
+    last_update = date.fromisoformat(result["last_update"])
+    df = ohlcv_store.read_range(symbol, period_start("6mo"), last_update)
+    if df.empty:
+        return result
+    indicators_data, latest_indicators = build_indicator_payload(df, selection)
+    return {**result, "indicators": indicators_data, "latest_indicators": latest_indicators}
+
+
+async def selected_prediction(symbol: str, result: dict, selection: Optional[list], request: Optional[Request] = None) -> dict:
+    """套用請求的 ?indicators= 到預測結果（未指定時原樣返回）"""
+    if selection is None:
+        return result
+    return await executors.run_io(select_prediction_indicators, symbol, result, selection, request=request)
+
+
+async def compute_prediction(symbol: str, days: int, model: str, refit: bool = False) -> dict:
+    """
+    下載資料、計算指標並訓練模型，產生完整的預測結果
+    
+    Args:
+        symbol: 股票代號
+        days: 預測天數
+        model: 預測模型
+        refit: 是否忽略已訓練的模型並重新訓練
+    """
+    df, section = await load_history_section(symbol)
+
+    # 準備 Prophet 資料格式（移除時區資訊）
+    prophet_df = pd.DataFrame({
+        'ds': df.index.tz_localize(None),
+        'y': df['Close'].values
+    })
+
+    # 相同最後 K 棒的模型只訓練一次，任意天數從最長預測切片
+    last_bar = df.index[-1].strftime("%Y-%m-%d")
+    prediction_data = None if refit else model_store.get_forecast(symbol, last_bar, days, engine=model)
+    if prediction_data is None:
+        horizon = MAX_FORECAST_DAYS
+        forecast = await model_flights.do(
+            (symbol, model, last_bar, horizon),
+            lambda: fit_and_store_model(symbol, model, last_bar, horizon, prophet_df)
+        )
+        prediction_data = forecast[:days]
+
+    taipei_tz = pytz.timezone('Asia/Taipei')
+    result = {
+        "symbol": symbol,
+        "days": days,
+        "model": model,
+        "current_price": section["current_price"],
+        "last_update": section["last_update"],
+        "historical": section["historical"],
+        "predictions": prediction_data,
+        "indicators": section["indicators"],
+        "latest_indicators": section["latest_indicators"],
+        "timestamp": datetime.now(taipei_tz).isoformat()
+    }
+
+    # Debug: 檢查 indicators_data 是否正確格式化
+    if section["indicators"]:
+        logger.info(f"Indicators data sample: {section['indicators'][0]}")
+    else:
+        logger.warning("Indicators data is empty!")
+
+    return result
+
+
+async def lead_prediction(symbol: str, days: int, model: str, refit: bool = False) -> dict:
+    """
+    以 leader 身分產生預測結果
+    
+    先取得 SQLite 中的跨行程租約；若其他 worker 正在訓練相同的模型，
+    則輪詢快取等待其結果，租約過期（持有者異常結束）時再自行接手
+    """
+    owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+    waited = False
+    
+    while True:
+        if cache_manager.acquire_lease(symbol, days, owner, PREDICTION_LEASE_TTL, model):
+            try:
+                result = await compute_prediction(symbol, days, model, refit)
+                cache_manager.save_prediction(symbol, days, result, model)
+                return result
+            finally:
+                cache_manager.release_lease(symbol, days, owner, model)
+        
+        if not waited:
+            waited = True
+            prediction_flights.record("coalesced_remote")
+            logger.info(f"Waiting for another worker to predict {symbol} ({days} days, {model})")
+        
+        await asyncio.sleep(PREDICTION_LEASE_POLL_INTERVAL)
+        
+        # 其他 worker 剛產生的結果即為最新結果（force_refresh 的請求也可直接使用）
+        cached_result = cache_manager.get_prediction(symbol, days, model)
+        if cached_result:
+            return cached_result
+
+
+async def load_prediction(
+    symbol: str,
+    days: int,
+    request: Optional[Request] = None,
+    refit: bool = False,
+    model: Optional[str] = None
+) -> dict:
+    """取得預測結果，相同 (symbol, days, model) 的並行請求共用同一次訓練"""
+    model = model or DEFAULT_FORECAST_ENGINE
+    return await prediction_flights.do(
+        (symbol, days, model),
+        lambda: lead_prediction(symbol, days, model, refit),
+        request=request
+    )
+
+
+async def admitted_prediction(
+    user_id: str,
+    symbol: str,
+    days: int,
+    request: Optional[Request] = None,
+    refit: bool = False,
+    model: Optional[str] = None
+) -> dict:
+    """
+    經過准入控制取得預測結果（只在快取未命中時呼叫）
+
+    加入其他請求進行中的相同預測不會增加計算量，不需要名額；
+    預先計算排程直接呼叫 load_prediction，不受使用者的准入限制
+    """
+    model = model or DEFAULT_FORECAST_ENGINE
+    if (symbol, days, model) in prediction_flights:
+        return await load_prediction(symbol, days, request, refit=refit, model=model)
+    async with admission.slot(user_id, PRIORITY_REFRESH if refit else PRIORITY_MISS):
+        return await load_prediction(symbol, days, request, refit=refit, model=model)
+
+
+async def backtest_symbol(
+    symbol: str,
+    model: str,
+    range: str,
+    window: str,
+    horizon: int,
+    step: int,
+    resume: bool = True,
+    user_id: Optional[str] = None,
+    request: Optional[Request] = None
+) -> dict:
+    """
+    以本機 OHLCV 資料執行 walk-forward 回測
+
+    每組起點佔用一個准入名額（與 force_refresh 相同的優先順序，不會排在一般預測之前），
+    同時執行的組數不超過使用者的上限；user_id 為 None 時（CLI）不經過准入控制
+    """
+    with metrics.timer("history_load"):
+        df = await executors.run_io(ohlcv_store.get_history, symbol, range, request=request)
+    if df.empty:
+        raise HTTPException(status_code=404, detail=f"找不到股票代號 {symbol} 的資料")
+
+    run = executors.run_cpu if get_engine(model).cpu_bound else executors.run_io
+    concurrency = BACKTEST_CONCURRENCY
+    if user_id is not None and admission.enabled and admission.per_user > 0:
+        concurrency = min(concurrency, admission.per_user)
+
+    async def submit(fn, *args, **kwargs):
+        if user_id is None:
+            return await run(fn, *args, request=request, **kwargs)
+        async with admission.slot(user_id, PRIORITY_REFRESH):
+            return await run(fn, *args, request=request, **kwargs)
+
+    with metrics.timer("backtest"):
+        return await run_backtest(
+            symbol, df, model, window, horizon, step, submit, backtest_store,
+            concurrency=concurrency,
+            chunk_size=BACKTEST_CHUNK_SIZE,
+            resume=resume,
+            max_origins=BACKTEST_MAX_ORIGINS,
+            profile=PROPHET_PROFILE
+        )
+
+
+def create_precompute_scheduler(
+    symbols: Optional[List[str]] = None,
+    days: Optional[List[int]] = None,
+    top_n: Optional[int] = None
+) -> PrecomputeScheduler:
+    """建立預先計算排程（未指定的參數使用環境變數設定）"""
+    return PrecomputeScheduler(
+        cache_manager,
+        warm_history=lambda symbols: executors.run_io(ohlcv_store.get_history_many, symbols, "6mo"),
+        warm_prediction=load_prediction,
+        symbols=PRECOMPUTE_SYMBOLS if symbols is None else symbols,
+        days=PRECOMPUTE_DAYS if days is None else days,
+        top_n=PRECOMPUTE_TOP_N if top_n is None else top_n,
+        concurrency=executors.cpu.max_workers,
+        model=DEFAULT_FORECAST_ENGINE
+    )
+
+
+precompute_scheduler = create_precompute_scheduler()
+
+
+def register_metric_callbacks():
+    """登錄 /metrics 輸出時才讀取的即時數值"""
+    metrics.register_callback(
+        "executor_pending",
+        "Tasks running or queued in each executor pool",
+        lambda: {(name,): pool["pending"] for name, pool in executors.stats().items()},
+        ("pool",)
+    )
+    metrics.register_callback(
+        "executor_queued",
+        "Tasks waiting for a free worker in each executor pool",
+        lambda: {(name,): pool["queued"] for name, pool in executors.stats().items()},
+        ("pool",)
+    )
+    metrics.register_callback(
+        "fits_in_flight",
+        "Model fits currently running in this worker",
+        lambda: {(): model_flights.in_flight()}
+    )
+    metrics.register_callback(
+        "predictions_in_flight",
+        "Prediction requests currently being computed in this worker",
+        lambda: {(): prediction_flights.in_flight()}
+    )
+    metrics.register_callback(
+        "admission_active",
+        "Prediction computations holding an admission slot",
+        lambda: {(): admission.active}
+    )
+    metrics.register_callback(
+        "admission_queued",
+        "Prediction requests waiting for an admission slot",
+        lambda: {(): admission.queued}
+    )
+    metrics.register_callback(
+        "admission_requests_total",
+        "Admission decisions by result",
+        lambda: {(name,): value for name, value in admission.counters.items()},
+        ("result",),
+        type="counter"
+    )
+    metrics.register_callback(
+        "response_cache_requests_total",
+        "In-process response cache lookups by result",
+        lambda: {
+            ("hit",): response_cache.counters["hits"],
+            ("miss",): response_cache.counters["misses"],
+        },
+        ("result",),
+        type="counter"
+    )
+    metrics.register_callback(
+        "cache_hit_ratio",
+        "Share of cache lookups served from cache (stale included for the prediction cache)",
+        lambda: {
+            ("prediction",): cache_hit_ratio(),
+            ("response",): response_cache.stats()["hit_rate"],
+        },
+        ("cache",)
+    )
+
+
+def cache_hit_ratio() -> Optional[float]:
+    """SQLite 預測快取的命中比例（尚無查詢時為 None）"""
+    counts = {labels[1]: value for labels, value in metrics.cache_requests.snapshot().items() if labels[0] == "prediction"}
+    lookups = sum(counts.values())
+    if not lookups:
+        return None
+    return round((counts.get("hit", 0) + counts.get("stale", 0)) / lookups, 4)
+
+
+if METRICS_ENABLED:
+    register_metric_callbacks()
+
+
+def error_to_http(e: Exception) -> HTTPException:
+    """將預測過程中的例外轉換為 HTTP 錯誤"""
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, AdmissionRejected):
+        return admission_error_to_http(e)
+    if isinstance(e, (ExecutorBusyError, TaskTimeoutError, ClientDisconnectedError)):
+        return executor_error_to_http(e)
+    return HTTPException(status_code=500, detail=f"預測時發生錯誤: {str(e)}")
+
+
+def batch_line(symbol: str, days: int, result: dict = None, error: Exception = None, cached: bool = False) -> bytes:
+    """批次預測的單行 NDJSON 結果"""
+    if error is not None:
+        http_error = error_to_http(error)
+        line = {
+            "symbol": symbol,
+            "days": days,
+            "status": "error",
+            "status_code": http_error.status_code,
+            "detail": http_error.detail
+        }
+        if isinstance(error, AdmissionRejected):
+            line["retry_after"] = error.retry_after
+    else:
+        line = {"symbol": symbol, "days": days, "status": "ok", "cached": cached, "result": result}
+    return encode_json(line) + b"\n"
+
+
+def batch_concurrency() -> int:
+    """批次預測同時進行的項目數：不超過 CPU worker 數與每個使用者的准入上限"""
+    limit = executors.cpu.max_workers
+    if admission.enabled and admission.per_user > 0:
+        limit = min(limit, admission.per_user)
+    return limit
+
+
+async def stream_batch_predictions(items: list, model: str, user_id: str):
+    """
+    依完成順序逐行輸出批次預測結果
+    
+    快取命中的項目立即輸出；未命中的股票先一次批次下載資料，
+    再經過准入控制分散到執行池並行訓練，單一股票失敗不影響其他項目
+    """
+    ok_count = 0
+    error_count = 0
+    misses = []
+    
+    for symbol, days in items:
+        cached_result = cache_manager.get_prediction(symbol, days, model)
+        if cached_result:
+            ok_count += 1
+            yield batch_line(symbol, days, result=cached_result, cached=True)
+        else:
+            misses.append((symbol, days))
+    
+    if misses:
+        # 一次批次下載所有未命中股票的資料，之後的個別預測直接讀取本機資料
+        try:
+            await executors.run_io(ohlcv_store.get_history_many, [symbol for symbol, _ in misses], "6mo")
+        except Exception as e:
+            logger.warning(f"Bulk download for batch prediction failed: {str(e)}")
+        
+        # 同時進行的預測數不超過 CPU worker 數與使用者的准入上限，避免塞滿執行池的佇列
+        limit = asyncio.Semaphore(batch_concurrency())
+        
+        async def run(symbol: str, days: int):
+            async with limit:
+                try:
+                    return symbol, days, await admitted_prediction(user_id, symbol, days, model=model), None
+                except Exception as e:
+                    return symbol, days, None, e
+        
+        tasks = [asyncio.ensure_future(run(symbol, days)) for symbol, days in misses]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                symbol, days, result, error = await next_done
+                if error is None:
+                    ok_count += 1
+                else:
+                    error_count += 1
+                    logger.warning(f"Batch prediction for {symbol} failed: {str(error)}")
+                yield batch_line(symbol, days, result=result, error=error)
+        finally:
+            # 客戶端中斷連線時取消尚未完成的預測
+            for task in tasks:
+                task.cancel()
+    
+    yield encode_json({"status": "done", "ok": ok_count, "errors": error_count}) + b"\n"
+
+
+def stream_event(event: str, **fields) -> bytes:
+    """串流預測的單行 NDJSON 事件"""
+    return encode_json({"event": event, **fields}) + b"\n"
+
+
+def stream_error(e: Exception) -> bytes:
+    """串流預測的錯誤事件"""
+    http_error = error_to_http(e)
+    fields = {"retry_after": e.retry_after} if isinstance(e, AdmissionRejected) else {}
+    return stream_event("error", status_code=http_error.status_code, detail=http_error.detail, **fields)
+
+
+async def stream_prediction(
+    symbol: str,
+    days: int,
+    model: str,
+    request: Request,
+    user_id: str,
+    selection: Optional[list] = None
+):
+    """
+    逐步輸出預測結果
+    
+    事件順序：history（目前價格、歷史資料與技術指標，取得資料後立即輸出）→
+    heartbeat（等待模型訓練時定期輸出）→ predictions → done；任一步驟失敗時輸出 error 並結束
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    
+    cached_result = cache_manager.get_prediction(symbol, days, model)
+    if cached_result:
+        try:
+            cached_result = await selected_prediction(symbol, cached_result, selection, request)
+        except Exception as e:
+            yield stream_error(e)
+            return
+        yield stream_event(
+            "history",
+            symbol=symbol,
+            days=days,
+            model=model,
+            **{key: cached_result[key] for key in HISTORY_SECTION_KEYS}
+        )
+        yield stream_event("predictions", predictions=cached_result["predictions"], timestamp=cached_result["timestamp"])
+        yield stream_event("done", cached=True, elapsed=round(loop.time() - started, 3))
+        return
+    
+    try:
+        _, section = await load_history_section(symbol, request, selection)
+    except Exception as e:
+        yield stream_error(e)
+        return
+    
+    yield stream_event("history", symbol=symbol, days=days, model=model, **section)
+    
+    # 與 /predict 共用同一次訓練，等待期間定期輸出 heartbeat 讓連線保持活躍
+    task = asyncio.ensure_future(admitted_prediction(user_id, symbol, days, request, model=model))
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=PREDICT_STREAM_HEARTBEAT)
+            if done:
+                break
+            yield stream_event("heartbeat", elapsed=round(loop.time() - started, 1))
+        result = task.result()
+    except Exception as e:
+        yield stream_error(e)
+        return
+    finally:
+        if not task.done():
+            task.cancel()
+    
+    yield stream_event("predictions", predictions=result["predictions"], timestamp=result["timestamp"])
+    yield stream_event("done", cached=False, elapsed=round(loop.time() - started, 3))
 
 
 @app.get("/")
@@ -44,68 +1019,163 @@ async def root():
 
 
 @app.get("/health")
-async def health_check():
-    """健康檢查端點"""
+async def health_check(response: Response):
+    """健康檢查端點（暖機完成前回傳 503，讓負載平衡器暫不導入流量）"""
     taipei_tz = pytz.timezone('Asia/Taipei')
-    return {"status": "healthy", "timestamp": datetime.now(taipei_tz).isoformat()}
+    if not readiness["ready"]:
+        response.status_code = 503
+    return {
+        "status": "healthy" if readiness["ready"] else "warming_up",
+        "timestamp": datetime.now(taipei_tz).isoformat(),
+        "warm_up_seconds": readiness["warm_up_seconds"],
+        "executors": executors.stats()
+    }
+
+
+@app.get("/stats")
+async def get_stats():
+    """執行器、請求合併與快取的統計資訊"""
+    return {
+        "executors": executors.stats(),
+        "prediction_flights": prediction_flights.stats(),
+        "model_flights": model_flights.stats(),
+        "cache": cache_manager.stats,
+        "response_cache": response_cache.stats(),
+        "admission": admission.stats(),
+        "precompute": precompute_scheduler.stats()
+    }
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus 格式的效能指標（需設定 METRICS_ENABLED=true）"""
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 @app.get("/history")
-async def get_history(symbol: str, range: str = "3mo"):
+async def get_history(
+    request: Request,
+    symbol: str,
+    range: str = "3mo",
+    format: str = "rows",
+    indicators: Optional[str] = None,
+    interval: str = "1d",
+    max_points: Optional[int] = None,
+    downsample: str = "ohlc"
+):
     """
     取得歷史股價資料與技術指標
     
     Args:
         symbol: 股票代號（例如：2330.TW）
-        range: 時間範圍（1mo, 3mo, 6mo, 1y）
+        range: 時間範圍（1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max）
+        format: 回應格式（rows：逐列，預設；columnar：每個欄位一個陣列）
+        indicators: 要計算的技術指標（例如 rsi,macd,sma:100，預設全部）
+        interval: K 棒間隔（1d：日 K，預設；1wk：週 K；1mo：月 K；auto：依 max_points 選擇）
+        max_points: 回傳的最多點數，超過時縮減（預設不限制）
+        downsample: 縮減方式（ohlc：K 棒分組合併，預設；lttb：保留收盤價折線形狀的取樣）
     """
+    if format not in RESPONSE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支援的回應格式: {format}")
+    if interval not in INTERVALS:
+        raise HTTPException(status_code=400, detail=f"不支援的 K 棒間隔: {interval}")
+    if downsample not in DOWNSAMPLE_METHODS:
+        raise HTTPException(status_code=400, detail=f"不支援的縮減方式: {downsample}")
+    if max_points is not None and not MIN_POINTS <= max_points <= MAX_POINTS:
+        raise HTTPException(status_code=400, detail=f"max_points 必須介於 {MIN_POINTS} 與 {MAX_POINTS} 之間")
+    selection = resolve_indicators(indicators)
+    sampling = (interval, max_points, downsample) if interval != "1d" or max_points is not None else ()
+    
     try:
         logger.info(f"Fetching history for {symbol} with range {range}")
         
-        # 下載股價資料
-        stock = yf.Ticker(symbol)
-        df = stock.history(period=range)
+        # 同步股價資料（允許 stale 時，尾端資料的補抓改在背景進行）
+        start, version, age = await executors.run_io(
+            sync_history, symbol, range, STALE_WHILE_REVALIDATE, request=request
+        )
         
-        if df.empty:
+        if version is None:
             raise HTTPException(status_code=404, detail=f"找不到股票代號 {symbol} 的資料")
         
-        # 計算技術指標
-        indicators = calculate_all_indicators(df)
-        latest_indicators = get_latest_indicators(df)
-        
-        # 轉換資料格式
-        history_data = []
-        for date, row in df.iterrows():
-            history_data.append({
-                "date": date.strftime("%Y-%m-%d"),
-                "open": round(float(row['Open']), 2),
-                "high": round(float(row['High']), 2),
-                "low": round(float(row['Low']), 2),
-                "close": round(float(row['Close']), 2),
-                "volume": int(row['Volume'])
-            })
+        # 本機資料沒有變動時直接回傳 304，不需要讀取 K 棒、計算指標或序列化
+        etag = history_etag(symbol, range, format, start, version, selection_key(selection), sampling)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return not_modified(etag, HISTORY_CACHE_CONTROL)
         
-        # 格式化指標數據
-        indicators_data = format_indicators_for_chart(df, indicators)
+        # 計算技術指標並序列化（在執行池中進行，避免阻塞 event loop）
+        stale = age is not None
+        body = await executors.run_io(
+            build_history_response, symbol, range, start, format, stale, selection,
+            interval, max_points, downsample, request=request
+        )
         
-        return {
-            "symbol": symbol,
-            "range": range,
-            "data": history_data,
-            "indicators": indicators_data,
-            "latest_indicators": latest_indicators
-        }
+        headers = {"ETag": etag, "Cache-Control": HISTORY_CACHE_CONTROL}
+        if stale:
+            headers["Age"] = str(age)
+        return Response(content=body, media_type="application/json", headers=headers)
     
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (ExecutorBusyError, TaskTimeoutError, ClientDisconnectedError) as e:
+        logger.warning(f"History request for {symbol} aborted: {type(e).__name__}")
+        raise executor_error_to_http(e)
     except Exception as e:
         logger.error(f"Error fetching history: {str(e)}")
         raise HTTPException(status_code=500, detail=f"取得歷史資料時發生錯誤: {str(e)}")
 
 
+@app.get("/indicators")
+async def get_latest_indicators(request: Request, symbol: str):
+    """
+    取得最新的技術指標數值
+
+    數值來自寫入 K 棒時增量更新的串流指標狀態，不需要讀取整段 K 棒或重新計算
+
+    Args:
+        symbol: 股票代號（例如：2330.TW）
+    """
+    try:
+        version, latest, age = await executors.run_io(
+            load_latest_indicators, symbol, STALE_WHILE_REVALIDATE, request=request
+        )
+
+        if version is None or latest is None:
+            raise HTTPException(status_code=404, detail=f"找不到股票代號 {symbol} 的資料")
+
+        etag = make_etag("indicators", symbol, version)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return not_modified(etag, HISTORY_CACHE_CONTROL)
+
+        payload = {"symbol": symbol, **latest}
+        headers = {"ETag": etag, "Cache-Control": HISTORY_CACHE_CONTROL}
+        if age is not None:
+            payload["stale"] = True
+            headers["Age"] = str(age)
+        return Response(content=encode_json(payload), media_type="application/json", headers=headers)
+
+    except HTTPException:
+        raise
+    except (ExecutorBusyError, TaskTimeoutError, ClientDisconnectedError) as e:
+        logger.warning(f"Indicators request for {symbol} aborted: {type(e).__name__}")
+        raise executor_error_to_http(e)
+    except Exception as e:
+        logger.error(f"Error fetching indicators: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"取得技術指標時發生錯誤: {str(e)}")
+
+
 @app.get("/predict")
 async def predict_stock(
+    request: Request,
     symbol: str, 
     days: int = 7,
     force_refresh: bool = False,
+    format: str = "rows",
+    model: Optional[str] = None,
+    indicators: Optional[str] = None,
     token_payload: dict = Depends(verify_token)
 ):
     """
@@ -115,109 +1185,212 @@ async def predict_stock(
         symbol: 股票代號（例如：2330.TW）
         days: 預測天數（預設 7 天）
         force_refresh: 是否強制刷新（忽略快取）
+        format: 回應格式（rows：逐列，預設；columnar：每個欄位一個陣列）
+        model: 預測模型（prophet、holt_winters、drift、ar，預設依 FORECAST_ENGINE 設定）
+        indicators: 要回傳的技術指標（例如 rsi,macd,sma:100，預設全部）
         token_payload: JWT token 解碼後的使用者資訊
     """
+    if format not in RESPONSE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"不支援的回應格式: {format}")
+    model = resolve_model(model)
+    validate_days(days)
+    selection = resolve_indicators(indicators)
+    indicators_key = selection_key(selection)
+    
     try:
         user = get_current_user(token_payload)
-        logger.info(f"User {user['email']} predicting {symbol} for {days} days (force_refresh={force_refresh})")
+        logger.info(f"User {user['email']} predicting {symbol} for {days} days with {model} (force_refresh={force_refresh})")
+        cache_manager.record_request(symbol, days)
         
-        # 如果強制刷新，清除該股票的快取
+        # 如果強制刷新，先檢查使用者的刷新頻率，再清除該股票的快取
         if force_refresh:
-            cache_manager.clear_symbol_cache(symbol, days)
+            admission.check_refresh(user["id"])
+            response_cache.invalidate(symbol, days)
+            cache_manager.clear_symbol_cache(symbol, days, model)
             logger.info(f"Cache cleared for {symbol} due to force_refresh")
         
-        # 檢查快取
+        # 檢查快取：先查行程內的回應快取，再查 SQLite
         if not force_refresh:
-            cached_result = cache_manager.get_prediction(symbol, days)
-            if cached_result:
+            if_none_match = request.headers.get("if-none-match")
+            cached_response = response_cache.get((symbol, days, model, format, indicators_key))
+            if cached_response is not None:
+                if etag_matches(if_none_match, cached_response.etag):
+                    return not_modified(cached_response.etag, PREDICT_CACHE_CONTROL)
+                return Response(
+                    content=cached_response.body,
+                    media_type="application/json",
+                    headers={"ETag": cached_response.etag, "Cache-Control": PREDICT_CACHE_CONTROL}
+                )
+            
+            # 客戶端帶有 ETag 時，先只比對快取項目的版本，相符就不需要讀取與編碼預測內容
+            if if_none_match:
+                meta = cache_manager.get_prediction_meta(symbol, days, model)
+                if meta is not None and not meta.is_stale():
+                    etag = prediction_etag(symbol, days, model, format, meta, indicators_key)
+                    if etag_matches(if_none_match, etag):
+                        return not_modified(etag, PREDICT_CACHE_CONTROL)
+            
+            cached_entry = cache_manager.get_prediction_entry(
+                symbol, days, model, allow_stale=STALE_WHILE_REVALIDATE
+            )
+            if cached_entry:
+                if cached_entry.is_stale():
+                    etag = prediction_etag(symbol, days, model, format, cached_entry, indicators_key)
+                    if etag_matches(if_none_match, etag):
+                        revalidate_prediction(symbol, days, model)
+                        return not_modified(etag, STALE_PREDICT_CACHE_CONTROL)
+                data = await selected_prediction(symbol, cached_entry.data, selection, request)
+                if cached_entry.is_stale():
+                    return stale_prediction_response(
+                        symbol, days, model, format, cached_entry, data, indicators_key
+                    )
                 logger.info(f"Returning cached prediction for {symbol}")
-                return cached_result
-        
-        # 下載最近六個月的股價資料
-        stock = yf.Ticker(symbol)
-        df = stock.history(period="6mo")
-        
-        if df.empty:
-            raise HTTPException(status_code=404, detail=f"找不到股票代號 {symbol} 的資料")
-        
-        # 計算技術指標
-        indicators = calculate_all_indicators(df)
-        latest_indicators = get_latest_indicators(df)
+                return prediction_response(symbol, days, model, format, data, cached_entry, indicators_key)
         
-        # 準備 Prophet 資料格式（移除時區資訊）
-        prophet_df = pd.DataFrame({
-            'ds': df.index.tz_localize(None),
-            'y': df['Close']
-        })
+        # 合併相同 (symbol, days, model) 的並行請求，只訓練一次模型；新的計算需要取得准入名額
+        result = await admitted_prediction(user["id"], symbol, days, request, refit=force_refresh, model=model)
+        result = await selected_prediction(symbol, result, selection, request)
         
-        # 訓練 Prophet 模型
-        model = Prophet(
-            daily_seasonality=True,
-            yearly_seasonality=True,
-            weekly_seasonality=True
+        return prediction_response(
+            symbol, days, model, format, result, cache_manager.get_prediction_meta(symbol, days, model), indicators_key
         )
-        model.fit(prophet_df)
-        
-        # 建立未來日期
-        future = model.make_future_dataframe(periods=days)
-        forecast = model.predict(future)
-        
-        # 取得歷史資料（最近 30 天）
-        historical_data = []
-        recent_df = df.tail(30)
-        for date, row in recent_df.iterrows():
-            historical_data.append({
-                "date": date.strftime("%Y-%m-%d"),
-                "actual": round(float(row['Close']), 2),
-                "type": "historical"
-            })
-        
-        # 取得預測資料（未來 N 天）
-        prediction_data = []
-        last_date = pd.Timestamp(df.index[-1]).tz_localize(None)
-        forecast_future = forecast[forecast['ds'] > last_date].head(days)
-        
-        for _, row in forecast_future.iterrows():
-            prediction_data.append({
-                "date": row['ds'].strftime("%Y-%m-%d"),
-                "predicted": round(float(row['yhat']), 2),
-                "lower": round(float(row['yhat_lower']), 2),
-                "upper": round(float(row['yhat_upper']), 2),
-                "type": "prediction"
-            })
-        
-        # 格式化指標數據
-        indicators_data = format_indicators_for_chart(df, indicators)
-        
-        taipei_tz = pytz.timezone('Asia/Taipei')
-        result = {
-            "symbol": symbol,
-            "days": days,
-            "current_price": round(float(df['Close'].iloc[-1]), 2),
-            "last_update": df.index[-1].strftime("%Y-%m-%d"),
-            "historical": historical_data,
-            "predictions": prediction_data,
-            "indicators": indicators_data,
-            "latest_indicators": latest_indicators,
-            "timestamp": datetime.now(taipei_tz).isoformat()
-        }
-        
-        # Debug: 檢查 indicators_data 是否正確格式化
-        if indicators_data and len(indicators_data) > 0:
-            logger.info(f"Indicators data sample: {indicators_data[0]}")
-        else:
-            logger.warning("Indicators data is empty!")
-        
-        # 儲存到快取
-        cache_manager.save_prediction(symbol, days, result)
-        
-        return result
     
+    except HTTPException:
+        raise
+    except AdmissionRejected as e:
+        raise admission_error_to_http(e)
+    except (ExecutorBusyError, TaskTimeoutError, ClientDisconnectedError) as e:
+        logger.warning(f"Prediction request for {symbol} aborted: {type(e).__name__}")
+        raise executor_error_to_http(e)
     except Exception as e:
         logger.error(f"Error predicting stock: {str(e)}")
         raise HTTPException(status_code=500, detail=f"預測時發生錯誤: {str(e)}")
 
 
+@app.post("/predict/batch")
+async def predict_batch(
+    body: BatchPredictRequest,
+    token_payload: dict = Depends(verify_token)
+):
+    """
+    批次預測多個股票（需要驗證）
+    
+    回應為 NDJSON 串流，每完成一個股票輸出一行結果，最後一行為統計摘要
+    
+    Args:
+        body: 股票代號、預測天數與預測模型
+        token_payload: JWT token 解碼後的使用者資訊
+    """
+    model = resolve_model(body.model)
+    items = [(symbol, body.days) for symbol in body.symbols]
+    items += [(item.symbol, item.days) for item in body.items]
+    items = list(dict.fromkeys(items))
+    
+    if not items:
+        raise HTTPException(status_code=400, detail="請提供至少一個股票代號")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"單次最多預測 {BATCH_MAX_ITEMS} 個項目")
+    for _, days in items:
+        validate_days(days)
+    
+    user = get_current_user(token_payload)
+    logger.info(f"User {user['email']} batch predicting {len(items)} items with {model}")
+    for symbol, days in items:
+        cache_manager.record_request(symbol, days)
+    
+    return StreamingResponse(stream_batch_predictions(items, model, user["id"]), media_type="application/x-ndjson")
+
+
+@app.get("/predict/stream")
+async def predict_stream(
+    request: Request,
+    symbol: str,
+    days: int = 7,
+    model: Optional[str] = None,
+    indicators: Optional[str] = None,
+    token_payload: dict = Depends(verify_token)
+):
+    """
+    串流預測股價（需要驗證）
+    
+    回應為 NDJSON 串流：先輸出歷史資料與技術指標（history 事件），
+    模型訓練完成後輸出預測（predictions 事件），期間定期輸出 heartbeat，最後為 done
+    
+    Args:
+        symbol: 股票代號（例如：2330.TW）
+        days: 預測天數（預設 7 天）
+        model: 預測模型（預設依 FORECAST_ENGINE 設定）
+        indicators: 要回傳的技術指標（例如 rsi,macd，預設全部）
+        token_payload: JWT token 解碼後的使用者資訊
+    """
+    model = resolve_model(model)
+    validate_days(days)
+    selection = resolve_indicators(indicators)
+    user = get_current_user(token_payload)
+    logger.info(f"User {user['email']} streaming prediction for {symbol} ({days} days, {model})")
+    cache_manager.record_request(symbol, days)
+    
+    return StreamingResponse(
+        stream_prediction(symbol, days, model, request, user["id"], selection),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/backtest")
+async def backtest(
+    request: Request,
+    symbol: str,
+    model: Optional[str] = None,
+    range: str = "2y",
+    window: str = "6mo",
+    horizon: int = 7,
+    step: int = 5,
+    resume: bool = True,
+    token_payload: dict = Depends(verify_token)
+):
+    """
+    回測預測模型的準確度（需要驗證）
+    
+    Args:
+        symbol: 股票代號（例如：2330.TW）
+        model: 預測模型（預設依 FORECAST_ENGINE 設定）
+        range: 回測使用的資料期間（預設 2y）
+        window: 每個起點的訓練資料期間（預設 6mo，與 /predict 相同）
+        horizon: 每個起點的預測天數（預設 7 天）
+        step: 起點的間隔（工作日，預設 5）
+        resume: 是否沿用先前已完成的起點（預設 true；false 時重新計算全部起點）
+        token_payload: JWT token 解碼後的使用者資訊
+    """
+    model = resolve_model(model)
+    if window not in PERIOD_OFFSETS:
+        raise HTTPException(status_code=400, detail=f"不支援的訓練期間: {window}")
+    if not 1 <= horizon <= MAX_FORECAST_DAYS:
+        raise HTTPException(status_code=400, detail=f"horizon 必須介於 1 與 {MAX_FORECAST_DAYS} 之間")
+    if step < 1:
+        raise HTTPException(status_code=400, detail="step 必須大於 0")
+    
+    try:
+        user = get_current_user(token_payload)
+        logger.info(f"User {user['email']} backtesting {symbol} ({model}, {range}, window {window}, horizon {horizon}, step {step})")
+        return await backtest_symbol(
+            symbol, model, range, window, horizon, step, resume, user_id=user["id"], request=request
+        )
+    
+    except HTTPException:
+        raise
+    except AdmissionRejected as e:
+        raise admission_error_to_http(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (ExecutorBusyError, TaskTimeoutError, ClientDisconnectedError) as e:
+        logger.warning(f"Backtest for {symbol} aborted: {type(e).__name__}")
+        raise executor_error_to_http(e)
+    except Exception as e:
+        logger.error(f"Error backtesting: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"回測時發生錯誤: {str(e)}")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
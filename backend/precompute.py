@@ -0,0 +1,42 @@
+"""
+預測預先計算 CLI
+立即預先計算一輪（例如由 cron 在收盤後執行），多個行程同時執行時會以租約分工
+
+用法：
+    python precompute.py
+    python precompute.py --symbols 2330.TW 2317.TW --days 7 14 --top 50
+    python precompute.py --market TW
+"""
+import argparse
+import asyncio
+import json
+
+from utils.market_calendar import MARKETS
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="預先計算股價預測並寫入快取")
+    parser.add_argument("--symbols", nargs="*", help="股票代號（預設使用 PRECOMPUTE_SYMBOLS）")
+    parser.add_argument("--days", nargs="*", type=int, help="預測天數（預設使用 PRECOMPUTE_DAYS）")
+    parser.add_argument("--top", type=int, help="另外加入最近請求次數最多的前 N 個項目（預設使用 PRECOMPUTE_TOP_N）")
+    parser.add_argument("--market", choices=sorted(MARKETS), help="只處理此交易所的股票")
+    return parser.parse_args()
+
+
+async def run(args) -> dict:
+    import main as api
+
+    scheduler = api.create_precompute_scheduler(symbols=args.symbols, days=args.days, top_n=args.top)
+    try:
+        return await scheduler.run_once(args.market)
+    finally:
+        api.cache_manager.close()
+        api.model_store.close()
+        api.ohlcv_store.close()
+        api.backtest_store.close()
+        api.executors.shutdown()
+
+
+if __name__ == "__main__":
+    summary = asyncio.run(run(parse_args()))
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
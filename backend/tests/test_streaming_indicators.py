@@ -0,0 +1,223 @@
+"""
+串流技術指標與批次計算的一致性測試
+
+以 benchmarks 的合成日 K（固定亂數種子，含一段平盤、零成交量的 K 棒）比較
+StreamingIndicatorEngine 與 compute_indicator_matrix / calculate_* 的每個指標：
+整段序列、逐根 K 棒更新與每次從頭重新計算、snapshot / restore、修正最後一根 K 棒，
+以及 OHLCVStore 寫入 K 棒時增量更新的狀態
+
+    cd backend && python -m unittest tests.test_streaming_indicators
+"""
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.fixtures import synthetic_ohlcv
+from utils.data_sources import FixtureSource
+from utils.indicators import (
+    calculate_adx,
+    calculate_atr,
+    calculate_bollinger_bands,
+    calculate_cci,
+    calculate_ema,
+    calculate_macd,
+    calculate_obv,
+    calculate_rsi,
+    calculate_sma,
+    calculate_stochastic,
+    calculate_vwap,
+    calculate_williams_r,
+    compute_indicator_matrix,
+)
+from utils.ohlcv_store import OHLCVStore
+from utils.streaming_indicators import StreamingIndicatorEngine
+
+# 每個指標欄位對應的 calculate_* 函式
+CALCULATORS = {
+    'sma_20': lambda df: calculate_sma(df, 20),
+    'sma_50': lambda df: calculate_sma(df, 50),
+    'ema_12': lambda df: calculate_ema(df, 12),
+    'ema_26': lambda df: calculate_ema(df, 26),
+    'rsi': calculate_rsi,
+    'macd': lambda df: calculate_macd(df)['macd'],
+    'macd_signal': lambda df: calculate_macd(df)['signal'],
+    'macd_histogram': lambda df: calculate_macd(df)['histogram'],
+    'bb_upper': lambda df: calculate_bollinger_bands(df)['upper'],
+    'bb_middle': lambda df: calculate_bollinger_bands(df)['middle'],
+    'bb_lower': lambda df: calculate_bollinger_bands(df)['lower'],
+    'stoch_k': lambda df: calculate_stochastic(df)['k'],
+    'stoch_d': lambda df: calculate_stochastic(df)['d'],
+    'atr': calculate_atr,
+    'obv': calculate_obv,
+    'adx': calculate_adx,
+    'cci': calculate_cci,
+    'williams_r': calculate_williams_r,
+    'vwap': calculate_vwap,
+}
+
+RTOL = 1e-9
+ATOL = 1e-7
+
+
+def make_series(bars: int = 400) -> pd.DataFrame:
+    """
+    合成日 K，第 120～129 根為開高低收相同、成交量為 0 的平盤
+
+    平盤短於所有指標的視窗：整個視窗都是平盤時兩邊都只剩捨入誤差（0 / 0），比較沒有意義
+    """
+    df = synthetic_ohlcv(bars, seed=7)
+    flat = df.index[120:130]
+    price = float(df['Close'].iloc[119])
+    df.loc[flat, ['Open', 'High', 'Low', 'Close']] = price
+    df.loc[flat, 'Volume'] = 0.0
+    return df
+
+
+def feed(engine: StreamingIndicatorEngine, df: pd.DataFrame) -> dict:
+    """逐根送入 K 棒，返回最後一根的指標值"""
+    latest = {}
+    for ts, row in df.iterrows():
+        latest = engine.update(row['Open'], row['High'], row['Low'], row['Close'], row['Volume'],
+                               date=ts.strftime("%Y-%m-%d"))
+    return latest
+
+
+class StreamingIndicatorTestCase(unittest.TestCase):
+
+    def assertRowMatches(self, latest: dict, matrix: np.ndarray, columns: dict, row: int = -1):
+        self.assertEqual(set(latest), set(columns))
+        for name, idx in columns.items():
+            np.testing.assert_allclose(
+                latest[name], matrix[row, idx], rtol=RTOL, atol=ATOL, equal_nan=True, err_msg=name
+            )
+
+
+class TestStreamingIndicatorEngine(StreamingIndicatorTestCase):
+
+    def setUp(self):
+        self.df = make_series()
+
+    def test_full_series_matches_indicator_matrix(self):
+        streamed = StreamingIndicatorEngine("TEST").update_frame(self.df)
+        matrix, columns = compute_indicator_matrix(self.df)
+
+        self.assertEqual(set(streamed.columns), set(columns))
+        for name, idx in columns.items():
+            np.testing.assert_allclose(
+                streamed[name].to_numpy(), matrix[:, idx], rtol=RTOL, atol=ATOL, equal_nan=True, err_msg=name
+            )
+
+    def test_full_series_matches_calculate_functions(self):
+        streamed = StreamingIndicatorEngine("TEST").update_frame(self.df)
+
+        self.assertEqual(set(streamed.columns), set(CALCULATORS))
+        for name, calculate in CALCULATORS.items():
+            np.testing.assert_allclose(
+                streamed[name].to_numpy(), calculate(self.df).to_numpy(dtype=float),
+                rtol=RTOL, atol=ATOL, equal_nan=True, err_msg=name
+            )
+
+    def test_bar_by_bar_matches_full_recompute(self):
+        engine = StreamingIndicatorEngine("TEST")
+        df = self.df.iloc[:160]
+        for i in range(len(df)):
+            latest = feed(engine, df.iloc[i:i + 1])
+            matrix, columns = compute_indicator_matrix(df.iloc[:i + 1])
+            self.assertRowMatches(latest, matrix, columns)
+
+    def test_snapshot_restore_continues_the_series(self):
+        engine = StreamingIndicatorEngine("TEST")
+        feed(engine, self.df.iloc[:250])
+
+        restored = StreamingIndicatorEngine.restore(json.loads(json.dumps(engine.snapshot())))
+        self.assertEqual(restored.first_date, engine.first_date)
+        self.assertEqual(restored.last_date, engine.last_date)
+        latest = feed(restored, self.df.iloc[250:])
+
+        matrix, columns = compute_indicator_matrix(self.df)
+        self.assertRowMatches(latest, matrix, columns)
+
+    def test_revising_the_last_bar_replaces_it(self):
+        engine = StreamingIndicatorEngine("TEST")
+        feed(engine, self.df)
+
+        revised = self.df.copy()
+        last = revised.index[-1]
+        revised.loc[last, ['High', 'Close', 'Volume']] = [
+            revised.loc[last, 'High'] * 1.05, revised.loc[last, 'Close'] * 1.04, revised.loc[last, 'Volume'] * 2
+        ]
+        latest = feed(engine, revised.iloc[-1:])
+
+        matrix, columns = compute_indicator_matrix(revised)
+        self.assertRowMatches(latest, matrix, columns)
+
+    def test_latest_indicators_skips_undefined_values(self):
+        engine = StreamingIndicatorEngine("TEST")
+        feed(engine, self.df.iloc[:10])
+
+        latest = engine.latest_indicators()
+        self.assertNotIn('sma_20', latest)
+        self.assertEqual(latest['ema_12'], round(engine.latest['ema_12'], 2))
+
+
+class TestOHLCVStoreIndicatorState(StreamingIndicatorTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = OHLCVStore(FixtureSource(self.directory.name), db_path=os.path.join(self.directory.name, "ohlcv.db"))
+        self.df = make_series()
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def assertStateMatchesStoredBars(self):
+        engine = self.store.indicator_states.load("TEST")
+        stored = self.store.read_range("TEST")
+        self.assertEqual(engine.first_date, stored.index[0].strftime("%Y-%m-%d"))
+        self.assertEqual(engine.last_date, stored.index[-1].strftime("%Y-%m-%d"))
+        matrix, columns = compute_indicator_matrix(stored)
+        self.assertRowMatches(engine.latest, matrix, columns)
+
+    def test_tail_appends_update_the_state_incrementally(self):
+        self.store.save_bars("TEST", self.df.iloc[:300])
+        self.assertStateMatchesStoredBars()
+
+        with mock.patch.object(self.store, "_rebuild_indicator_state", wraps=self.store._rebuild_indicator_state) as rebuild:
+            # 尾端補抓從最後一根 K 棒開始，最後一根可能是盤中資料而被修正
+            tail = self.df.iloc[299:340].copy()
+            tail.iloc[0, tail.columns.get_loc('Close')] *= 1.01
+            self.store.save_bars("TEST", tail)
+            self.assertStateMatchesStoredBars()
+
+            for i in range(340, len(self.df)):
+                self.store.save_bars("TEST", self.df.iloc[i - 1:i + 1])
+            self.assertStateMatchesStoredBars()
+
+        rebuild.assert_not_called()
+
+    def test_backfill_rebuilds_the_state(self):
+        self.store.save_bars("TEST", self.df.iloc[200:])
+        self.store.save_bars("TEST", self.df.iloc[:200], update_last_fetch=False)
+        self.assertStateMatchesStoredBars()
+
+    def test_latest_indicators_builds_missing_state(self):
+        self.store.save_bars("TEST", self.df)
+        self.store.indicator_states.delete("TEST")
+
+        latest = self.store.latest_indicators("TEST")
+        matrix, columns = compute_indicator_matrix(self.store.read_range("TEST"))
+        self.assertEqual(latest["last_update"], self.df.index[-1].strftime("%Y-%m-%d"))
+        self.assertEqual(set(latest["latest_indicators"]), set(columns))
+        for name, value in latest["latest_indicators"].items():
+            self.assertAlmostEqual(value, round(float(matrix[-1, columns[name]]), 2), places=6, msg=name)
+        self.assertIsNone(self.store.latest_indicators("MISSING"))
+
+
+if __name__ == "__main__":
+    unittest.main()
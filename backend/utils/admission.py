@@ -0,0 +1,251 @@
+"""
+預測的准入控制模組
+限制同時進行的模型訓練數（全域與每個使用者），以 token bucket 限制略過快取的請求（force_refresh），
+超過上限的請求在有上限的優先佇列中等待，等不到或佇列已滿時回傳 429 與 Retry-After，而不是無限期排隊。
+狀態保存在行程內，每個 uvicorn worker 各自計算
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 佇列優先順序（數字小者優先）：一般的快取未命中先於略過快取的重新訓練
+PRIORITY_MISS = 0
+PRIORITY_REFRESH = 1
+
+
+class AdmissionRejected(Exception):
+    """請求超過准入上限"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Token bucket：每秒補充 rate 個 token，最多累積 burst 個"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> float:
+        """
+        取用一個 token
+
+        Returns:
+            0 表示成功；否則為下一個 token 補充前需要等待的秒數
+        """
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionController:
+    """
+    准入控制
+
+    - 全域上限：同時進行的預測計算數不超過 max_concurrent，其餘請求依優先順序排隊
+    - 每個使用者上限：同一使用者執行中加上排隊中的請求不超過 per_user
+    - 略過快取的請求：每個使用者以 token bucket 限制頻率（refresh_rate 為每秒補充量，0 表示不限制）
+    - 佇列已滿、等待超過 max_wait 秒或超過上述限制時拋出 AdmissionRejected
+
+    快取命中的請求在進入准入控制之前就已回應，永遠不會排在訓練之後
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        per_user: int = 2,
+        queue_size: int = 32,
+        max_wait: float = 30,
+        refresh_rate: float = 0.1,
+        refresh_burst: float = 3,
+        max_buckets: int = 10000,
+    ):
+        """
+        Args:
+            max_concurrent: 全域同時進行的計算數（0 表示停用准入控制）
+            per_user: 每個使用者同時執行與排隊的請求數（0 表示不限制）
+            queue_size: 等待佇列的長度上限
+            max_wait: 排隊的最長秒數
+            refresh_rate: 略過快取的請求每秒補充的 token 數（0 表示不限制）
+            refresh_burst: 略過快取的請求可累積的 token 數
+            max_buckets: 最多保存的使用者 token bucket 數（超過時移除已補滿的 bucket）
+        """
+        self.max_concurrent = max_concurrent
+        self.per_user = per_user
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.refresh_rate = refresh_rate
+        self.refresh_burst = refresh_burst
+        self.max_buckets = max_buckets
+
+        self.active = 0
+        self._users: Dict[str, int] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._waiters: List[tuple] = []
+        self._queued = 0
+        self._sequence = itertools.count()
+        # 單次計算佔用名額的平均秒數（指數移動平均），用於估計 Retry-After
+        self._hold_seconds = 5.0
+        self.counters: Dict[str, int] = {
+            "admitted": 0,
+            "waited": 0,
+            "rejected_user": 0,
+            "rejected_rate": 0,
+            "rejected_queue": 0,
+            "rejected_timeout": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_concurrent > 0
+
+    @property
+    def queued(self) -> int:
+        """目前排隊中的請求數"""
+        return self._queued
+
+    def retry_after(self) -> int:
+        """依目前的佇列長度與平均計算時間估計的重試秒數"""
+        backlog = self._queued + 1
+        return max(1, math.ceil(self._hold_seconds * backlog / max(1, self.max_concurrent)))
+
+    def _reject(self, counter: str, reason: str, retry_after: Optional[int] = None) -> AdmissionRejected:
+        self.counters[counter] += 1
+        retry_after = retry_after if retry_after is not None else self.retry_after()
+        logger.info(f"Admission rejected ({counter}): {reason}, retry after {retry_after}s")
+        return AdmissionRejected(reason, retry_after)
+
+    def _take_refresh_token(self, user_id: str) -> float:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) >= self.max_buckets:
+                self._prune_buckets()
+            bucket = self._buckets[user_id] = TokenBucket(self.refresh_rate, self.refresh_burst)
+        return bucket.take()
+
+    def _prune_buckets(self):
+        now = time.monotonic()
+        for user_id, bucket in list(self._buckets.items()):
+            bucket._refill(now)
+            if bucket.tokens >= bucket.burst:
+                del self._buckets[user_id]
+
+    def check_refresh(self, user_id: str):
+        """
+        略過快取的請求取用使用者的 token（應在清除快取之前呼叫）
+
+        Raises:
+            AdmissionRejected: 超過頻率限制
+        """
+        if not self.enabled or self.refresh_rate <= 0:
+            return
+        wait = self._take_refresh_token(user_id)
+        if wait > 0:
+            raise self._reject("rejected_rate", "強制刷新過於頻繁", retry_after=math.ceil(wait))
+
+    @asynccontextmanager
+    async def slot(self, user_id: str, priority: int = PRIORITY_MISS):
+        """
+        取得一個計算名額（停用時直接執行）
+
+        Example:
+            async with admission.slot(user["id"]):
+                result = await load_prediction(...)
+
+        Args:
+            user_id: 使用者 ID
+            priority: 佇列優先順序（PRIORITY_MISS 或 PRIORITY_REFRESH）
+
+        Raises:
+            AdmissionRejected: 超過使用者上限、佇列已滿或等待逾時
+        """
+        if not self.enabled:
+            yield
+            return
+
+        if self.per_user > 0 and self._users.get(user_id, 0) >= self.per_user:
+            raise self._reject("rejected_user", f"同時進行的預測已達上限（{self.per_user}）")
+
+        self._users[user_id] = self._users.get(user_id, 0) + 1
+        try:
+            await self._acquire(priority)
+            started = time.monotonic()
+            try:
+                yield
+            finally:
+                self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * (time.monotonic() - started)
+                self._release()
+        finally:
+            self._users[user_id] -= 1
+            if self._users[user_id] <= 0:
+                del self._users[user_id]
+
+    async def _acquire(self, priority: int):
+        if self.active < self.max_concurrent and not self._queued:
+            self.active += 1
+            self.counters["admitted"] += 1
+            return
+
+        if self._queued >= self.queue_size:
+            raise self._reject("rejected_queue", "伺服器忙碌中，等待佇列已滿")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._queued += 1
+        self.counters["waited"] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            if not future.done():
+                future.cancel()
+                self._queued -= 1
+                raise self._reject("rejected_timeout", f"排隊超過 {self.max_wait:g} 秒")
+        except asyncio.CancelledError:
+            if not future.done():
+                future.cancel()
+                self._queued -= 1
+            elif not future.cancelled():
+                # 名額已交給這個請求，但請求已被取消，轉交下一個等待者
+                self._release()
+            raise
+        self.counters["admitted"] += 1
+
+    def _release(self):
+        # 名額直接交給優先順序最高、仍在等待的請求（active 不變）
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self._queued -= 1
+            future.set_result(None)
+            return
+        self.active -= 1
+
+    def stats(self) -> dict:
+        """目前的名額使用情形與累計計數"""
+        return {
+            "max_concurrent": self.max_concurrent,
+            "active": self.active,
+            "queued": self._queued,
+            "users": len(self._users),
+            **self.counters,
+        }
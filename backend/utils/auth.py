@@ -6,7 +6,14 @@ from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import jwt, JWTError
 import requests
 import os
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from functools import lru_cache
+from typing import Optional
+
+from utils.metrics import metrics
 
 security = HTTPBearer()
 
@@ -24,6 +31,100 @@ def get_supabase_public_key():
     return SUPABASE_JWT_SECRET
 
 
+# 具有管理權限的角色（JWT 的 role 或 app_metadata.role / app_metadata.roles）
+ADMIN_ROLE = os.getenv("ADMIN_ROLE", "admin")
+
+
+class TokenCache:
+    """
+    已驗證 Token 的 LRU 快取
+
+    以 Token 的 SHA-256 為鍵保存解碼後的 payload，到 exp 或最多 ttl 秒後失效，
+    讓同一個 Token 的重複請求（例如儀表板輪詢）不必每次都驗證簽章；
+    只快取驗證成功的 Token
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        """
+        Args:
+            maxsize: 最多保存的 Token 數（0 表示停用）
+            ttl: 單一 Token 最長的快取秒數
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        """取得快取的 payload（不存在或已過期時返回 None）"""
+        if self.maxsize <= 0:
+            return None
+
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            payload, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return dict(payload)
+
+    def put(self, token: str, payload: dict):
+        """保存驗證成功的 payload，到期時間為 exp 與 ttl 較早者"""
+        if self.maxsize <= 0:
+            return
+
+        now = time.time()
+        expires_at = now + self.ttl
+        exp = payload.get("exp")
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, exp)
+        if expires_at <= now:
+            return
+
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (dict(payload), expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token: str) -> bool:
+        """移除單一 Token（例如登出），返回是否存在"""
+        with self._lock:
+            return self._entries.pop(self._key(token), None) is not None
+
+    def invalidate_user(self, user_id: str) -> int:
+        """移除某個使用者的所有 Token（例如角色變更或停用帳號），返回移除數量"""
+        with self._lock:
+            keys = [key for key, (payload, _) in self._entries.items() if payload.get("sub") == user_id]
+            for key in keys:
+                del self._entries[key]
+        return len(keys)
+
+    def clear(self):
+        """清除所有 Token（例如更換 JWT secret）"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# 已驗證 Token 快取（TOKEN_CACHE_SIZE=0 停用）
+token_cache = TokenCache(
+    maxsize=int(os.getenv("TOKEN_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("TOKEN_CACHE_TTL", "300"))
+)
+
+
 async def verify_token(
     credentials: HTTPAuthorizationCredentials = Security(security)
 ):
@@ -39,8 +140,31 @@ async def verify_token(
     Raises:
         HTTPException: Token 無效或過期
     """
-    token = credentials.credentials
+    return decode_token(credentials.credentials)
+
+
+def decode_token(token: str) -> dict:
+    """
+    解碼並驗證 JWT Token（不經過 FastAPI 依賴注入時使用，例如中介軟體）
+
+    驗證成功的 Token 會保存在 token_cache，到期前重複的請求不再驗證簽章
     
+    Raises:
+        HTTPException: Token 無效或過期
+    """
+    cached = token_cache.get(token)
+    if cached is not None:
+        metrics.cache_result("token", "hit")
+        return cached
+    metrics.cache_result("token", "miss")
+
+    payload = _verify(token)
+    token_cache.put(token, payload)
+    return payload
+
+
+def _verify(token: str) -> dict:
+    """驗證 JWT 簽章與必要欄位"""
     try:
         # 解碼 JWT token
         # Supabase 預設使用 HS256 演算法
@@ -82,8 +206,11 @@ def get_current_user(token_payload: dict):
     Returns:
         使用者資訊字典
     """
+    app_metadata = token_payload.get("app_metadata") or {}
+    roles = {token_payload.get("role"), app_metadata.get("role"), *(app_metadata.get("roles") or [])}
     return {
         "id": token_payload.get("sub"),
         "email": token_payload.get("email"),
-        "role": token_payload.get("role", "authenticated")
+        "role": token_payload.get("role", "authenticated"),
+        "is_admin": ADMIN_ROLE in roles
     }
@@ -0,0 +1,340 @@
+"""
+預測準確度回測模組
+以滾動預測起點（walk-forward）評估預測模型：每個起點只用之前 window 期間的 K 棒訓練，
+再與之後 horizon 天的實際收盤價比較，計算 MAE、MAPE 與預測區間的涵蓋率。
+連續的起點分組後平行訓練，同一組內以上一個起點的模型 warm start；
+評估期間已完整結束的起點結果存入 SQLite，中斷後以相同參數重新執行時直接沿用
+"""
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils.db import ConnectionPool
+from utils.forecast import fit_forecast, get_engine
+from utils.ohlcv_store import PERIOD_OFFSETS
+
+logger = logging.getLogger(__name__)
+
+# 起點以此日期起算的工作日數對齊 step，資料期間改變（例如隔天再執行）時起點不變，先前的結果仍可沿用
+ORIGIN_EPOCH = "1970-01-05"
+
+
+def plan_origins(index: pd.DatetimeIndex, window: str, step: int) -> List[str]:
+    """
+    規劃預測起點
+
+    起點為每隔 step 個工作日的 K 棒（遇到休市日則略過該起點），
+    且之前有完整 window 期間的資料、之後至少有一根 K 棒可以評估
+
+    Args:
+        index: 日 K 的日期索引
+        window: 訓練資料的期間（例如 6mo）
+        step: 起點的間隔（工作日）
+
+    Returns:
+        起點日期（YYYY-MM-DD）列表
+    """
+    if len(index) < 2:
+        return []
+    dates = index.tz_localize(None).normalize()
+    earliest = dates[0] + PERIOD_OFFSETS[window]
+    days = dates.values.astype("datetime64[D]")
+    aligned = np.busday_count(np.datetime64(ORIGIN_EPOCH), days) % step == 0
+    eligible = aligned & (dates >= earliest)
+    eligible[-1] = False
+    return list(dates[eligible].strftime("%Y-%m-%d"))
+
+
+def is_complete(origin: str, horizon: int, last_bar: str) -> bool:
+    """起點的評估期間是否已完整結束（最後一根 K 棒可能尚未收盤，不計入）"""
+    return (pd.Timestamp(origin) + pd.Timedelta(days=horizon)) < pd.Timestamp(last_bar)
+
+
+def run_origins(
+    model: str,
+    prophet_df: pd.DataFrame,
+    origins: List[str],
+    window: str,
+    horizon: int,
+    **options
+) -> List[dict]:
+    """
+    依序訓練並評估一組連續的起點（模組層級函式，可在 process pool 中執行）
+
+    支援 warm start 的模型以同一組上一個起點的模型作為起點；單一起點失敗只記錄錯誤
+
+    Args:
+        model: 預測模型
+        prophet_df: 涵蓋這組起點訓練與評估期間的 ds（無時區日期）與 y（收盤價）
+        origins: 起點日期（遞增）
+        window: 訓練資料的期間
+        horizon: 預測天數
+        options: 引擎專屬的設定（例如 Prophet 的 profile）
+
+    Returns:
+        每個起點的 {'origin', 'points': [[預測天數, 實際, 預測, 下界, 上界], ...], 'fit_seconds'}，
+        失敗時為 {'origin', 'error'}
+    """
+    warm_start = get_engine(model).warm_start
+    ds = pd.DatetimeIndex(prophet_df['ds'])
+    closes = prophet_df['y'].to_numpy(dtype=float)
+    previous_model = None
+    results = []
+
+    for origin in origins:
+        origin_ts = pd.Timestamp(origin)
+        train = prophet_df[(ds >= origin_ts - PERIOD_OFFSETS[window]) & (ds <= origin_ts)]
+        started = time.perf_counter()
+        try:
+            fitted = fit_forecast(model, train.reset_index(drop=True), horizon, previous_model, **options)
+        except Exception as e:
+            logger.error(f"Backtest fit failed for origin {origin}: {str(e)}")
+            results.append({"origin": origin, "error": str(e)})
+            previous_model = None
+            continue
+        if warm_start:
+            previous_model = fitted.get("model")
+
+        evaluated = (ds > origin_ts) & (ds <= origin_ts + pd.Timedelta(days=horizon))
+        actual = dict(zip(ds[evaluated].strftime("%Y-%m-%d"), closes[evaluated].tolist()))
+        points = [
+            [
+                (pd.Timestamp(p["date"]) - origin_ts).days,
+                actual[p["date"]],
+                p["predicted"],
+                p["lower"],
+                p["upper"],
+            ]
+            for p in fitted["predictions"] if p["date"] in actual
+        ]
+        results.append({"origin": origin, "points": points, "fit_seconds": time.perf_counter() - started})
+    return results
+
+
+def _scores(points: np.ndarray) -> dict:
+    actual, predicted, lower, upper = points[:, 1], points[:, 2], points[:, 3], points[:, 4]
+    errors = np.abs(predicted - actual)
+    nonzero = actual != 0
+    return {
+        "mae": round(float(errors.mean()), 4),
+        "mape": round(float((errors[nonzero] / np.abs(actual[nonzero])).mean() * 100), 4) if nonzero.any() else None,
+        "coverage": round(float(((actual >= lower) & (actual <= upper)).mean()), 4),
+        "points": int(len(points)),
+    }
+
+
+def summarize(results: List[dict]) -> dict:
+    """
+    彙總所有起點的誤差
+
+    Returns:
+        {'overall': {'mae', 'mape', 'coverage', 'points'},
+         'by_horizon': [{'days', 'mae', 'mape', 'coverage', 'points'}, ...]}（依預測天數分組）
+    """
+    rows = [point for result in results for point in result.get("points", [])]
+    if not rows:
+        return {"overall": None, "by_horizon": []}
+    points = np.asarray(rows, dtype=float)
+    leads = points[:, 0].astype(int)
+    return {
+        "overall": _scores(points),
+        "by_horizon": [{"days": int(lead), **_scores(points[leads == lead])} for lead in np.unique(leads)],
+    }
+
+
+class BacktestStore:
+    """
+    SQLite 回測結果（checkpoint）
+
+    以 (股票, 模型, 設定, 起點) 為鍵保存每個起點的評估結果；
+    設定包含訓練期間、預測天數與引擎設定，任一項不同即視為不同的回測
+    """
+
+    def __init__(self, db_path: str = "cache.db", pool_size: int = 4):
+        self.db_path = db_path
+        self.pool = ConnectionPool(db_path, size=pool_size)
+        self.init_db()
+
+    def close(self):
+        """關閉資料庫連線"""
+        self.pool.close()
+
+    def init_db(self):
+        """初始化資料庫"""
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS backtest_results (
+                        symbol TEXT NOT NULL,
+                        engine TEXT NOT NULL,
+                        settings TEXT NOT NULL,
+                        origin TEXT NOT NULL,
+                        result TEXT NOT NULL,
+                        created_at TIMESTAMP NOT NULL,
+                        PRIMARY KEY (symbol, engine, settings, origin)
+                    )
+                ''')
+        except Exception as e:
+            logger.error(f"Error initializing backtest store: {str(e)}")
+
+    def load(self, symbol: str, engine: str, settings: str) -> Dict[str, dict]:
+        """
+        取得已完成的起點結果
+
+        Returns:
+            {起點日期: 結果}
+        """
+        try:
+            with self.pool.connection() as conn:
+                rows = conn.execute('''
+                    SELECT origin, result FROM backtest_results
+                    WHERE symbol = ? AND engine = ? AND settings = ?
+                ''', (symbol, engine, settings)).fetchall()
+            return {origin: json.loads(result) for origin, result in rows}
+        except Exception as e:
+            logger.error(f"Error loading backtest checkpoint: {str(e)}")
+            return {}
+
+    def save(self, symbol: str, engine: str, settings: str, results: List[dict]):
+        """儲存起點結果（取代相同起點先前的結果）"""
+        if not results:
+            return
+        try:
+            now = datetime.now()
+            with self.pool.connection() as conn:
+                conn.executemany('''
+                    INSERT OR REPLACE INTO backtest_results (symbol, engine, settings, origin, result, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', [(symbol, engine, settings, result["origin"], json.dumps(result), now) for result in results])
+        except Exception as e:
+            logger.error(f"Error saving backtest checkpoint: {str(e)}")
+
+    def clear(self, symbol: str, engine: str, settings: str):
+        """刪除一組回測的所有結果"""
+        try:
+            with self.pool.connection() as conn:
+                conn.execute('''
+                    DELETE FROM backtest_results WHERE symbol = ? AND engine = ? AND settings = ?
+                ''', (symbol, engine, settings))
+        except Exception as e:
+            logger.error(f"Error clearing backtest checkpoint: {str(e)}")
+
+
+def settings_key(window: str, horizon: int, options: dict) -> str:
+    """回測設定的識別字串（checkpoint 的鍵）"""
+    return json.dumps({"window": window, "horizon": horizon, **options}, sort_keys=True)
+
+
+async def run_backtest(
+    symbol: str,
+    df: pd.DataFrame,
+    model: str,
+    window: str,
+    horizon: int,
+    step: int,
+    submit: Callable[..., Awaitable[List[dict]]],
+    store: BacktestStore,
+    concurrency: int = 1,
+    chunk_size: int = 8,
+    resume: bool = True,
+    max_origins: Optional[int] = None,
+    **options
+) -> dict:
+    """
+    執行 walk-forward 回測
+
+    尚未完成的起點每 chunk_size 個一組，以 submit(run_origins, ...) 平行執行（最多 concurrency 組），
+    每組完成後立即將評估期間已結束的起點寫入 checkpoint
+
+    Args:
+        symbol: 股票代號
+        df: 日 K 資料（以交易所時區 DatetimeIndex 為索引）
+        model: 預測模型
+        window: 訓練資料的期間
+        horizon: 預測天數
+        step: 起點的間隔（工作日）
+        submit: 執行一組起點的 async 函式（例如 process pool 的 run_cpu）
+        store: checkpoint 儲存
+        concurrency: 同時執行的組數
+        chunk_size: 每組的起點數
+        resume: 是否沿用 checkpoint 中已完成的起點（False 時先清除）
+        max_origins: 起點數上限
+        options: 引擎專屬的設定
+
+    Raises:
+        ValueError: 資料不足或起點數超過上限
+    """
+    origins = plan_origins(df.index, window, step)
+    if not origins:
+        raise ValueError(f"資料不足以進行回測（需要超過 {window} 的歷史資料）")
+    if max_origins is not None and len(origins) > max_origins:
+        raise ValueError(f"回測起點過多（{len(origins)} 個，上限 {max_origins}），請加大 step 或縮短期間")
+
+    started = time.perf_counter()
+    settings = settings_key(window, horizon, options)
+    if not resume:
+        await asyncio.to_thread(store.clear, symbol, model, settings)
+    done = await asyncio.to_thread(store.load, symbol, model, settings)
+    results = {origin: done[origin] for origin in origins if origin in done}
+    pending = [origin for origin in origins if origin not in results]
+    resumed = len(results)
+    if resumed:
+        logger.info(f"Resuming backtest for {symbol} ({model}): {resumed}/{len(origins)} origins done")
+
+    prophet_df = pd.DataFrame({'ds': df.index.tz_localize(None), 'y': df['Close'].to_numpy(dtype=float)})
+    last_bar = df.index[-1].strftime("%Y-%m-%d")
+    limit = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_chunk(chunk: List[str]):
+        # 只傳送這組起點需要的資料
+        first = pd.Timestamp(chunk[0]) - PERIOD_OFFSETS[window]
+        last = pd.Timestamp(chunk[-1]) + pd.Timedelta(days=horizon)
+        frame = prophet_df[(prophet_df['ds'] >= first) & (prophet_df['ds'] <= last)].reset_index(drop=True)
+        async with limit:
+            chunk_results = await submit(run_origins, model, frame, chunk, window, horizon, **options)
+        complete = [
+            result for result in chunk_results
+            if "error" not in result and is_complete(result["origin"], horizon, last_bar)
+        ]
+        await asyncio.to_thread(store.save, symbol, model, settings, complete)
+        for result in chunk_results:
+            results[result["origin"]] = result
+        logger.info(f"Backtest {symbol} ({model}): {len(results)}/{len(origins)} origins done")
+
+    tasks = [
+        asyncio.ensure_future(run_chunk(pending[i:i + chunk_size]))
+        for i in range(0, len(pending), chunk_size)
+    ]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        # 任一組失敗（或請求被取消）時停止其餘的組，已完成的組已寫入 checkpoint，可重新執行接續
+        for task in tasks:
+            task.cancel()
+        raise
+
+    ordered = [results[origin] for origin in origins]
+    evaluated = [result for result in ordered if "error" not in result]
+    fit_seconds = [result["fit_seconds"] for result in evaluated if result.get("fit_seconds") is not None]
+    return {
+        "symbol": symbol,
+        "model": model,
+        "window": window,
+        "horizon": horizon,
+        "step": step,
+        "first_origin": origins[0],
+        "last_origin": origins[-1],
+        "origins": len(origins),
+        "resumed": resumed,
+        "failed": [{"origin": result["origin"], "error": result["error"]} for result in ordered if "error" in result],
+        **summarize(evaluated),
+        "fit_seconds_mean": round(float(np.mean(fit_seconds)), 4) if fit_seconds else None,
+        "elapsed": round(time.perf_counter() - started, 3),
+    }
@@ -1,164 +1,540 @@
-import sqlite3
 import json
-from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+import threading
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Optional, Dict, Any, List, NamedTuple, Tuple
 import logging
 
+from utils.db import ConnectionPool
+from utils.market_calendar import cache_expiry
+from utils.metrics import metrics
+
 logger = logging.getLogger(__name__)
 
+# 命中時最多每隔多久更新一次 last_accessed，避免每次讀取都寫入
+TOUCH_INTERVAL = timedelta(seconds=60)
+
+# 請求次數統計保留的天數
+REQUEST_COUNT_RETENTION_DAYS = 30
+
+# 未指定時的預測模型（舊版快取資料皆為 Prophet 的結果）
+DEFAULT_MODEL = "prophet"
+
+
+class CacheEntry(NamedTuple):
+    """一筆快取的預測結果"""
+    id: int
+    data: Optional[Dict[Any, Any]]
+    created_at: datetime
+    expires_at: datetime
+
+    def is_stale(self, now: Optional[datetime] = None) -> bool:
+        """是否已過期（僅在允許 stale 的查詢中會出現）"""
+        return self.expires_at <= (now or datetime.now())
+
+    def age_seconds(self, now: Optional[datetime] = None) -> int:
+        """距離產生時經過的秒數"""
+        return max(0, int(((now or datetime.now()) - self.created_at).total_seconds()))
+
 
 class CacheManager:
     """SQLite 快取管理器"""
-    
-    def __init__(self, db_path: str = "cache.db"):
+
+    def __init__(
+        self,
+        db_path: str = "cache.db",
+        pool_size: int = 4,
+        max_rows: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        intraday_ttl_seconds: float = 3600,
+        max_stale_seconds: float = 0
+    ):
+        """
+        Args:
+            db_path: 資料庫路徑
+            pool_size: 連線池大小
+            max_rows: 最多保留的快取筆數（超過時依最近存取時間淘汰）
+            max_bytes: 快取資料的總大小上限（bytes）
+            intraday_ttl_seconds: 盤中計算的結果保留秒數（收盤後的結果保留到下一個交易日開盤）
+            max_stale_seconds: 過期後仍可作為 stale 結果回傳的最長秒數（0 表示不使用 stale 結果）
+        """
         self.db_path = db_path
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.intraday_ttl = timedelta(seconds=intraday_ttl_seconds)
+        self.max_stale = timedelta(seconds=max_stale_seconds)
+        self._request_counts: Counter = Counter()
+        self._request_counts_lock = threading.Lock()
+        self.pool = ConnectionPool(db_path, size=pool_size)
+        self.stats = {"evictions": 0, "expired_removed": 0}
+        self._sweeper: Optional[threading.Thread] = None
+        self._sweeper_stop = threading.Event()
         self.init_db()
-    
+
     def init_db(self):
         """初始化資料庫"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS predictions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    symbol TEXT NOT NULL,
-                    days INTEGER NOT NULL,
-                    data TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    expires_at TIMESTAMP NOT NULL
-                )
-            ''')
-            
-            # 建立索引
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_symbol_days 
-                ON predictions(symbol, days)
-            ''')
-            
-            conn.commit()
-            conn.close()
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS predictions (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        symbol TEXT NOT NULL,
+                        days INTEGER NOT NULL,
+                        data TEXT NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        expires_at TIMESTAMP NOT NULL,
+                        last_accessed TIMESTAMP,
+                        size INTEGER NOT NULL DEFAULT 0,
+                        model TEXT NOT NULL DEFAULT 'prophet'
+                    )
+                ''')
+
+                # 舊版資料表升級：補上 LRU 淘汰與預測模型需要的欄位
+                columns = {row[1] for row in cursor.execute('PRAGMA table_info(predictions)')}
+                if 'last_accessed' not in columns:
+                    cursor.execute('ALTER TABLE predictions ADD COLUMN last_accessed TIMESTAMP')
+                if 'size' not in columns:
+                    cursor.execute('ALTER TABLE predictions ADD COLUMN size INTEGER NOT NULL DEFAULT 0')
+                    cursor.execute('UPDATE predictions SET size = length(data)')
+                if 'model' not in columns:
+                    cursor.execute("ALTER TABLE predictions ADD COLUMN model TEXT NOT NULL DEFAULT 'prophet'")
+
+                # 舊版每次都 INSERT，升級為唯一鍵前只保留每個 (symbol, days, model) 最新的一筆
+                cursor.execute('''
+                    DELETE FROM predictions
+                    WHERE id NOT IN (
+                        SELECT MAX(id) FROM predictions GROUP BY symbol, days, model
+                    )
+                ''')
+                cursor.execute('DROP INDEX IF EXISTS idx_symbol_days')
+                cursor.execute('DROP INDEX IF EXISTS idx_predictions_key')
+
+                # 建立索引
+                cursor.execute('''
+                    CREATE UNIQUE INDEX IF NOT EXISTS idx_predictions_model_key
+                    ON predictions(symbol, days, model)
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_predictions_last_accessed
+                    ON predictions(last_accessed)
+                ''')
+                cursor.execute('''
+                    CREATE INDEX IF NOT EXISTS idx_predictions_expires_at
+                    ON predictions(expires_at)
+                ''')
+
+                # 跨行程的預測租約，避免多個 worker 同時訓練相同的模型
+                # （租約只是短暫的狀態，舊版沒有 model 欄位的資料表直接重建）
+                lease_columns = {row[1] for row in cursor.execute('PRAGMA table_info(prediction_leases)')}
+                if lease_columns and 'model' not in lease_columns:
+                    cursor.execute('DROP TABLE prediction_leases')
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS prediction_leases (
+                        symbol TEXT NOT NULL,
+                        days INTEGER NOT NULL,
+                        model TEXT NOT NULL,
+                        owner TEXT NOT NULL,
+                        expires_at TIMESTAMP NOT NULL,
+                        PRIMARY KEY (symbol, days, model)
+                    )
+                ''')
+
+                # 每日的預測請求次數，用於挑選預先計算的熱門股票
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS request_counts (
+                        symbol TEXT NOT NULL,
+                        days INTEGER NOT NULL,
+                        day TEXT NOT NULL,
+                        count INTEGER NOT NULL,
+                        PRIMARY KEY (symbol, days, day)
+                    )
+                ''')
+
             logger.info("Database initialized successfully")
         except Exception as e:
             logger.error(f"Error initializing database: {str(e)}")
-    
-    def get_prediction(self, symbol: str, days: int) -> Optional[Dict[Any, Any]]:
+
+    def get_prediction(self, symbol: str, days: int, model: str = DEFAULT_MODEL) -> Optional[Dict[Any, Any]]:
         """
         從快取取得預測結果
-        
+
         Args:
             symbol: 股票代號
             days: 預測天數
-            
+            model: 預測模型
+
         Returns:
             快取的預測結果，如果不存在或已過期則返回 None
         """
+        entry = self.get_prediction_entry(symbol, days, model)
+        return entry.data if entry else None
+
+    def get_prediction_entry(
+        self,
+        symbol: str,
+        days: int,
+        model: str = DEFAULT_MODEL,
+        allow_stale: bool = False
+    ) -> Optional[CacheEntry]:
+        """
+        從快取取得預測結果與其產生、到期時間
+
+        Args:
+            symbol: 股票代號
+            days: 預測天數
+            model: 預測模型
+            allow_stale: 是否回傳過期未超過 max_stale_seconds 的結果
+
+        Returns:
+            快取項目，如果不存在或已過期則返回 None
+        """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 查詢未過期的快取
-            cursor.execute('''
-                SELECT data FROM predictions
-                WHERE symbol = ? AND days = ? AND expires_at > ?
-                ORDER BY created_at DESC
-                LIMIT 1
-            ''', (symbol, days, datetime.now()))
-            
-            result = cursor.fetchone()
-            conn.close()
-            
+            now = datetime.now()
+            valid_after = now - self.max_stale if allow_stale else now
+            with metrics.timer("cache_get"), self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                # 查詢未過期的快取
+                cursor.execute('''
+                    SELECT id, data, last_accessed, expires_at, created_at FROM predictions
+                    WHERE symbol = ? AND days = ? AND model = ? AND expires_at > ?
+                ''', (symbol, days, model, valid_after))
+
+                result = cursor.fetchone()
+
+                if result and (result[2] is None or now - result[2] > TOUCH_INTERVAL):
+                    cursor.execute('''
+                        UPDATE predictions SET last_accessed = ? WHERE id = ?
+                    ''', (now, result[0]))
+
             if result:
-                logger.info(f"Cache hit for {symbol} ({days} days)")
-                return json.loads(result[0])
-            
-            logger.info(f"Cache miss for {symbol} ({days} days)")
+                logger.info(f"Cache hit for {symbol} ({days} days, {model})")
+                metrics.cache_result("prediction", "stale" if result[3] <= now else "hit")
+                return CacheEntry(result[0], json.loads(result[1]), result[4], result[3])
+
+            logger.info(f"Cache miss for {symbol} ({days} days, {model})")
+            metrics.cache_result("prediction", "miss")
             return None
-        
+
         except Exception as e:
             logger.error(f"Error getting prediction from cache: {str(e)}")
             return None
-    
-    def save_prediction(self, symbol: str, days: int, data: Dict[Any, Any]):
+
+    def get_prediction_meta(self, symbol: str, days: int, model: str = DEFAULT_MODEL) -> Optional[CacheEntry]:
+        """
+        取得快取項目的識別碼、產生與到期時間（不讀取預測內容，也不檢查是否過期）
+
+        Returns:
+            data 為 None 的快取項目，不存在時返回 None
+        """
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, created_at, expires_at FROM predictions
+                    WHERE symbol = ? AND days = ? AND model = ?
+                ''', (symbol, days, model))
+                row = cursor.fetchone()
+
+            return CacheEntry(row[0], None, row[1], row[2]) if row else None
+
+        except Exception as e:
+            logger.error(f"Error getting cache entry metadata: {str(e)}")
+            return None
+
+    def save_prediction(self, symbol: str, days: int, data: Dict[Any, Any], model: str = DEFAULT_MODEL):
         """
-        儲存預測結果到快取
-        
+        儲存預測結果到快取（相同 symbol、days 與 model 的舊資料會被取代）
+
         Args:
             symbol: 股票代號
             days: 預測天數
             data: 預測結果
+            model: 預測模型
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # 設定快取有效期限（1小時）
-            # 股價資料需要更頻繁地更新，特別是在交易時間
-            expires_at = datetime.now() + timedelta(hours=1)
-            
-            cursor.execute('''
-                INSERT INTO predictions (symbol, days, data, expires_at)
-                VALUES (?, ?, ?, ?)
-            ''', (symbol, days, json.dumps(data), expires_at))
-            
-            conn.commit()
-            conn.close()
-            logger.info(f"Saved prediction to cache for {symbol} ({days} days), expires at {expires_at}")
-        
+            now = datetime.now()
+            # 依交易時段設定快取有效期限：盤中只保留 intraday_ttl，收盤後保留到下一個交易日開盤
+            expires_at = cache_expiry(symbol, intraday_ttl=self.intraday_ttl)
+            payload = json.dumps(data)
+
+            with metrics.timer("cache_save"), self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                cursor.execute('''
+                    INSERT INTO predictions (symbol, days, model, data, created_at, expires_at, last_accessed, size)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(symbol, days, model) DO UPDATE SET
+                        data = excluded.data,
+                        created_at = excluded.created_at,
+                        expires_at = excluded.expires_at,
+                        last_accessed = excluded.last_accessed,
+                        size = excluded.size
+                ''', (symbol, days, model, payload, now, expires_at, now, len(payload)))
+
+                self._enforce_limits(cursor)
+
+            logger.info(f"Saved prediction to cache for {symbol} ({days} days, {model}), expires at {expires_at}")
+
         except Exception as e:
             logger.error(f"Error saving prediction to cache: {str(e)}")
-    
+
+    def _enforce_limits(self, cursor):
+        """超過筆數或大小上限時，依最近存取時間淘汰最舊的快取"""
+        evict_ids = []
+
+        if self.max_rows:
+            cursor.execute('SELECT COUNT(*) FROM predictions')
+            excess = cursor.fetchone()[0] - self.max_rows
+            if excess > 0:
+                cursor.execute('''
+                    SELECT id FROM predictions
+                    ORDER BY last_accessed ASC
+                    LIMIT ?
+                ''', (excess,))
+                evict_ids.extend(row[0] for row in cursor.fetchall())
+
+        if self.max_bytes:
+            cursor.execute('SELECT COALESCE(SUM(size), 0) FROM predictions')
+            excess_bytes = cursor.fetchone()[0] - self.max_bytes
+            if excess_bytes > 0:
+                cursor.execute('''
+                    SELECT id, size FROM predictions
+                    ORDER BY last_accessed ASC
+                ''')
+                for row_id, size in cursor:
+                    if excess_bytes <= 0:
+                        break
+                    if row_id not in evict_ids:
+                        evict_ids.append(row_id)
+                        excess_bytes -= size
+
+        if evict_ids:
+            cursor.executemany('DELETE FROM predictions WHERE id = ?', [(row_id,) for row_id in evict_ids])
+            self.stats["evictions"] += len(evict_ids)
+            logger.info(f"Evicted {len(evict_ids)} least recently used cache entries")
+
     def clear_expired(self):
-        """清除過期的快取"""
+        """清除過期（且超過可作為 stale 結果的期限）的快取"""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                DELETE FROM predictions
-                WHERE expires_at < ?
-            ''', (datetime.now(),))
-            
-            deleted_count = cursor.rowcount
-            conn.commit()
-            conn.close()
-            
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                cursor.execute('''
+                    DELETE FROM predictions
+                    WHERE expires_at < ?
+                ''', (datetime.now() - self.max_stale,))
+
+                deleted_count = cursor.rowcount
+
             if deleted_count > 0:
+                self.stats["expired_removed"] += deleted_count
                 logger.info(f"Cleared {deleted_count} expired cache entries")
-        
+
         except Exception as e:
             logger.error(f"Error clearing expired cache: {str(e)}")
-    
-    def clear_symbol_cache(self, symbol: str, days: Optional[int] = None):
+
+    def start_sweeper(self, interval_seconds: float):
+        """
+        啟動背景執行緒，定期清除過期的快取
+
+        Args:
+            interval_seconds: 清除間隔秒數
+        """
+        if self._sweeper is not None:
+            return
+
+        self._sweeper_stop.clear()
+
+        def sweep():
+            while not self._sweeper_stop.wait(interval_seconds):
+                self.clear_expired()
+                self.flush_request_counts()
+
+        self._sweeper = threading.Thread(target=sweep, name="cache-sweeper", daemon=True)
+        self._sweeper.start()
+        logger.info(f"Cache sweeper started (every {interval_seconds} seconds)")
+
+    def stop_sweeper(self):
+        """停止背景清除執行緒"""
+        if self._sweeper is not None:
+            self._sweeper_stop.set()
+            self._sweeper.join(timeout=5)
+            self._sweeper = None
+
+    def clear_symbol_cache(self, symbol: str, days: Optional[int] = None, model: Optional[str] = None):
         """
         清除特定股票的快取
-        
+
         Args:
             symbol: 股票代號
             days: 預測天數（可選，如果不指定則清除該股票所有快取）
+            model: 預測模型（可選，如果不指定則清除所有模型的快取）
         """
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            if days is not None:
-                cursor.execute('''
-                    DELETE FROM predictions
-                    WHERE symbol = ? AND days = ?
-                ''', (symbol, days))
-            else:
-                cursor.execute('''
-                    DELETE FROM predictions
-                    WHERE symbol = ?
-                ''', (symbol,))
-            
-            deleted_count = cursor.rowcount
-            conn.commit()
-            conn.close()
-            
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                query = 'DELETE FROM predictions WHERE symbol = ?'
+                params = [symbol]
+                if days is not None:
+                    query += ' AND days = ?'
+                    params.append(days)
+                if model is not None:
+                    query += ' AND model = ?'
+                    params.append(model)
+                cursor.execute(query, params)
+
+                deleted_count = cursor.rowcount
+
             if deleted_count > 0:
                 logger.info(f"Cleared {deleted_count} cache entries for {symbol}")
-        
+
         except Exception as e:
             logger.error(f"Error clearing symbol cache: {str(e)}")
+
+    def acquire_lease(
+        self,
+        symbol: str,
+        days: int,
+        owner: str,
+        ttl_seconds: float,
+        model: str = DEFAULT_MODEL
+    ) -> bool:
+        """
+        嘗試取得預測租約
+
+        Args:
+            symbol: 股票代號
+            days: 預測天數
+            owner: 租約持有者識別碼
+            ttl_seconds: 租約有效秒數（持有者異常結束時租約會自動過期）
+            model: 預測模型
+
+        Returns:
+            是否成功取得租約
+        """
+        try:
+            now = datetime.now()
+            expires_at = now + timedelta(seconds=ttl_seconds)
+
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                # 只有在沒有租約或既有租約已過期時才會寫入
+                cursor.execute('''
+                    INSERT INTO prediction_leases (symbol, days, model, owner, expires_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(symbol, days, model) DO UPDATE SET
+                        owner = excluded.owner,
+                        expires_at = excluded.expires_at
+                    WHERE prediction_leases.expires_at < ?
+                ''', (symbol, days, model, owner, expires_at, now))
+
+                acquired = cursor.rowcount > 0
+
+            return acquired
+
+        except Exception as e:
+            logger.error(f"Error acquiring prediction lease: {str(e)}")
+            # 租約表無法使用時退回為只做行程內合併
+            return True
+
+    def release_lease(self, symbol: str, days: int, owner: str, model: str = DEFAULT_MODEL):
+        """
+        釋放預測租約
+
+        Args:
+            symbol: 股票代號
+            days: 預測天數
+            owner: 租約持有者識別碼
+            model: 預測模型
+        """
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                cursor.execute('''
+                    DELETE FROM prediction_leases
+                    WHERE symbol = ? AND days = ? AND model = ? AND owner = ?
+                ''', (symbol, days, model, owner))
+
+        except Exception as e:
+            logger.error(f"Error releasing prediction lease: {str(e)}")
+
+    def record_request(self, symbol: str, days: int):
+        """
+        記錄一次預測請求（先累計在記憶體中，由 flush_request_counts 批次寫入）
+
+        Args:
+            symbol: 股票代號
+            days: 預測天數
+        """
+        with self._request_counts_lock:
+            self._request_counts[(symbol, days)] += 1
+
+    def flush_request_counts(self):
+        """將記憶體中的請求次數寫入資料庫，並刪除過舊的統計"""
+        with self._request_counts_lock:
+            counts = self._request_counts
+            self._request_counts = Counter()
+
+        try:
+            today = date.today()
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                if counts:
+                    cursor.executemany('''
+                        INSERT INTO request_counts (symbol, days, day, count)
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT(symbol, days, day) DO UPDATE SET
+                            count = request_counts.count + excluded.count
+                    ''', [(symbol, days, today.isoformat(), count) for (symbol, days), count in counts.items()])
+
+                cursor.execute('''
+                    DELETE FROM request_counts WHERE day < ?
+                ''', ((today - timedelta(days=REQUEST_COUNT_RETENTION_DAYS)).isoformat(),))
+
+        except Exception as e:
+            logger.error(f"Error flushing request counts: {str(e)}")
+
+    def most_requested(self, limit: int, window_days: int = 7) -> List[Tuple[str, int]]:
+        """
+        取得最近一段時間請求次數最多的 (symbol, days)
+
+        Args:
+            limit: 最多返回的項目數
+            window_days: 統計最近幾天的請求
+
+        Returns:
+            依請求次數排序的 (股票代號, 預測天數) 列表
+        """
+        self.flush_request_counts()
+
+        try:
+            since = (date.today() - timedelta(days=window_days)).isoformat()
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT symbol, days FROM request_counts
+                    WHERE day >= ?
+                    GROUP BY symbol, days
+                    ORDER BY SUM(count) DESC
+                    LIMIT ?
+                ''', (since, limit))
+                rows = cursor.fetchall()
+
+            return [(symbol, days) for symbol, days in rows]
+
+        except Exception as e:
+            logger.error(f"Error getting most requested symbols: {str(e)}")
+            return []
+
+    def close(self):
+        """停止背景清除、寫入請求次數並關閉連線池"""
+        self.stop_sweeper()
+        self.flush_request_counts()
+        self.pool.close()
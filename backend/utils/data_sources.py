@@ -0,0 +1,153 @@
+"""
+股價資料來源模組
+定義可替換的資料來源介面，正式環境使用 yfinance，測試時可改用本機 fixture
+"""
+import os
+from abc import ABC, abstractmethod
+from datetime import date
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from utils.market_calendar import market_for
+
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+
+class DataSource(ABC):
+    """股價資料來源介面"""
+
+    name = "base"
+
+    @abstractmethod
+    def fetch(self, symbol: str, start: Optional[date] = None, end: Optional[date] = None) -> pd.DataFrame:
+        """
+        取得日線 OHLCV 資料
+
+        Args:
+            symbol: 股票代號
+            start: 起始日期（包含），None 表示取得全部歷史資料
+            end: 結束日期（不包含），None 表示到最新一筆
+
+        Returns:
+            以交易所時區的 DatetimeIndex 為索引、包含 OHLCV 欄位的 DataFrame
+        """
+
+    def fetch_many(
+        self,
+        symbols: List[str],
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+    ) -> Dict[str, pd.DataFrame]:
+        """
+        一次取得多個股票的日線資料（預設逐一呼叫 fetch，資料來源可覆寫為批次下載）
+
+        Returns:
+            股票代號對應 DataFrame 的字典
+        """
+        return {symbol: self.fetch(symbol, start, end) for symbol in symbols}
+
+    def warm_up(self):
+        """預先匯入資料來源的依賴（預設不需要）"""
+
+
+class YFinanceSource(DataSource):
+    """Yahoo Finance 資料來源"""
+
+    name = "yfinance"
+
+    def warm_up(self):
+        import yfinance  # noqa: F401
+
+    def fetch(self, symbol: str, start: Optional[date] = None, end: Optional[date] = None) -> pd.DataFrame:
+        import yfinance as yf
+
+        stock = yf.Ticker(symbol)
+        if start is None and end is None:
+            df = stock.history(period="max")
+        else:
+            df = stock.history(start=start, end=end)
+
+        if df.empty:
+            return pd.DataFrame(columns=OHLCV_COLUMNS)
+        return df[OHLCV_COLUMNS]
+
+    def fetch_many(
+        self,
+        symbols: List[str],
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+    ) -> Dict[str, pd.DataFrame]:
+        import yfinance as yf
+
+        if len(symbols) == 1:
+            return {symbols[0]: self.fetch(symbols[0], start, end)}
+
+        # 單次批次下載；多市場混合時 yfinance 無法保留各自的時區，索引為不含時區的交易所當地日期，
+        # 逐一標上交易所時區，與單一股票的 Ticker.history 一致
+        if start is None and end is None:
+            data = yf.download(symbols, period="max", group_by="ticker",
+                               auto_adjust=True, progress=False, threads=True)
+        else:
+            data = yf.download(symbols, start=start, end=end, group_by="ticker",
+                               auto_adjust=True, progress=False, threads=True)
+
+        frames = {}
+        for symbol in symbols:
+            if isinstance(data.columns, pd.MultiIndex) and symbol in data.columns.get_level_values(0):
+                df = data[symbol]
+            else:
+                df = pd.DataFrame(columns=OHLCV_COLUMNS)
+            if df.empty:
+                frames[symbol] = df
+                continue
+            df = df[OHLCV_COLUMNS].dropna(subset=['Close'])
+            tz = market_for(symbol).tz
+            df.index = df.index.tz_localize(tz) if df.index.tz is None else df.index.tz_convert(tz)
+            frames[symbol] = df
+        return frames
+
+
+class FixtureSource(DataSource):
+    """
+    本機 CSV fixture 資料來源
+
+    每個股票一個檔案（{directory}/{symbol}.csv），欄位為 Date, Open, High, Low, Close, Volume，
+    Date 可包含時區偏移（例如 yfinance 的 to_csv 輸出）
+    """
+
+    name = "fixture"
+
+    def __init__(self, directory: str, tz: str = "Asia/Taipei"):
+        self.directory = directory
+        self.tz = tz
+
+    def fetch(self, symbol: str, start: Optional[date] = None, end: Optional[date] = None) -> pd.DataFrame:
+        path = os.path.join(self.directory, f"{symbol}.csv")
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=OHLCV_COLUMNS)
+
+        df = pd.read_csv(path)
+        index = pd.to_datetime(df['Date'], utc=True).dt.tz_convert(self.tz)
+        index = index.dt.normalize()
+        df = df[OHLCV_COLUMNS].set_index(pd.DatetimeIndex(index, name='Date'))
+
+        dates = df.index.date
+        mask = pd.Series(True, index=df.index)
+        if start is not None:
+            mask &= dates >= start
+        if end is not None:
+            mask &= dates < end
+        return df[mask.values]
+
+
+def create_data_source() -> DataSource:
+    """
+    依環境變數建立資料來源
+
+    DATA_SOURCE=yfinance（預設）或 fixture（搭配 FIXTURE_DIR）
+    """
+    source = os.getenv("DATA_SOURCE", "yfinance")
+    if source == "fixture":
+        return FixtureSource(os.getenv("FIXTURE_DIR", "fixtures"))
+    return YFinanceSource()
@@ -0,0 +1,169 @@
+"""
+歷史資料降採樣模組
+長期間（5y、10y、max）的日 K 有數千列，遠超過圖表的寬度可以顯示的點數。
+先依 interval 將日 K 合併為週 K 或月 K（技術指標在合併後的解析度上計算），
+超過 max_points 時再以保留 K 線形狀的 OHLC 分組合併或保留折線形狀的 LTTB 縮減到固定點數
+"""
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# K 棒的時間間隔（沿用 yfinance 的寫法）；auto 依 max_points 選擇最細、點數不超過上限的間隔
+INTERVALS = ("auto", "1d", "1wk", "1mo")
+
+# 超過 max_points 時的縮減方式：ohlc（K 線分組合併，預設）、lttb（Largest-Triangle-Three-Buckets 折線取樣）
+DOWNSAMPLE_METHODS = ("ohlc", "lttb")
+
+# max_points 的允許範圍（LTTB 至少需要 3 個點）
+MIN_POINTS = 3
+MAX_POINTS = 5000
+
+# 週 K、月 K 對應的 pandas period
+_PERIODS = {"1wk": "W", "1mo": "M"}
+
+
+def _period_starts(index: pd.DatetimeIndex, interval: str) -> np.ndarray:
+    """每個週期（週或月）第一根日 K 的位置"""
+    if len(index) == 0:
+        return np.zeros(0, dtype=np.int64)
+    periods = index.tz_localize(None).to_period(_PERIODS[interval]).asi8
+    return np.flatnonzero(np.r_[True, periods[1:] != periods[:-1]])
+
+
+def aggregate_bars(df: pd.DataFrame, starts: np.ndarray) -> pd.DataFrame:
+    """
+    將連續的 K 棒分組合併（開盤取第一根、最高與最低取極值、收盤取最後一根、成交量加總）
+
+    Args:
+        df: OHLCV 資料
+        starts: 每組第一根 K 棒的位置（遞增，第一個為 0）
+
+    Returns:
+        合併後的 OHLCV 資料，索引為每組最後一根 K 棒的日期
+    """
+    if len(df) == 0:
+        return df[['Open', 'High', 'Low', 'Close', 'Volume']]
+    ends = np.r_[starts[1:], len(df)] - 1
+    return pd.DataFrame(
+        {
+            'Open': df['Open'].to_numpy(dtype=float)[starts],
+            'High': np.fmax.reduceat(df['High'].to_numpy(dtype=float), starts),
+            'Low': np.fmin.reduceat(df['Low'].to_numpy(dtype=float), starts),
+            'Close': df['Close'].to_numpy(dtype=float)[ends],
+            'Volume': np.add.reduceat(df['Volume'].to_numpy(dtype=float), starts),
+        },
+        index=df.index[ends],
+    )
+
+
+def resample_bars(df: pd.DataFrame, interval: str) -> pd.DataFrame:
+    """
+    將日 K 合併為週 K（1wk）或月 K（1mo），1d 時原樣返回
+
+    以每週（月）實際的最後一個交易日作為日期，與最新一根日 K 的日期一致
+    """
+    if interval == "1d":
+        return df
+    return aggregate_bars(df, _period_starts(df.index, interval))
+
+
+def resolve_interval(index: pd.DatetimeIndex, interval: str, max_points: Optional[int]) -> str:
+    """
+    決定實際使用的 K 棒間隔
+
+    Args:
+        index: 日 K 的日期索引
+        interval: 請求的間隔（auto、1d、1wk、1mo）
+        max_points: 點數上限；interval 為 auto 時選擇點數不超過上限的最細間隔（都超過時使用 1mo）
+    """
+    if interval != "auto":
+        return interval
+    if max_points is None or len(index) <= max_points:
+        return "1d"
+    if len(_period_starts(index, "1wk")) <= max_points:
+        return "1wk"
+    return "1mo"
+
+
+def _bucket_starts(n: int, buckets: int) -> np.ndarray:
+    """將 n 個點平均分為 buckets 組，返回每組的起始位置"""
+    return np.linspace(0, n, buckets + 1).astype(np.int64)[:-1]
+
+
+def lttb_indices(y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets：選出 threshold 個最能保留折線形狀的點
+
+    第一個與最後一個點固定保留；中間的點分為 threshold - 2 組，每組選出與前一個已選點、
+    下一組平均點構成的三角形面積最大的點。x 座標為 K 棒的位置（圖表以交易日等距顯示）
+
+    Args:
+        y: 數值序列（NaN 的點不會被選為代表點）
+        threshold: 輸出的點數
+
+    Returns:
+        選出的位置（遞增）
+    """
+    n = len(y)
+    if threshold >= n or threshold < MIN_POINTS:
+        return np.arange(n)
+
+    y = np.asarray(y, dtype=float)
+    x = np.arange(n, dtype=float)
+    bounds = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = bounds[bucket], bounds[bucket + 1]
+        next_start, next_end = end, bounds[bucket + 2] if bucket + 2 < len(bounds) else n
+        next_x = x[next_start:next_end].mean()
+        next_y = np.nanmean(y[next_start:next_end]) if np.isfinite(y[next_start:next_end]).any() else y[previous]
+
+        area = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        area = np.where(np.isfinite(area), area, -1.0)
+        previous = start + int(np.argmax(area))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def downsample(
+    df: pd.DataFrame,
+    matrix: np.ndarray,
+    max_points: Optional[int],
+    method: str = "ohlc"
+) -> Tuple[pd.DataFrame, np.ndarray]:
+    """
+    將 K 棒與指標矩陣縮減為最多 max_points 列
+
+    - ohlc：K 棒平均分組後合併，指標取每組最後一根 K 棒的數值（與該組的收盤價對應）
+    - lttb：以收盤價的 LTTB 選出的位置取樣 K 棒與指標，不合併數值
+
+    兩種方式都保留最後一根 K 棒，最新的價格與指標數值不變
+
+    Args:
+        df: OHLCV 資料
+        matrix: 與 df 逐列對應的指標矩陣
+        max_points: 點數上限（None 表示不縮減）
+        method: ohlc 或 lttb
+
+    Returns:
+        (縮減後的 OHLCV 資料, 縮減後的指標矩陣)
+    """
+    n = len(df)
+    if max_points is None or n <= max_points:
+        return df, matrix
+
+    if method == "lttb":
+        selected = lttb_indices(df['Close'].to_numpy(dtype=float), max_points)
+        return df.iloc[selected], matrix[selected]
+
+    starts = _bucket_starts(n, max_points)
+    ends = np.r_[starts[1:], n] - 1
+    return aggregate_bars(df, starts), matrix[ends]
@@ -0,0 +1,260 @@
+"""
+背景執行器模組
+將阻塞的 I/O（yfinance 下載）與 CPU 密集的工作（Prophet 訓練）移出 event loop，
+避免單一冷啟動預測卡住同一個 uvicorn worker 上的所有請求（包含 /health）
+"""
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from fastapi import Request
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+def _env_float(name: str, default: float) -> Optional[float]:
+    value = float(os.getenv(name, str(default)))
+    return value if value > 0 else None
+
+
+DISCONNECT_POLL_INTERVAL = float(os.getenv("EXECUTOR_DISCONNECT_POLL_INTERVAL", "0.2"))
+
+
+class ExecutorBusyError(Exception):
+    """執行器的等待佇列已滿"""
+
+
+class TaskTimeoutError(Exception):
+    """背景工作超過允許的執行時間"""
+
+
+class ClientDisconnectedError(Exception):
+    """客戶端在工作完成前中斷連線"""
+
+
+class BoundedPool:
+    """
+    有上限的執行池
+
+    同時存在（執行中 + 排隊中）的工作數超過 max_workers + max_queue 時直接拒絕，
+    而不是無限制地堆積在 executor 內部的佇列
+    """
+
+    def __init__(
+        self,
+        name: str,
+        executor_factory: Callable[[], Executor],
+        max_workers: int,
+        max_queue: int,
+        timeout: Optional[float] = None,
+    ):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor_factory = executor_factory
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """目前執行中與排隊中的工作數"""
+        return self._pending
+
+    @property
+    def queued(self) -> int:
+        """目前排隊等待 worker 的工作數"""
+        return max(0, self._pending - self.max_workers)
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = self._executor_factory()
+            logger.info(f"Started {self.name} pool with {self.max_workers} workers")
+        return self._executor
+
+    async def submit(
+        self,
+        fn: Callable[..., Any],
+        *args,
+        timeout: Optional[float] = None,
+        request: Optional[Request] = None,
+        **kwargs,
+    ) -> Any:
+        """
+        提交工作並等待結果
+
+        Args:
+            fn: 要執行的函式（process pool 需為可 pickle 的模組層級函式）
+            timeout: 逾時秒數（預設使用池的設定）
+            request: 目前的 HTTP 請求，用於偵測客戶端中斷連線
+
+        Raises:
+            ExecutorBusyError: 佇列已滿
+            TaskTimeoutError: 執行逾時
+            ClientDisconnectedError: 客戶端已中斷連線
+        """
+        if self._pending >= self.max_workers + self.max_queue:
+            raise ExecutorBusyError(f"{self.name} pool is saturated ({self._pending} tasks pending)")
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            call = functools.partial(fn, *args, **kwargs)
+            try:
+                future = loop.run_in_executor(self._get_executor(), call)
+            except BrokenProcessPool:
+                # worker 行程異常結束後，重建執行池再提交一次
+                logger.warning(f"{self.name} pool is broken, restarting")
+                self._executor = None
+                future = loop.run_in_executor(self._get_executor(), call)
+
+            try:
+                return await _await_guarded(
+                    future,
+                    timeout if timeout is not None else self.timeout,
+                    request,
+                )
+            except BrokenProcessPool:
+                # 下一次提交時重建執行池
+                self._executor = None
+                raise
+        finally:
+            self._pending -= 1
+
+    def shutdown(self):
+        """關閉執行池並取消尚未開始的工作"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+async def _await_guarded(
+    future: asyncio.Future,
+    timeout: Optional[float],
+    request: Optional[Request],
+) -> Any:
+    """等待 future 完成，同時處理逾時與客戶端中斷連線"""
+    watcher = None
+    if request is not None:
+        watcher = asyncio.ensure_future(wait_for_disconnect(request))
+
+    try:
+        waiters = {future} if watcher is None else {future, watcher}
+        try:
+            done, _ = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+
+        if future in done:
+            return future.result()
+
+        # 取消尚未開始的工作；已在 worker 中執行的工作無法中斷，結果會被丟棄
+        future.cancel()
+        if watcher is not None and watcher in done:
+            raise ClientDisconnectedError("Client disconnected before the task finished")
+        raise TaskTimeoutError(f"Task did not finish within {timeout} seconds")
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+
+
+async def wait_for_disconnect(request: Request):
+    """定期檢查客戶端是否已中斷連線"""
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+
+class ExecutorManager:
+    """
+    管理 I/O 執行池（thread pool）與 CPU 執行池（process pool）
+
+    環境變數：
+        IO_WORKERS / IO_QUEUE_SIZE / IO_TIMEOUT: I/O 執行池設定
+        CPU_WORKERS / CPU_QUEUE_SIZE / CPU_TIMEOUT: CPU 執行池設定
+        CPU_WORKERS=0 時改以 thread pool 執行 CPU 工作
+    """
+
+    def __init__(self, cpu_initializer: Optional[Callable[..., Any]] = None, cpu_initargs: tuple = ()):
+        """
+        Args:
+            cpu_initializer: CPU 執行池每個 worker 啟動時執行的函式（例如預先載入 Prophet）
+            cpu_initargs: cpu_initializer 的參數
+        """
+        io_workers = _env_int("IO_WORKERS", 16)
+        cpu_workers = _env_int("CPU_WORKERS", max(1, (os.cpu_count() or 2) - 1))
+
+        self.io = BoundedPool(
+            "io",
+            lambda: ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="io-worker"),
+            max_workers=io_workers,
+            max_queue=_env_int("IO_QUEUE_SIZE", 64),
+            timeout=_env_float("IO_TIMEOUT", 30),
+        )
+
+        if cpu_workers > 0:
+            cpu_factory = lambda: ProcessPoolExecutor(
+                max_workers=cpu_workers,
+                mp_context=multiprocessing.get_context(os.getenv("CPU_START_METHOD", "spawn")),
+                initializer=cpu_initializer,
+                initargs=cpu_initargs,
+            )
+        else:
+            cpu_workers = 1
+            cpu_factory = lambda: ThreadPoolExecutor(
+                max_workers=1,
+                thread_name_prefix="cpu-worker",
+                initializer=cpu_initializer,
+                initargs=cpu_initargs,
+            )
+
+        self.cpu = BoundedPool(
+            "cpu",
+            cpu_factory,
+            max_workers=cpu_workers,
+            max_queue=_env_int("CPU_QUEUE_SIZE", 16),
+            timeout=_env_float("CPU_TIMEOUT", 120),
+        )
+
+    async def run_io(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """在 thread pool 中執行阻塞的 I/O 工作"""
+        return await self.io.submit(fn, *args, **kwargs)
+
+    async def run_cpu(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """在 process pool 中執行 CPU 密集的工作"""
+        return await self.cpu.submit(fn, *args, **kwargs)
+
+    async def run_cpu_all(self, fn: Callable[..., Any], *args, **kwargs) -> list:
+        """
+        同時提交 worker 數量的工作到 CPU 執行池並等待全部完成
+
+        process pool 在沒有閒置 worker 時每次提交都會啟動一個新行程，
+        因此可用來預先啟動所有 worker 並等待它們的 initializer 完成
+        """
+        return await asyncio.gather(*(self.cpu.submit(fn, *args, **kwargs) for _ in range(self.cpu.max_workers)))
+
+    def stats(self) -> dict:
+        """各執行池目前的工作數"""
+        return {
+            pool.name: {
+                "workers": pool.max_workers,
+                "pending": pool.pending,
+                "queued": pool.queued,
+                "max_queue": pool.max_queue,
+            }
+            for pool in (self.io, self.cpu)
+        }
+
+    def shutdown(self):
+        """關閉所有執行池"""
+        self.io.shutdown()
+        self.cpu.shutdown()
@@ -0,0 +1,455 @@
+"""
+股價預測模組
+定義預測引擎介面：Prophet 以及純 NumPy 的 Holt-Winters、漂移（drift）與 AR(p) 模型，
+所有引擎都回傳相同格式的預測（date, predicted, lower, upper, type），
+設計為可在 process pool 中執行的模組層級函式
+"""
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from itertools import product
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+logger = logging.getLogger(__name__)
+
+# 與 Prophet 預設的 interval_width=0.8 相同的預測區間（常態分布 90 百分位數）
+INTERVAL_Z = 1.2815515655446004
+
+# Prophet 訓練設定檔
+#   weekly_min_days / yearly_min_days: 資料涵蓋的日曆天數達到門檻才加入該週期成分
+#   weekly_order / yearly_order: 週期成分的 Fourier 階數
+#   uncertainty_samples: 預測區間的抽樣次數（predict 的主要成本）
+#   warm_start: 是否以同一股票上一次的模型參數作為最佳化起點
+PROPHET_PROFILES: Dict[str, dict] = {
+    "accurate": {
+        "weekly_min_days": 14,
+        "weekly_order": 3,
+        "yearly_min_days": 730,
+        "yearly_order": 10,
+        "n_changepoints": 25,
+        "uncertainty_samples": 1000,
+        "warm_start": False,
+    },
+    "balanced": {
+        "weekly_min_days": 28,
+        "weekly_order": 3,
+        "yearly_min_days": 730,
+        "yearly_order": 6,
+        "n_changepoints": 25,
+        "uncertainty_samples": 300,
+        "warm_start": True,
+    },
+    "fast": {
+        "weekly_min_days": 56,
+        "weekly_order": 2,
+        "yearly_min_days": 1095,
+        "yearly_order": 4,
+        "n_changepoints": 10,
+        "uncertainty_samples": 100,
+        "warm_start": True,
+    },
+}
+DEFAULT_PROPHET_PROFILE = "balanced"
+
+
+def future_dates(last_date: pd.Timestamp, days: int) -> pd.DatetimeIndex:
+    """最後一筆資料之後的 N 個日期（與 Prophet make_future_dataframe 相同，以日曆日計）"""
+    return pd.date_range(start=last_date + pd.Timedelta(days=1), periods=days, freq="D")
+
+
+def format_predictions(dates: pd.DatetimeIndex, predicted, lower, upper) -> List[dict]:
+    """將預測值轉換為回應使用的預測資料列表"""
+    return [
+        {
+            "date": date,
+            "predicted": p,
+            "lower": lo,
+            "upper": up,
+            "type": "prediction"
+        }
+        for date, p, lo, up in zip(
+            dates.strftime("%Y-%m-%d"),
+            np.round(np.asarray(predicted, dtype=float), 2).tolist(),
+            np.round(np.asarray(lower, dtype=float), 2).tolist(),
+            np.round(np.asarray(upper, dtype=float), 2).tolist()
+        )
+    ]
+
+
+class ForecastEngine(ABC):
+    """預測引擎介面"""
+
+    name = "base"
+    # 是否需要在 process pool 中執行（訓練時間長、會佔用 CPU 的引擎）
+    cpu_bound = False
+    # 是否會使用上一次訓練的模型（previous_model）加速訓練
+    warm_start = False
+
+    @abstractmethod
+    def fit_forecast(
+        self,
+        prophet_df: pd.DataFrame,
+        days: int,
+        previous_model: Optional[str] = None,
+        **options
+    ) -> dict:
+        """
+        訓練模型並預測未來 N 天
+
+        Args:
+            prophet_df: 包含 ds（無時區日期）與 y（收盤價）欄位的 DataFrame
+            days: 預測天數
+            previous_model: 同一股票上一次訓練的模型（可用於 warm start 的引擎才會使用）
+            options: 引擎專屬的設定（例如 Prophet 的 profile）
+
+        Returns:
+            {'predictions': 預測資料列表（date, predicted, lower, upper, type）,
+             'model': 序列化的模型（JSON 字串）,
+             'timings': 各階段秒數（fit、forecast，可省略）}
+        """
+
+
+def prophet_seasonality(prophet_df: pd.DataFrame, profile: dict) -> Dict[str, int]:
+    """
+    依資料的粒度與涵蓋期間決定 Prophet 的週期成分
+
+    日內週期只在資料間隔小於一天時才有意義；週與年週期需要資料涵蓋足夠多個週期才學得到
+
+    Returns:
+        {'daily' / 'weekly' / 'yearly': Fourier 階數}，0 表示不使用
+    """
+    ds = pd.to_datetime(prophet_df['ds'])
+    span_days = (ds.iloc[-1] - ds.iloc[0]) / pd.Timedelta(days=1)
+    granularity = ds.diff().median() / pd.Timedelta(days=1) if len(ds) > 1 else 1.0
+
+    return {
+        "daily": 4 if granularity < 1 else 0,
+        "weekly": profile["weekly_order"] if granularity < 7 and span_days >= profile["weekly_min_days"] else 0,
+        "yearly": profile["yearly_order"] if span_days >= profile["yearly_min_days"] else 0,
+    }
+
+
+def prophet_warm_start(previous_model: Optional[str], seasonality: Dict[str, int], n_changepoints: int) -> Optional[dict]:
+    """
+    由上一次的模型取得 Stan 最佳化的初始參數
+
+    週期成分或變化點數量不同時參數維度不相容，返回 None（改為從頭訓練）
+    """
+    if not previous_model:
+        return None
+    try:
+        from prophet.serialize import model_from_json
+
+        previous = model_from_json(previous_model)
+        previous_orders = {name: s["fourier_order"] for name, s in previous.seasonalities.items()}
+        if previous_orders != {name: order for name, order in seasonality.items() if order}:
+            return None
+        if previous.n_changepoints != n_changepoints or previous.mcmc_samples:
+            return None
+
+        params = {name: previous.params[name][0][0] for name in ("k", "m", "sigma_obs")}
+        params.update({name: previous.params[name][0] for name in ("delta", "beta")})
+        return params
+    except Exception as e:
+        logger.warning(f"Cannot warm start Prophet from previous model: {str(e)}")
+        return None
+
+
+class ProphetEngine(ForecastEngine):
+    """Prophet（cmdstan）模型，依 PROPHET_PROFILES 的設定檔調整週期成分與抽樣次數"""
+
+    name = "prophet"
+    cpu_bound = True
+    warm_start = True
+
+    def fit_forecast(
+        self,
+        prophet_df: pd.DataFrame,
+        days: int,
+        previous_model: Optional[str] = None,
+        profile: str = DEFAULT_PROPHET_PROFILE,
+        **options
+    ) -> dict:
+        from prophet import Prophet
+        from prophet.serialize import model_to_json
+
+        if profile not in PROPHET_PROFILES:
+            raise ValueError(f"不支援的 Prophet 設定檔: {profile}（可用：{', '.join(PROPHET_PROFILES)}）")
+        settings = PROPHET_PROFILES[profile]
+        seasonality = prophet_seasonality(prophet_df, settings)
+
+        # 與 Prophet 相同：訓練資料不足時減少變化點數量
+        history_size = int(np.floor(len(prophet_df) * 0.8))
+        n_changepoints = min(settings["n_changepoints"], max(history_size - 1, 0))
+
+        def build() -> Prophet:
+            return Prophet(
+                daily_seasonality=seasonality["daily"] or False,
+                weekly_seasonality=seasonality["weekly"] or False,
+                yearly_seasonality=seasonality["yearly"] or False,
+                n_changepoints=n_changepoints,
+                uncertainty_samples=settings["uncertainty_samples"]
+            )
+
+        init = None
+        if settings["warm_start"]:
+            init = prophet_warm_start(previous_model, seasonality, n_changepoints)
+
+        started = time.perf_counter()
+        model = build()
+        if init is not None:
+            try:
+                model.fit(prophet_df, init=init)
+            except Exception as e:
+                logger.warning(f"Prophet warm start failed, refitting from scratch: {str(e)}")
+                model = build()
+                model.fit(prophet_df)
+        else:
+            model.fit(prophet_df)
+
+        fitted_at = time.perf_counter()
+
+        # 建立未來日期
+        future = model.make_future_dataframe(periods=days)
+        forecast = model.predict(future)
+        timings = {"fit": fitted_at - started, "forecast": time.perf_counter() - fitted_at}
+
+        # 取得預測資料（未來 N 天）
+        last_date = prophet_df['ds'].iloc[-1]
+        forecast_future = forecast[forecast['ds'] > last_date].head(days)
+
+        prediction_data = format_predictions(
+            pd.DatetimeIndex(forecast_future['ds']),
+            forecast_future['yhat'],
+            forecast_future['yhat_lower'],
+            forecast_future['yhat_upper']
+        )
+        return {"predictions": prediction_data, "model": model_to_json(model), "timings": timings}
+
+
+class HoltWintersEngine(ForecastEngine):
+    """
+    加法 Holt-Winters 指數平滑（水準 + 趨勢 + 週期）
+
+    平滑參數以一步預測誤差平方和最小為準，在網格上一次向量化搜尋
+    """
+
+    name = "holt_winters"
+
+    def __init__(self, season_length: int = 5):
+        """
+        Args:
+            season_length: 週期長度（以 K 棒計，預設 5 個交易日為一週）
+        """
+        self.season_length = season_length
+        self.alphas = np.array([0.1, 0.3, 0.5, 0.7, 0.9])
+        self.betas = np.array([0.01, 0.05, 0.1, 0.2])
+        self.gammas = np.array([0.0, 0.05, 0.1, 0.3])
+
+    def fit_forecast(self, prophet_df: pd.DataFrame, days: int, previous_model: Optional[str] = None, **options) -> dict:
+        y = prophet_df['y'].to_numpy(dtype=float)
+        n = len(y)
+        # 資料不足兩個週期時只使用水準與趨勢
+        m = self.season_length if n >= 2 * self.season_length + 2 else 1
+        if n < m + 2:
+            raise ValueError("資料不足，無法建立 Holt-Winters 模型")
+
+        gammas = self.gammas if m > 1 else np.array([0.0])
+        grid = np.array(list(product(self.alphas, self.betas, gammas)))
+        alpha, beta, gamma = grid.T
+        size = len(grid)
+
+        # 以第一個週期初始化水準、趨勢與週期成分
+        first = y[:m].mean()
+        second = y[m:2 * m].mean() if m > 1 else y[1]
+        level = np.full(size, first)
+        trend = np.full(size, (second - first) / m)
+        seasonal = np.tile(y[:m] - first, (size, 1)) if m > 1 else np.zeros((size, 1))
+        sse = np.zeros(size)
+
+        for t in range(m, n):
+            index = t % m
+            season = seasonal[:, index]
+            error = y[t] - (level + trend + season)
+            sse += error ** 2
+            new_level = alpha * (y[t] - season) + (1 - alpha) * (level + trend)
+            trend = beta * (new_level - level) + (1 - beta) * trend
+            seasonal[:, index] = gamma * (y[t] - new_level) + (1 - gamma) * season
+            level = new_level
+
+        best = int(np.argmin(sse))
+        a, b, g = grid[best]
+        steps = np.arange(1, days + 1)
+        predicted = level[best] + steps * trend[best] + seasonal[best, (n - 1 + steps) % m]
+
+        # Holt 模型的 h 步預測誤差變異數近似
+        sigma = np.sqrt(sse[best] / max(n - m, 1))
+        weights = (a * (1 + np.arange(1, days) * b)) ** 2
+        spread = INTERVAL_Z * sigma * np.sqrt(1 + np.concatenate([[0.0], np.cumsum(weights)]))
+
+        prediction_data = format_predictions(
+            future_dates(prophet_df['ds'].iloc[-1], days), predicted, predicted - spread, predicted + spread
+        )
+        model = {"engine": self.name, "alpha": a, "beta": b, "gamma": g, "season_length": m}
+        return {"predictions": prediction_data, "model": json.dumps(model)}
+
+
+class DriftEngine(ForecastEngine):
+    """隨機漫步加漂移：以首尾連線的斜率外推"""
+
+    name = "drift"
+
+    def fit_forecast(self, prophet_df: pd.DataFrame, days: int, previous_model: Optional[str] = None, **options) -> dict:
+        y = prophet_df['y'].to_numpy(dtype=float)
+        n = len(y)
+        if n < 3:
+            raise ValueError("資料不足，無法建立漂移模型")
+
+        drift = (y[-1] - y[0]) / (n - 1)
+        sigma = np.std(np.diff(y) - drift, ddof=1)
+
+        steps = np.arange(1, days + 1)
+        predicted = y[-1] + steps * drift
+        spread = INTERVAL_Z * sigma * np.sqrt(steps * (1 + steps / (n - 1)))
+
+        prediction_data = format_predictions(
+            future_dates(prophet_df['ds'].iloc[-1], days), predicted, predicted - spread, predicted + spread
+        )
+        model = {"engine": self.name, "drift": drift, "sigma": sigma}
+        return {"predictions": prediction_data, "model": json.dumps(model)}
+
+
+class AREngine(ForecastEngine):
+    """
+    差分後的 AR(p) 模型（即 ARIMA(p,1,0)），以最小平方法估計係數
+    """
+
+    name = "ar"
+
+    def __init__(self, order: int = 5):
+        """
+        Args:
+            order: 自我迴歸階數 p
+        """
+        self.order = order
+
+    def fit_forecast(self, prophet_df: pd.DataFrame, days: int, previous_model: Optional[str] = None, **options) -> dict:
+        y = prophet_df['y'].to_numpy(dtype=float)
+        diffs = np.diff(y)
+        p = min(self.order, (len(diffs) - 2) // 3)
+        if p < 1:
+            raise ValueError("資料不足，無法建立 AR 模型")
+
+        # 每列為 [1, d(t-1), ..., d(t-p)]，目標為 d(t)
+        lags = sliding_window_view(diffs, p)[:-1, ::-1]
+        design = np.column_stack([np.ones(len(lags)), lags])
+        target = diffs[p:]
+        coef, *_ = np.linalg.lstsq(design, target, rcond=None)
+        residuals = target - design @ coef
+        sigma = np.sqrt(residuals @ residuals / max(len(target) - p - 1, 1))
+        intercept, phi = coef[0], coef[1:]
+
+        # 遞迴預測差分，再累加回價格
+        recent = list(diffs[-p:][::-1])
+        predicted_diffs = []
+        for _ in range(days):
+            step = intercept + phi @ np.array(recent[:p])
+            predicted_diffs.append(step)
+            recent.insert(0, step)
+        predicted = y[-1] + np.cumsum(predicted_diffs)
+
+        # 差分序列的 psi 權重累加後即為價格的 h 步預測誤差權重
+        psi = np.zeros(days)
+        psi[0] = 1.0
+        for j in range(1, days):
+            k = min(j, p)
+            psi[j] = phi[:k] @ psi[j - 1::-1][:k]
+        spread = INTERVAL_Z * sigma * np.sqrt(np.cumsum(np.cumsum(psi) ** 2))
+
+        prediction_data = format_predictions(
+            future_dates(prophet_df['ds'].iloc[-1], days), predicted, predicted - spread, predicted + spread
+        )
+        model = {"engine": self.name, "order": p, "intercept": intercept, "phi": phi.tolist(), "sigma": sigma}
+        return {"predictions": prediction_data, "model": json.dumps(model)}
+
+
+ENGINES: Dict[str, ForecastEngine] = {
+    engine.name: engine
+    for engine in (ProphetEngine(), HoltWintersEngine(), DriftEngine(), AREngine())
+}
+
+
+def get_engine(name: str) -> ForecastEngine:
+    """
+    依名稱取得預測引擎
+
+    Raises:
+        ValueError: 不支援的引擎名稱
+    """
+    if name not in ENGINES:
+        raise ValueError(f"不支援的預測模型: {name}（可用：{', '.join(ENGINES)}）")
+    return ENGINES[name]
+
+
+def fit_forecast(
+    engine_name: str,
+    prophet_df: pd.DataFrame,
+    days: int,
+    previous_model: Optional[str] = None,
+    **options
+) -> dict:
+    """以指定的引擎訓練並預測（模組層級函式，可在 process pool 中執行）"""
+    started = time.perf_counter()
+    result = get_engine(engine_name).fit_forecast(prophet_df, days, previous_model, **options)
+    # 無法分開訓練與預測的引擎，整體時間都計為訓練
+    result.setdefault("timings", {"fit": time.perf_counter() - started})
+    return result
+
+
+# 本行程已完成暖機的引擎與花費的秒數
+_WARMED: Dict[str, float] = {}
+
+
+def warm_up_frame(bars: int = 120) -> pd.DataFrame:
+    """暖機用的合成日線收盤價（固定亂數種子的隨機漫步）"""
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range(end="2024-12-31", periods=bars)
+    prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, bars)))
+    return pd.DataFrame({'ds': dates, 'y': prices})
+
+
+def warm_up(engine_names: Optional[List[str]] = None) -> Dict[str, float]:
+    """
+    預先載入預測引擎的依賴並以小型合成資料訓練一次
+
+    Prophet 的第一次訓練需要匯入 prophet / cmdstanpy 並載入編譯好的 Stan 模型，
+    暖機後的請求不必再負擔這段時間。同一行程內重複呼叫直接返回先前的結果，
+    可作為 process pool 的 initializer；失敗只記錄錯誤，不影響 worker 啟動
+
+    Args:
+        engine_names: 要暖機的引擎（預設全部）
+
+    Returns:
+        {引擎名稱: 暖機秒數}（不含失敗的引擎）
+    """
+    names = list(engine_names or ENGINES)
+    frame = None
+    for name in names:
+        if name in _WARMED:
+            continue
+        if frame is None:
+            frame = warm_up_frame()
+        started = time.perf_counter()
+        try:
+            fit_forecast(name, frame, 5)
+        except Exception as e:
+            logger.error(f"Error warming up {name} engine: {str(e)}")
+            continue
+        _WARMED[name] = time.perf_counter() - started
+        logger.info(f"Warmed up {name} engine in {_WARMED[name]:.2f}s")
+    return {name: _WARMED[name] for name in names if name in _WARMED}
@@ -0,0 +1,37 @@
+"""
+HTTP 條件式請求模組
+以少量欄位組成 ETag，客戶端的 If-None-Match 相符時直接回傳 304，
+不需要重新計算指標或序列化回應
+"""
+import hashlib
+from typing import Optional
+
+from fastapi import Response
+
+
+def make_etag(*parts) -> str:
+    """
+    由組成回應的欄位（股票代號、範圍、資料版本等）產生強式 ETag
+
+    Returns:
+        含引號的 ETag 字串
+    """
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """
+    If-None-Match 標頭是否與 ETag 相符（支援多個值、* 與 W/ 前綴）
+    """
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    """304 Not Modified 回應"""
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
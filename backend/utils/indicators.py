@@ -2,8 +2,20 @@
 技術指標計算模組
 使用 pandas 和 numpy 計算各種技術指標
 """
+from typing import Callable, Dict, List, Optional, Tuple
+
 import pandas as pd
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# calculate_all_indicators / compute_indicator_matrix 輸出的指標欄位（依序）
+INDICATOR_COLUMNS = [
+    'sma_20', 'sma_50', 'ema_12', 'ema_26', 'rsi',
+    'macd', 'macd_signal', 'macd_histogram',
+    'bb_upper', 'bb_middle', 'bb_lower',
+    'stoch_k', 'stoch_d',
+    'atr', 'obv', 'adx', 'cci', 'williams_r', 'vwap',
+]
 
 
 def calculate_sma(df: pd.DataFrame, period: int = 20) -> pd.Series:
@@ -141,7 +153,7 @@ def calculate_cci(df: pd.DataFrame, period: int = 20) -> pd.Series:
     """
     tp = (df['High'] + df['Low'] + df['Close']) / 3
     sma_tp = tp.rolling(window=period).mean()
-    mad = tp.rolling(window=period).apply(lambda x: np.abs(x - x.mean()).mean())
+    mad = pd.Series(_rolling_mean_abs_dev(tp.to_numpy(dtype=float), period), index=df.index)
     
     cci = (tp - sma_tp) / (0.015 * mad)
     return cci
@@ -169,6 +181,395 @@ def calculate_vwap(df: pd.DataFrame) -> pd.Series:
     return vwap
 
 
+def _rolling_mean(x: np.ndarray, period: int) -> np.ndarray:
+    """
+    以累積和計算移動平均，視窗內有 NaN 時結果為 NaN（同 pandas rolling(...).mean()）
+    先減去第一個有效值以降低累積和的數值誤差
+    """
+    n = len(x)
+    out = np.full(n, np.nan)
+    if n < period:
+        return out
+
+    valid = ~np.isnan(x)
+    offset = x[valid][0] if valid.any() else 0.0
+    shifted = np.where(valid, x - offset, 0.0)
+
+    sums = np.concatenate(([0.0], np.cumsum(shifted)))
+    nans = np.concatenate(([0], np.cumsum(~valid)))
+    window_sum = sums[period:] - sums[:-period]
+    window_nans = nans[period:] - nans[:-period]
+
+    out[period - 1:] = np.where(window_nans == 0, window_sum / period + offset, np.nan)
+    return out
+
+
+def _rolling_std(x: np.ndarray, period: int) -> np.ndarray:
+    """以累積和與累積平方和計算移動樣本標準差（ddof=1），輸入不可含 NaN"""
+    n = len(x)
+    out = np.full(n, np.nan)
+    if n < period:
+        return out
+
+    centered = x - x.mean()
+    sums = np.concatenate(([0.0], np.cumsum(centered)))
+    squares = np.concatenate(([0.0], np.cumsum(centered * centered)))
+    window_sum = sums[period:] - sums[:-period]
+    window_squares = squares[period:] - squares[:-period]
+
+    variance = (window_squares - window_sum * window_sum / period) / (period - 1)
+    out[period - 1:] = np.sqrt(np.maximum(variance, 0.0))
+    return out
+
+
+def _rolling_max(x: np.ndarray, period: int) -> np.ndarray:
+    """以滑動視窗 view 計算移動最大值"""
+    out = np.full(len(x), np.nan)
+    if len(x) >= period:
+        out[period - 1:] = sliding_window_view(x, period).max(axis=1)
+    return out
+
+
+def _rolling_min(x: np.ndarray, period: int) -> np.ndarray:
+    """以滑動視窗 view 計算移動最小值"""
+    out = np.full(len(x), np.nan)
+    if len(x) >= period:
+        out[period - 1:] = sliding_window_view(x, period).min(axis=1)
+    return out
+
+
+def _rolling_mean_abs_dev(x: np.ndarray, period: int) -> np.ndarray:
+    """移動平均絕對偏差，以滑動視窗 view 一次計算，不需逐視窗呼叫 Python 函式"""
+    out = np.full(len(x), np.nan)
+    if len(x) >= period:
+        windows = sliding_window_view(x, period)
+        means = windows.mean(axis=1)
+        out[period - 1:] = np.abs(windows - means[:, None]).mean(axis=1)
+    return out
+
+
+def _ema(x: np.ndarray, period: int) -> np.ndarray:
+    """指數移動平均（同 ewm(span=period, adjust=False)），遞迴部分交由 pandas 的編譯實作"""
+    return pd.Series(x).ewm(span=period, adjust=False).mean().to_numpy()
+
+
+def _divide(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """與 pandas 相同語意的逐元素除法（除以 0 得到 inf 或 NaN，不發出警告）"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return a / b
+
+
+class IndicatorContext:
+    """
+    單次計算的指標圖
+
+    保存 OHLCV 陣列與已計算的節點；節點以 (名稱, *參數) 為鍵，同一次計算中只會執行一次，
+    不同指標共用的中間結果（EMA、SMA、True Range、典型價格、最高價 / 最低價等）因此不會重複計算
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self._memo: Dict[tuple, np.ndarray] = {
+            ("high",): df['High'].to_numpy(dtype=float),
+            ("low",): df['Low'].to_numpy(dtype=float),
+            ("close",): df['Close'].to_numpy(dtype=float),
+            ("volume",): df['Volume'].to_numpy(dtype=float),
+        }
+
+    def get(self, name: str, *params) -> np.ndarray:
+        """取得節點的值（第一次取得時計算，依賴的節點同樣遞迴取得）"""
+        key = (name, *params)
+        value = self._memo.get(key)
+        if value is None:
+            value = self._memo[key] = NODES[name](self, *params)
+        return value
+
+
+def _prev_close(ctx: IndicatorContext) -> np.ndarray:
+    close = ctx.get("close")
+    return np.concatenate(([np.nan], close[:-1]))
+
+
+def _delta(ctx: IndicatorContext) -> np.ndarray:
+    delta = ctx.get("close") - ctx.get("prev_close")
+    delta[0] = 0.0
+    return delta
+
+
+def _directional_movement(ctx: IndicatorContext) -> tuple:
+    high_diff = np.concatenate(([np.nan], np.diff(ctx.get("high"))))
+    low_diff = np.concatenate(([np.nan], -np.diff(ctx.get("low"))))
+    with np.errstate(invalid='ignore'):
+        plus_dm = np.where((high_diff > low_diff) & (high_diff > 0), high_diff, 0.0)
+        minus_dm = np.where((low_diff > high_diff) & (low_diff > 0), low_diff, 0.0)
+    return plus_dm, minus_dm
+
+
+def _true_range(ctx: IndicatorContext) -> np.ndarray:
+    high, low, prev_close = ctx.get("high"), ctx.get("low"), ctx.get("prev_close")
+    return np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+
+
+def _stoch_k(ctx: IndicatorContext, period: int) -> np.ndarray:
+    highest = ctx.get("max", "high", period)
+    lowest = ctx.get("min", "low", period)
+    return 100 * _divide(ctx.get("close") - lowest, highest - lowest)
+
+
+def _dx(ctx: IndicatorContext, period: int) -> np.ndarray:
+    tr_mean = ctx.get("mean", "true_range", period)
+    plus_di = 100 * _divide(ctx.get("mean", "plus_dm", period), tr_mean)
+    minus_di = 100 * _divide(ctx.get("mean", "minus_dm", period), tr_mean)
+    return 100 * _divide(np.abs(plus_di - minus_di), plus_di + minus_di)
+
+
+# 指標圖的中間節點：名稱 -> 計算函式(ctx, *參數)
+# mean / ema / std / max / min / mad 的第一個參數為來源節點名稱，第二個為期間
+NODES: Dict[str, Callable[..., np.ndarray]] = {
+    "prev_close": _prev_close,
+    "delta": _delta,
+    "gain": lambda ctx: np.where(ctx.get("delta") > 0, ctx.get("delta"), 0.0),
+    "loss": lambda ctx: np.where(ctx.get("delta") < 0, -ctx.get("delta"), 0.0),
+    "typical_price": lambda ctx: (ctx.get("high") + ctx.get("low") + ctx.get("close")) / 3,
+    "true_range": _true_range,
+    "directional_movement": _directional_movement,
+    "plus_dm": lambda ctx: ctx.get("directional_movement")[0],
+    "minus_dm": lambda ctx: ctx.get("directional_movement")[1],
+    "mean": lambda ctx, source, period: _rolling_mean(ctx.get(source), period),
+    "ema": lambda ctx, source, period: _ema(ctx.get(source), period),
+    "std": lambda ctx, source, period: _rolling_std(ctx.get(source), period),
+    "max": lambda ctx, source, period: _rolling_max(ctx.get(source), period),
+    "min": lambda ctx, source, period: _rolling_min(ctx.get(source), period),
+    "mad": lambda ctx, source, period: _rolling_mean_abs_dev(ctx.get(source), period),
+    "macd_line": lambda ctx, fast, slow: ctx.get("ema", "close", fast) - ctx.get("ema", "close", slow),
+    "macd_signal": lambda ctx, fast, slow, signal: _ema(ctx.get("macd_line", fast, slow), signal),
+    "stoch_k": _stoch_k,
+    "stoch_d": lambda ctx, k_period, d_period: _rolling_mean(ctx.get("stoch_k", k_period), d_period),
+    "dx": _dx,
+}
+
+
+def _rsi(ctx: IndicatorContext, period: int) -> tuple:
+    gain = ctx.get("mean", "gain", period)
+    loss = ctx.get("mean", "loss", period)
+    return (100 - (100 / (1 + _divide(gain, loss))),)
+
+
+def _macd(ctx: IndicatorContext, fast: int, slow: int, signal: int) -> tuple:
+    macd = ctx.get("macd_line", fast, slow)
+    macd_signal = ctx.get("macd_signal", fast, slow, signal)
+    return macd, macd_signal, macd - macd_signal
+
+
+def _bollinger_bands(ctx: IndicatorContext, period: int, std_dev: float) -> tuple:
+    middle = ctx.get("mean", "close", period)
+    std = ctx.get("std", "close", period)
+    return middle + std * std_dev, middle, middle - std * std_dev
+
+
+def _williams_r(ctx: IndicatorContext, period: int) -> tuple:
+    highest = ctx.get("max", "high", period)
+    lowest = ctx.get("min", "low", period)
+    return (-100 * _divide(highest - ctx.get("close"), highest - lowest),)
+
+
+def _cci(ctx: IndicatorContext, period: int) -> tuple:
+    typical_price = ctx.get("typical_price")
+    return (_divide(
+        typical_price - ctx.get("mean", "typical_price", period),
+        0.015 * ctx.get("mad", "typical_price", period)
+    ),)
+
+
+def _vwap(ctx: IndicatorContext) -> tuple:
+    volume = ctx.get("volume")
+    return (_divide(np.cumsum(ctx.get("typical_price") * volume), np.cumsum(volume)),)
+
+
+class IndicatorSpec:
+    """可選取的技術指標"""
+
+    def __init__(
+        self,
+        outputs: Tuple[str, ...],
+        compute: Callable[..., tuple],
+        defaults: tuple = (),
+        presets: Optional[List[tuple]] = None,
+        suffix_defaults: bool = False,
+        min_period: int = 1
+    ):
+        """
+        Args:
+            outputs: 輸出欄位的名稱（依 compute 回傳的順序）
+            compute: compute(ctx, *參數) 返回各輸出欄位的陣列
+            defaults: 參數預設值（型別決定參數解析為整數或小數）
+            presets: 未指定參數時計算的參數組合（預設只有 defaults）
+            suffix_defaults: 預設參數的欄位是否也加上參數後綴（sma_20、ema_12）
+            min_period: 整數參數的最小值
+        """
+        self.outputs = outputs
+        self.compute = compute
+        self.defaults = defaults
+        self.presets = presets or [defaults]
+        self.suffix_defaults = suffix_defaults
+        self.min_period = min_period
+
+    def column_names(self, params: tuple) -> List[str]:
+        """指定參數的輸出欄位名稱（預設參數沿用原本的名稱，其他參數加上後綴，例如 rsi_7）"""
+        if params == self.defaults and not self.suffix_defaults:
+            return list(self.outputs)
+        suffix = "_".join(f"{param:g}" if isinstance(param, float) else str(param) for param in params)
+        return [f"{output}_{suffix}" for output in self.outputs]
+
+
+# 可由 ?indicators= 選取的指標（順序即未指定時的輸出順序，與 INDICATOR_COLUMNS 相同）
+INDICATORS: Dict[str, IndicatorSpec] = {
+    "sma": IndicatorSpec(
+        ("sma",), lambda ctx, period: (ctx.get("mean", "close", period),),
+        defaults=(20,), presets=[(20,), (50,)], suffix_defaults=True
+    ),
+    "ema": IndicatorSpec(
+        ("ema",), lambda ctx, period: (ctx.get("ema", "close", period),),
+        defaults=(12,), presets=[(12,), (26,)], suffix_defaults=True
+    ),
+    "rsi": IndicatorSpec(("rsi",), _rsi, defaults=(14,)),
+    "macd": IndicatorSpec(("macd", "macd_signal", "macd_histogram"), _macd, defaults=(12, 26, 9)),
+    "bb": IndicatorSpec(("bb_upper", "bb_middle", "bb_lower"), _bollinger_bands, defaults=(20, 2.0), min_period=2),
+    "stoch": IndicatorSpec(
+        ("stoch_k", "stoch_d"),
+        lambda ctx, k_period, d_period: (ctx.get("stoch_k", k_period), ctx.get("stoch_d", k_period, d_period)),
+        defaults=(14, 3)
+    ),
+    "atr": IndicatorSpec(("atr",), lambda ctx, period: (ctx.get("mean", "true_range", period),), defaults=(14,)),
+    "obv": IndicatorSpec(("obv",), lambda ctx: (np.cumsum(np.sign(ctx.get("delta")) * ctx.get("volume")),)),
+    "adx": IndicatorSpec(("adx",), lambda ctx, period: (_rolling_mean(ctx.get("dx", period), period),), defaults=(14,)),
+    "cci": IndicatorSpec(("cci",), _cci, defaults=(20,)),
+    "williams_r": IndicatorSpec(("williams_r",), _williams_r, defaults=(14,)),
+    "vwap": IndicatorSpec(("vwap",), _vwap),
+}
+
+# 未指定 ?indicators= 時計算的選取項目：(指標名稱, 參數, 欄位名稱或 None 表示全部輸出)
+DEFAULT_SELECTION: List[tuple] = [
+    (name, params, None) for name, spec in INDICATORS.items() for params in spec.presets
+]
+
+# 既有的欄位名稱（sma_20、macd_signal…）對應的選取項目，可直接作為 ?indicators= 的值
+COLUMN_ALIASES: Dict[str, tuple] = {
+    column: (name, params, column)
+    for name, params, _ in DEFAULT_SELECTION
+    for column in INDICATORS[name].column_names(params)
+}
+
+MAX_INDICATOR_PERIOD = 1000
+MAX_SELECTED_INDICATORS = 32
+
+
+def _parse_param(value: str, default, spec: IndicatorSpec):
+    if isinstance(default, float):
+        param = float(value)
+        if not 0 < param <= 10:
+            raise ValueError
+        return param
+    param = int(value)
+    if not spec.min_period <= param <= MAX_INDICATOR_PERIOD:
+        raise ValueError
+    return param
+
+
+def parse_indicators(spec: Optional[str]) -> Optional[List[tuple]]:
+    """
+    解析 ?indicators= 參數（以逗號分隔）
+
+    - 指標名稱（rsi、macd、bb…）：使用預設參數，sma 與 ema 分別為 20、50 與 12、26 兩組
+    - 名稱加參數（sma:100、rsi:7、macd:5:35:5、bb:20:2.5）：未提供的參數使用預設值
+    - 既有的欄位名稱（sma_20、macd_signal…）：只輸出該欄位
+
+    Returns:
+        選取項目 [(指標名稱, 參數, 欄位名稱或 None)]；未指定時返回 None（全部指標）
+
+    Raises:
+        ValueError: 不支援的指標或參數
+    """
+    if spec is None or not spec.strip():
+        return None
+
+    tokens = [token.strip().lower() for token in spec.split(",") if token.strip()]
+    if len(tokens) > MAX_SELECTED_INDICATORS:
+        raise ValueError(f"單次最多選取 {MAX_SELECTED_INDICATORS} 個技術指標")
+
+    selection = []
+    for token in tokens:
+        if token in COLUMN_ALIASES and token not in INDICATORS:
+            selection.append(COLUMN_ALIASES[token])
+            continue
+
+        name, *values = token.split(":")
+        indicator = INDICATORS.get(name)
+        if indicator is None:
+            raise ValueError(f"不支援的技術指標: {name}（可用：{', '.join(INDICATORS)}）")
+        if not values:
+            selection.extend((name, params, None) for params in indicator.presets)
+            continue
+        if len(values) > len(indicator.defaults):
+            raise ValueError(f"技術指標 {name} 最多接受 {len(indicator.defaults)} 個參數")
+        try:
+            params = tuple(
+                _parse_param(value, default, indicator) for value, default in zip(values, indicator.defaults)
+            )
+        except ValueError:
+            raise ValueError(f"技術指標參數無效: {token}")
+        selection.append((name, params + indicator.defaults[len(params):], None))
+
+    return selection
+
+
+def selection_key(selection: Optional[List[tuple]]) -> str:
+    """選取項目的正規化字串（輸出欄位名稱以逗號連接），用於快取鍵與 ETag；全部指標時為空字串"""
+    if selection is None:
+        return ""
+    return ",".join(selection_columns(selection))
+
+
+def selection_columns(selection: List[tuple]) -> List[str]:
+    """選取項目的輸出欄位名稱（依序、不重複）"""
+    columns = []
+    for name, params, column in selection:
+        names = [column] if column else INDICATORS[name].column_names(params)
+        columns.extend(name for name in names if name not in columns)
+    return columns
+
+
+def compute_indicator_matrix(df: pd.DataFrame, selection: Optional[List[tuple]] = None) -> tuple:
+    """
+    計算選取的技術指標
+    
+    以指標圖計算：每個選取項目只取得它需要的節點，共用的中間結果（EMA、SMA、True Range、
+    典型價格、最高價 / 最低價）在同一次計算中只計算一次
+    
+    Args:
+        df: 包含 OHLCV 資料的 DataFrame
+        selection: parse_indicators 的選取項目（None 表示全部指標，欄位同 INDICATOR_COLUMNS）
+        
+    Returns:
+        (matrix, columns)：matrix 為 (列數, 指標數) 的 float 陣列，
+        columns 為指標名稱對應欄位索引的字典
+    """
+    selection = DEFAULT_SELECTION if selection is None else selection
+    columns = {name: i for i, name in enumerate(selection_columns(selection))}
+    matrix = np.full((len(df), len(columns)), np.nan)
+    if len(df) == 0:
+        return matrix, columns
+
+    ctx = IndicatorContext(df)
+    for name, params, column in selection:
+        indicator = INDICATORS[name]
+        values = indicator.compute(ctx, *params)
+        for output, value in zip(indicator.column_names(params), values):
+            if column is None or output == column:
+                matrix[:, columns[output]] = value
+
+    return matrix, columns
+
+
 def calculate_all_indicators(df: pd.DataFrame) -> dict:
     """
     計算所有技術指標
@@ -182,39 +583,9 @@ def calculate_all_indicators(df: pd.DataFrame) -> dict:
     indicators = {}
     
     try:
-        # 移動平均線
-        indicators['sma_20'] = calculate_sma(df, 20)
-        indicators['sma_50'] = calculate_sma(df, 50)
-        indicators['ema_12'] = calculate_ema(df, 12)
-        indicators['ema_26'] = calculate_ema(df, 26)
-        
-        # RSI
-        indicators['rsi'] = calculate_rsi(df, 14)
-        
-        # MACD
-        macd_data = calculate_macd(df)
-        indicators['macd'] = macd_data['macd']
-        indicators['macd_signal'] = macd_data['signal']
-        indicators['macd_histogram'] = macd_data['histogram']
-        
-        # 布林通道
-        bb_data = calculate_bollinger_bands(df)
-        indicators['bb_upper'] = bb_data['upper']
-        indicators['bb_middle'] = bb_data['middle']
-        indicators['bb_lower'] = bb_data['lower']
-        
-        # 隨機指標
-        stoch_data = calculate_stochastic(df)
-        indicators['stoch_k'] = stoch_data['k']
-        indicators['stoch_d'] = stoch_data['d']
-        
-        # 其他指標
-        indicators['atr'] = calculate_atr(df, 14)
-        indicators['obv'] = calculate_obv(df)
-        indicators['adx'] = calculate_adx(df, 14)
-        indicators['cci'] = calculate_cci(df, 20)
-        indicators['williams_r'] = calculate_williams_r(df, 14)
-        indicators['vwap'] = calculate_vwap(df)
+        matrix, columns = compute_indicator_matrix(df)
+        for key, idx in columns.items():
+            indicators[key] = pd.Series(matrix[:, idx], index=df.index)
         
     except Exception as e:
         print(f"計算指標時發生錯誤: {str(e)}")
@@ -222,14 +593,19 @@ def calculate_all_indicators(df: pd.DataFrame) -> dict:
     return indicators
 
 
-def get_latest_indicators(df: pd.DataFrame) -> dict:
+def get_latest_indicators(df: pd.DataFrame, indicators: dict = None) -> dict:
     """
     取得最新的技術指標數值（用於顯示）
     
+    Args:
+        df: 原始數據 DataFrame
+        indicators: 已計算好的指標字典（可選，避免重複計算）
+    
     Returns:
         包含最新指標值的字典
     """
-    indicators = calculate_all_indicators(df)
+    if indicators is None:
+        indicators = calculate_all_indicators(df)
     latest = {}
     
     for key, series in indicators.items():
@@ -242,6 +618,33 @@ def get_latest_indicators(df: pd.DataFrame) -> dict:
     return latest
 
 
+def latest_indicators_from_matrix(matrix: np.ndarray, columns: dict) -> dict:
+    """
+    從指標矩陣取得每個指標最後一個有效值
+    
+    Args:
+        matrix: compute_indicator_matrix 回傳的指標矩陣
+        columns: 指標名稱對應欄位索引的字典
+        
+    Returns:
+        包含最新指標值的字典（與 get_latest_indicators 相同格式）
+    """
+    if len(matrix) == 0:
+        return {}
+    
+    finite = np.isfinite(matrix)
+    # 每個欄位最後一個有限值的列索引
+    last_rows = len(matrix) - 1 - np.argmax(finite[::-1], axis=0)
+    has_value = finite.any(axis=0)
+    
+    latest = {}
+    for key, idx in columns.items():
+        if has_value[idx]:
+            latest[key] = round(float(matrix[last_rows[idx], idx]), 2)
+    
+    return latest
+
+
 def format_indicators_for_chart(df: pd.DataFrame, indicators: dict) -> list:
     """
     將指標格式化為圖表可用的格式
@@ -253,20 +656,39 @@ def format_indicators_for_chart(df: pd.DataFrame, indicators: dict) -> list:
     Returns:
         格式化後的指標列表
     """
-    formatted = []
+    keys = [key for key, series in indicators.items() if series is not None]
+    if not keys:
+        return [{'date': date} for date in df.index.strftime('%Y-%m-%d')]
     
-    for idx, date in enumerate(df.index):
-        point = {
-            'date': date.strftime('%Y-%m-%d')
-        }
-        
-        # 添加每個指標的值
-        for key, series in indicators.items():
-            if series is not None and idx < len(series):
-                value = series.iloc[idx]
-                if not np.isnan(value):
-                    point[key] = round(float(value), 2)
+    matrix = np.column_stack([
+        np.asarray(indicators[key], dtype=float)[:len(df)] for key in keys
+    ])
+    return format_indicator_matrix_for_chart(df, matrix, {key: i for i, key in enumerate(keys)})
+
+
+def format_indicator_matrix_for_chart(df: pd.DataFrame, matrix: np.ndarray, columns: dict) -> list:
+    """
+    將指標矩陣格式化為圖表可用的格式
+    
+    以向量化方式四捨五入並遮罩 NaN，每列只輸出有值的指標
+    
+    Args:
+        df: 原始數據 DataFrame
+        matrix: compute_indicator_matrix 回傳的指標矩陣
+        columns: 指標名稱對應欄位索引的字典
         
+    Returns:
+        格式化後的指標列表
+    """
+    keys = list(columns.keys())
+    values = matrix[:, [columns[key] for key in keys]]
+    rounded = np.round(values, 2).tolist()
+    finite = np.isfinite(values).tolist()
+    
+    formatted = []
+    for date, row, mask in zip(df.index.strftime('%Y-%m-%d'), rounded, finite):
+        point = {'date': date}
+        point.update((key, value) for key, value, ok in zip(keys, row, mask) if ok)
         formatted.append(point)
     
     return formatted
@@ -0,0 +1,148 @@
+"""
+交易所行事曆模組
+依股票代號後綴判斷交易所，計算交易時段與快取到期時間：
+盤中的結果只保留一段時間，收盤且資料定案後的結果可一直用到下一個交易日開盤
+"""
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, Optional, Tuple
+
+import pytz
+
+try:
+    import holidays as holidays_lib
+except ImportError:  # pragma: no cover - holidays 為 prophet 的相依套件，通常都已安裝
+    holidays_lib = None
+
+
+class Market:
+    """單一交易所的交易時段與休市日"""
+
+    def __init__(
+        self,
+        code: str,
+        timezone_name: str,
+        open_time: time,
+        close_time: time,
+        holiday_calendar: Optional[str] = None,
+        settle_minutes: int = 30
+    ):
+        """
+        Args:
+            code: 交易所代碼
+            timezone_name: 交易所時區
+            open_time: 開盤時間（當地時間）
+            close_time: 收盤時間（當地時間）
+            holiday_calendar: holidays 套件的交易所休市日代碼（例如 XTAI、XNYS）
+            settle_minutes: 收盤後多久資料來源的日 K 才會定案
+        """
+        self.code = code
+        self.tz = pytz.timezone(timezone_name)
+        self.open_time = open_time
+        self.close_time = close_time
+        self.holiday_calendar = holiday_calendar
+        self.settle_delay = timedelta(minutes=settle_minutes)
+        self._holidays: Dict[int, set] = {}
+
+    def _holidays_for(self, year: int) -> set:
+        if year not in self._holidays:
+            days = set()
+            if holidays_lib is not None and self.holiday_calendar:
+                days = set(holidays_lib.financial_holidays(self.holiday_calendar, years=year))
+            self._holidays[year] = days
+        return self._holidays[year]
+
+    def is_trading_day(self, day: date) -> bool:
+        """是否為交易日（週一至週五且非休市日）"""
+        return day.weekday() < 5 and day not in self._holidays_for(day.year)
+
+    def session(self, day: date) -> Tuple[datetime, datetime]:
+        """指定日期的開盤與收盤時間（含時區）"""
+        return (
+            self.tz.localize(datetime.combine(day, self.open_time)),
+            self.tz.localize(datetime.combine(day, self.close_time)),
+        )
+
+    def next_trading_day(self, day: date) -> date:
+        """指定日期之後的下一個交易日"""
+        day += timedelta(days=1)
+        while not self.is_trading_day(day):
+            day += timedelta(days=1)
+        return day
+
+    def is_open(self, now: Optional[datetime] = None) -> bool:
+        """目前是否在交易時段內"""
+        local = self._local(now)
+        if not self.is_trading_day(local.date()):
+            return False
+        open_at, close_at = self.session(local.date())
+        return open_at <= local < close_at
+
+    def expiry(self, now: Optional[datetime] = None, intraday_ttl: timedelta = timedelta(hours=1)) -> datetime:
+        """
+        以 now 的資料計算出的結果可以使用到什麼時候
+
+        盤中：intraday_ttl 之後（不超過收盤資料定案的時間）；
+        收盤後資料定案前：到定案時間；其餘時間：到下一個交易日開盤
+
+        Returns:
+            含時區的到期時間
+        """
+        local = self._local(now)
+        today = local.date()
+
+        if self.is_trading_day(today):
+            open_at, close_at = self.session(today)
+            settled_at = close_at + self.settle_delay
+            if local < open_at:
+                return open_at
+            if local < close_at:
+                return min(local + intraday_ttl, settled_at)
+            if local < settled_at:
+                return settled_at
+
+        return self.session(self.next_trading_day(today))[0]
+
+    def next_settle(self, now: Optional[datetime] = None) -> datetime:
+        """下一次收盤資料定案的時間（預先計算的排程時間）"""
+        local = self._local(now)
+        day = local.date()
+        if self.is_trading_day(day):
+            settled_at = self.session(day)[1] + self.settle_delay
+            if local < settled_at:
+                return settled_at
+        return self.session(self.next_trading_day(day))[1] + self.settle_delay
+
+    def _local(self, now: Optional[datetime]) -> datetime:
+        now = now or datetime.now(timezone.utc)
+        if now.tzinfo is None:
+            now = now.astimezone()
+        return now.astimezone(self.tz)
+
+
+MARKETS: Dict[str, Market] = {
+    "TW": Market("TW", "Asia/Taipei", time(9, 0), time(13, 30), "XTAI"),
+    "US": Market("US", "America/New_York", time(9, 30), time(16, 0), "XNYS"),
+}
+
+# 股票代號後綴對應的交易所，沒有後綴的代號視為美股
+SUFFIX_MARKETS = {
+    ".TW": "TW",
+    ".TWO": "TW",
+}
+DEFAULT_MARKET = "US"
+
+
+def market_for(symbol: str) -> Market:
+    """依股票代號後綴取得交易所"""
+    upper = symbol.upper()
+    for suffix, code in SUFFIX_MARKETS.items():
+        if upper.endswith(suffix):
+            return MARKETS[code]
+    return MARKETS[DEFAULT_MARKET]
+
+
+def cache_expiry(symbol: str, now: Optional[datetime] = None, intraday_ttl: timedelta = timedelta(hours=1)) -> datetime:
+    """
+    股票結果快取的到期時間（本地時間、不含時區，與 SQLite 快取的時間欄位一致）
+    """
+    return market_for(symbol).expiry(now, intraday_ttl).astimezone().replace(tzinfo=None)
@@ -0,0 +1,238 @@
+"""
+效能指標模組
+記錄各處理階段與各端點的延遲直方圖、快取命中與上游下載結果的計數，
+並以 Prometheus 文字格式輸出；停用時 timer() 回傳共用的空 context manager，幾乎沒有額外成本
+"""
+import bisect
+import threading
+import time
+from contextlib import nullcontext
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# 延遲直方圖的分界（秒），涵蓋快取命中的數百微秒到 Prophet 訓練的數十秒
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+_NOOP = nullcontext()
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """依標籤分組的延遲直方圖"""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str):
+        """記錄一次觀測值"""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                # 每個分界的計數（最後一格為 +Inf）、總和
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+
+        for labelvalues, counts, total in sorted(snapshot):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labelvalues, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labelvalues)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labelvalues)} {cumulative}")
+        return lines
+
+
+class Counter:
+    """依標籤分組的累加計數器"""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues: str, amount: float = 1):
+        """累加計數"""
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def snapshot(self) -> Dict[Tuple[str, ...], float]:
+        """目前各標籤組合的數值"""
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        snapshot = sorted(self.snapshot().items())
+        for labelvalues, value in snapshot:
+            lines.append(f"{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}")
+        return lines
+
+
+class Callback:
+    """輸出時才讀取的數值（例如執行池佇列長度），平時沒有任何成本"""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        callback: Callable[[], Dict[Tuple[str, ...], float]],
+        labelnames: Sequence[str] = (),
+        type: str = "gauge"
+    ):
+        """
+        Args:
+            name: 指標名稱
+            help: 說明
+            callback: 返回 {標籤值 tuple: 數值} 的函式
+            labelnames: 標籤名稱
+            type: Prometheus 指標類型（gauge 或 counter）
+        """
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+        self.type = type
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for labelvalues, value in sorted(self.callback().items()):
+            if value is None:
+                continue
+            lines.append(f"{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}")
+        return lines
+
+
+class _StageTimer:
+    """記錄 with 區塊執行時間的 context manager"""
+
+    __slots__ = ("histogram", "stage", "started")
+
+    def __init__(self, histogram: Histogram, stage: str):
+        self.histogram = histogram
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, self.stage)
+        return False
+
+
+class MetricsRegistry:
+    """
+    指標登錄
+
+    預設停用：timer() 回傳空的 context manager，其餘記錄方法直接返回；
+    enable() 之後才開始記錄
+    """
+
+    def __init__(self, namespace: str = "stock_insight"):
+        self.namespace = namespace
+        self.enabled = False
+        self.stage_seconds = Histogram(
+            f"{namespace}_stage_seconds", "Time spent in each processing stage", ("stage",)
+        )
+        self.request_seconds = Histogram(
+            f"{namespace}_request_seconds", "HTTP request latency by endpoint", ("method", "endpoint", "status")
+        )
+        self.cache_requests = Counter(
+            f"{namespace}_cache_requests_total", "Cache lookups by result (hit, miss, stale)", ("cache", "result")
+        )
+        self.upstream_fetches = Counter(
+            f"{namespace}_upstream_fetch_total", "Upstream data source fetches by result (ok, error)", ("source", "result")
+        )
+        self._callbacks: List[Callback] = []
+
+    def enable(self, enabled: bool = True):
+        """開始（或停止）記錄"""
+        self.enabled = enabled
+
+    def timer(self, stage: str):
+        """
+        計時 context manager
+
+        Example:
+            with metrics.timer("indicators"):
+                compute_indicator_matrix(df)
+        """
+        if not self.enabled:
+            return _NOOP
+        return _StageTimer(self.stage_seconds, stage)
+
+    def observe_stage(self, stage: str, seconds: float):
+        """記錄在其他地方量測的階段時間（例如 process pool 回傳的訓練時間）"""
+        if self.enabled:
+            self.stage_seconds.observe(seconds, stage)
+
+    def observe_request(self, method: str, endpoint: str, status: int, seconds: float):
+        """記錄一次 HTTP 請求的延遲"""
+        if self.enabled:
+            self.request_seconds.observe(seconds, method, endpoint, str(status))
+
+    def cache_result(self, cache: str, result: str):
+        """記錄一次快取查詢的結果"""
+        if self.enabled:
+            self.cache_requests.inc(cache, result)
+
+    def upstream_result(self, source: str, ok: bool):
+        """記錄一次上游資料下載的結果"""
+        if self.enabled:
+            self.upstream_fetches.inc(source, "ok" if ok else "error")
+
+    def register_callback(
+        self,
+        name: str,
+        help: str,
+        callback: Callable[[], Dict[Tuple[str, ...], float]],
+        labelnames: Iterable[str] = (),
+        type: str = "gauge"
+    ):
+        """登錄輸出時才讀取的數值（名稱會加上 namespace 前綴）"""
+        self._callbacks.append(Callback(f"{self.namespace}_{name}", help, callback, tuple(labelnames), type))
+
+    def render(self) -> str:
+        """以 Prometheus 文字格式（0.0.4）輸出所有指標"""
+        lines: List[str] = []
+        for metric in (self.stage_seconds, self.request_seconds, self.cache_requests, self.upstream_fetches):
+            lines.extend(metric.render())
+        for callback in self._callbacks:
+            lines.extend(callback.render())
+        return "\n".join(lines) + "\n"
+
+
+# 全域指標登錄，由 main 依 METRICS_ENABLED 啟用
+metrics = MetricsRegistry()
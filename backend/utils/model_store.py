@@ -0,0 +1,159 @@
+"""
+已訓練模型與預測結果的儲存模組
+每個股票、每種預測模型保存一份以最後一根 K 棒日期為鍵的模型與最長天數的預測，
+任意較短的預測天數直接切片取得，有新 K 棒時才需要重新訓練
+"""
+import json
+import logging
+from datetime import datetime
+from typing import Optional
+
+from utils.db import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+
+class ModelStore:
+    """SQLite 模型儲存"""
+
+    def __init__(self, db_path: str = "cache.db", pool_size: int = 4):
+        self.db_path = db_path
+        self.pool = ConnectionPool(db_path, size=pool_size)
+        self.init_db()
+
+    def close(self):
+        """關閉資料庫連線"""
+        self.pool.close()
+
+    def init_db(self):
+        """初始化資料庫"""
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                # 舊版每個股票只有一個 Prophet 模型，資料表只是快取，直接重建
+                columns = {row[1] for row in cursor.execute('PRAGMA table_info(fitted_models)')}
+                if columns and 'engine' not in columns:
+                    cursor.execute('DROP TABLE fitted_models')
+
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS fitted_models (
+                        symbol TEXT NOT NULL,
+                        engine TEXT NOT NULL,
+                        last_bar TEXT NOT NULL,
+                        horizon INTEGER NOT NULL,
+                        model TEXT,
+                        forecast TEXT NOT NULL,
+                        created_at TIMESTAMP NOT NULL,
+                        PRIMARY KEY (symbol, engine)
+                    )
+                ''')
+
+            logger.info("Model store initialized successfully")
+        except Exception as e:
+            logger.error(f"Error initializing model store: {str(e)}")
+
+    def get_forecast(self, symbol: str, last_bar: str, days: int, engine: str = "prophet") -> Optional[list]:
+        """
+        取得前 N 天的預測
+
+        Args:
+            symbol: 股票代號
+            last_bar: 最後一根 K 棒日期（YYYY-MM-DD）
+            days: 預測天數
+            engine: 預測模型
+
+        Returns:
+            預測資料列表；模型不存在、已有新 K 棒或預測天數不足時返回 None
+        """
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                cursor.execute('''
+                    SELECT forecast FROM fitted_models
+                    WHERE symbol = ? AND engine = ? AND last_bar = ? AND horizon >= ?
+                ''', (symbol, engine, last_bar, days))
+
+                row = cursor.fetchone()
+
+            if row is None:
+                logger.info(f"Model miss for {symbol} ({engine}, last bar {last_bar}, {days} days)")
+                return None
+
+            logger.info(f"Model hit for {symbol} ({engine}, last bar {last_bar}, {days} days)")
+            return json.loads(row[0])[:days]
+
+        except Exception as e:
+            logger.error(f"Error getting forecast from model store: {str(e)}")
+            return None
+
+    def get_model(self, symbol: str, engine: str = "prophet") -> Optional[dict]:
+        """
+        取得股票最近一次訓練的模型（可用於 warm start）
+
+        Returns:
+            {'last_bar', 'horizon', 'model'}，不存在時返回 None
+        """
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                cursor.execute('''
+                    SELECT last_bar, horizon, model FROM fitted_models
+                    WHERE symbol = ? AND engine = ?
+                ''', (symbol, engine))
+
+                row = cursor.fetchone()
+
+            if row is None:
+                return None
+            return {"last_bar": row[0], "horizon": row[1], "model": row[2]}
+
+        except Exception as e:
+            logger.error(f"Error getting model from model store: {str(e)}")
+            return None
+
+    def save(
+        self,
+        symbol: str,
+        last_bar: str,
+        horizon: int,
+        forecast: list,
+        model: Optional[str] = None,
+        engine: str = "prophet"
+    ):
+        """
+        儲存模型與預測（取代該股票同一種預測模型先前的結果）
+
+        Args:
+            symbol: 股票代號
+            last_bar: 訓練資料最後一根 K 棒日期
+            horizon: 預測天數
+            forecast: 預測資料列表
+            model: 序列化的模型（JSON 字串）
+            engine: 預測模型
+        """
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                cursor.execute('''
+                    INSERT OR REPLACE INTO fitted_models (symbol, engine, last_bar, horizon, model, forecast, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (symbol, engine, last_bar, horizon, model, json.dumps(forecast), datetime.now()))
+
+            logger.info(f"Saved {engine} model for {symbol} (last bar {last_bar}, horizon {horizon} days)")
+
+        except Exception as e:
+            logger.error(f"Error saving model to model store: {str(e)}")
+
+    def invalidate(self, symbol: str):
+        """刪除股票所有預測模型的結果"""
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('DELETE FROM fitted_models WHERE symbol = ?', (symbol,))
+
+        except Exception as e:
+            logger.error(f"Error invalidating model: {str(e)}")
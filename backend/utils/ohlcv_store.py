@@ -0,0 +1,489 @@
+"""
+本機 OHLCV 資料庫
+每個股票每根日 K 一列，只向資料來源下載缺少的尾端資料，其餘範圍直接從本機讀取
+"""
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+import pandas as pd
+
+from utils.data_sources import DataSource, OHLCV_COLUMNS
+from utils.db import ConnectionPool
+from utils.metrics import metrics
+from utils.streaming_indicators import IndicatorStateStore, StreamingIndicatorEngine
+
+logger = logging.getLogger(__name__)
+
+# yfinance 的 period 參數對應的時間長度
+PERIOD_OFFSETS = {
+    "1d": pd.DateOffset(days=1),
+    "5d": pd.DateOffset(days=5),
+    "1mo": pd.DateOffset(months=1),
+    "3mo": pd.DateOffset(months=3),
+    "6mo": pd.DateOffset(months=6),
+    "1y": pd.DateOffset(years=1),
+    "2y": pd.DateOffset(years=2),
+    "5y": pd.DateOffset(years=5),
+    "10y": pd.DateOffset(years=10),
+}
+
+
+def period_start(period: str, today: Optional[date] = None) -> Optional[date]:
+    """
+    將 period 轉換為起始日期
+
+    Returns:
+        起始日期；period 為 max 時返回 None（全部歷史資料）
+    """
+    today = today or date.today()
+    if period == "max":
+        return None
+    if period == "ytd":
+        return date(today.year, 1, 1)
+    if period not in PERIOD_OFFSETS:
+        raise ValueError(f"不支援的時間範圍: {period}")
+    return (pd.Timestamp(today) - PERIOD_OFFSETS[period]).date()
+
+
+class OHLCVStore:
+    """
+    SQLite OHLCV 資料庫
+
+    ohlcv_bars 存放每根日 K，ohlcv_meta 記錄每個股票的時區、已涵蓋的起始日期與最後下載時間。
+    距離上次下載超過 refresh_seconds 時，才會從最後一根 K 棒（可能是盤中未收盤的資料）開始補抓。
+    允許 stale 時，逾期未超過 max_stale_seconds 的資料直接回傳，補抓改在背景進行。
+    每次寫入 K 棒時一併以新的 K 棒增量更新該股票的串流指標狀態（indicator_state）
+    """
+
+    def __init__(
+        self,
+        source: DataSource,
+        db_path: str = "ohlcv.db",
+        refresh_seconds: float = 300,
+        max_stale_seconds: float = 0,
+        pool_size: int = 4
+    ):
+        self.source = source
+        self.db_path = db_path
+        self.pool = ConnectionPool(db_path, size=pool_size)
+        self.refresh_seconds = refresh_seconds
+        self.max_stale_seconds = max_stale_seconds
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._revalidating: set = set()
+        self._revalidator: Optional[ThreadPoolExecutor] = None
+        self.init_db()
+        self.indicator_states = IndicatorStateStore(self.pool)
+
+    def init_db(self):
+        """初始化資料庫"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS ohlcv_bars (
+                    symbol TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    open REAL NOT NULL,
+                    high REAL NOT NULL,
+                    low REAL NOT NULL,
+                    close REAL NOT NULL,
+                    volume INTEGER NOT NULL,
+                    PRIMARY KEY (symbol, date)
+                ) WITHOUT ROWID
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS ohlcv_meta (
+                    symbol TEXT PRIMARY KEY,
+                    tz TEXT NOT NULL,
+                    covered_from TEXT,
+                    full_history INTEGER NOT NULL DEFAULT 0,
+                    last_fetch TIMESTAMP NOT NULL
+                )
+            ''')
+
+        logger.info("OHLCV store initialized successfully")
+
+    def close(self):
+        """停止背景補抓並關閉資料庫連線"""
+        if self._revalidator is not None:
+            self._revalidator.shutdown(wait=True)
+        self.pool.close()
+
+    def _lock_for(self, symbol: str) -> threading.Lock:
+        with self._locks_guard:
+            if symbol not in self._locks:
+                self._locks[symbol] = threading.Lock()
+            return self._locks[symbol]
+
+    def get_history(self, symbol: str, period: str) -> pd.DataFrame:
+        """
+        取得指定期間的 OHLCV 資料（阻塞，需在 I/O 執行池中執行）
+
+        Args:
+            symbol: 股票代號
+            period: 時間範圍（1mo, 3mo, 6mo, 1y, ..., max）
+
+        Returns:
+            以交易所時區 DatetimeIndex 為索引的 DataFrame，找不到資料時為空
+        """
+        return self.get_history_entry(symbol, period)[0]
+
+    def get_history_entry(self, symbol: str, period: str, allow_stale: bool = False) -> Tuple[pd.DataFrame, Optional[int]]:
+        """
+        取得指定期間的 OHLCV 資料，可選擇以 stale-while-revalidate 方式回傳
+
+        Args:
+            symbol: 股票代號
+            period: 時間範圍
+            allow_stale: 只缺尾端更新且逾期未超過 max_stale_seconds 時，直接回傳本機資料並在背景補抓
+
+        Returns:
+            (DataFrame, 資料的經過秒數)；經過秒數只在回傳 stale 資料時有值，否則為 None
+        """
+        age = self.refresh(symbol, period, allow_stale)
+        return self.read_range(symbol, period_start(period)), age
+
+    def refresh(self, symbol: str, period: str, allow_stale: bool = False) -> Optional[int]:
+        """
+        確保本機資料涵蓋指定期間且尾端資料夠新（不讀取 K 棒）
+
+        Returns:
+            以 stale 方式處理時為資料的經過秒數，否則為 None
+        """
+        start = period_start(period)
+        with self._lock_for(symbol):
+            plans = self._plan(symbol, start)
+            age = self._stale_age(symbol, plans) if allow_stale else None
+            if age is None:
+                self._sync(symbol, start, plans)
+
+        if age is not None:
+            self._revalidate(symbol, start)
+        return age
+
+    def _stale_age(self, symbol: str, plans: list) -> Optional[int]:
+        """
+        只需要補抓尾端資料且逾期未超過上限時，返回資料的經過秒數，否則返回 None
+        """
+        if len(plans) != 1 or plans[0][2] is not None or not plans[0][3]:
+            return None
+        meta = self.get_meta(symbol)
+        if meta is None:
+            return None
+        age = (datetime.now() - meta['last_fetch']).total_seconds()
+        if age - self.refresh_seconds > self.max_stale_seconds:
+            return None
+        return int(age)
+
+    def _revalidate(self, symbol: str, start: Optional[date]):
+        """在背景補抓尾端資料，同一個股票同時只有一個補抓工作"""
+        with self._locks_guard:
+            if symbol in self._revalidating:
+                return
+            self._revalidating.add(symbol)
+            if self._revalidator is None:
+                self._revalidator = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ohlcv-revalidate")
+
+        def run():
+            try:
+                with self._lock_for(symbol):
+                    self._sync(symbol, start)
+            except Exception as e:
+                logger.warning(f"Background refresh failed for {symbol}: {str(e)}")
+            finally:
+                with self._locks_guard:
+                    self._revalidating.discard(symbol)
+
+        self._revalidator.submit(run)
+
+    def _plan(self, symbol: str, start: Optional[date]) -> list:
+        """
+        規劃需要向資料來源下載的區段
+
+        Returns:
+            (start, end, covered_from, update_last_fetch) 的列表
+        """
+        meta = self.get_meta(symbol)
+
+        if meta is None:
+            return [(start, None, start, True)]
+
+        plans = []
+        covered_from = date.fromisoformat(meta['covered_from']) if meta['covered_from'] else None
+        needs_backfill = (
+            (start is None and not meta['full_history'])
+            or (start is not None and covered_from is not None and start < covered_from)
+        )
+        if needs_backfill:
+            # 往前補抓尚未涵蓋的區段
+            plans.append((start, covered_from, start, False))
+
+        age = (datetime.now() - meta['last_fetch']).total_seconds()
+        if age >= self.refresh_seconds:
+            # 從最後一根 K 棒開始補抓，覆蓋可能尚未收盤的資料
+            plans.append((self.last_bar_date(symbol), None, None, True))
+
+        return plans
+
+    def _sync(self, symbol: str, start: Optional[date], plans: Optional[list] = None):
+        """確保本機資料涵蓋 start 之後的範圍，且尾端資料不超過 refresh_seconds"""
+        if plans is None:
+            plans = self._plan(symbol, start)
+        for fetch_start, fetch_end, covered_from, update_last_fetch in plans:
+            self._fetch_and_store(symbol, fetch_start, fetch_end, covered_from, update_last_fetch)
+
+    def get_history_many(self, symbols: List[str], period: str) -> Dict[str, pd.DataFrame]:
+        """
+        取得多個股票的 OHLCV 資料，下載區段相同的股票合併為一次批次下載
+
+        Returns:
+            股票代號對應 DataFrame 的字典（下載失敗且本機無資料的股票為空 DataFrame）
+        """
+        start = period_start(period)
+        symbols = sorted(set(symbols))
+
+        with ExitStack() as stack:
+            for symbol in symbols:
+                stack.enter_context(self._lock_for(symbol))
+
+            groups = defaultdict(list)
+            for symbol in symbols:
+                for plan in self._plan(symbol, start):
+                    groups[plan].append(symbol)
+
+            for (fetch_start, fetch_end, covered_from, update_last_fetch), group in groups.items():
+                try:
+                    with metrics.timer("upstream_fetch"):
+                        frames = self.source.fetch_many(group, fetch_start, fetch_end)
+                    metrics.upstream_result(self.source.name, True)
+                except Exception as e:
+                    metrics.upstream_result(self.source.name, False)
+                    logger.warning(f"Bulk fetch failed for {len(group)} symbols: {str(e)}")
+                    continue
+
+                logger.info(f"Bulk fetched {len(group)} symbols from {self.source.name} "
+                            f"(start={fetch_start}, end={fetch_end})")
+                for symbol, df in frames.items():
+                    if df.empty and self.get_meta(symbol) is None:
+                        continue
+                    self.save_bars(symbol, df, covered_from=covered_from, full_history=fetch_start is None,
+                                   update_last_fetch=update_last_fetch)
+
+        return {symbol: self.read_range(symbol, start) for symbol in symbols}
+
+    def _fetch_and_store(
+        self,
+        symbol: str,
+        start: Optional[date],
+        end: Optional[date],
+        covered_from: Optional[date] = None,
+        update_last_fetch: bool = True,
+    ):
+        try:
+            with metrics.timer("upstream_fetch"):
+                df = self.source.fetch(symbol, start, end)
+            metrics.upstream_result(self.source.name, True)
+        except Exception as e:
+            metrics.upstream_result(self.source.name, False)
+            if self.get_meta(symbol) is None:
+                raise
+            # 已有本機資料時，上游失敗不影響回應，下次請求再重試
+            logger.warning(f"Upstream fetch failed for {symbol}, serving local data: {str(e)}")
+            return
+
+        logger.info(f"Fetched {len(df)} bars for {symbol} from {self.source.name} (start={start}, end={end})")
+        if df.empty and self.get_meta(symbol) is None:
+            return
+
+        self.save_bars(symbol, df, covered_from=covered_from, full_history=start is None,
+                       update_last_fetch=update_last_fetch)
+
+    def save_bars(
+        self,
+        symbol: str,
+        df: pd.DataFrame,
+        covered_from: Optional[date] = None,
+        full_history: bool = False,
+        update_last_fetch: bool = True,
+    ):
+        """寫入（或覆蓋）K 棒並更新 meta"""
+        rows = [
+            (symbol, ts.strftime("%Y-%m-%d"), float(open_), float(high), float(low), float(close), int(volume))
+            for ts, open_, high, low, close, volume in zip(
+                df.index, df['Open'], df['High'], df['Low'], df['Close'], df['Volume'].fillna(0)
+            )
+        ]
+        tz = str(df.index.tz) if len(df) > 0 and df.index.tz is not None else "UTC"
+        meta = self.get_meta(symbol)
+
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+
+            cursor.executemany('''
+                INSERT INTO ohlcv_bars (symbol, date, open, high, low, close, volume)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(symbol, date) DO UPDATE SET
+                    open = excluded.open,
+                    high = excluded.high,
+                    low = excluded.low,
+                    close = excluded.close,
+                    volume = excluded.volume
+            ''', rows)
+
+            # 合併既有的 meta：已涵蓋的起始日期取較早者，取得全部歷史後不再需要往前補抓
+            if meta is not None:
+                tz = meta['tz']
+                full_history = full_history or meta['full_history']
+                if meta['covered_from'] and covered_from:
+                    covered_from = min(covered_from, date.fromisoformat(meta['covered_from']))
+                elif meta['covered_from']:
+                    covered_from = date.fromisoformat(meta['covered_from'])
+                if not update_last_fetch:
+                    last_fetch = meta['last_fetch']
+            if full_history:
+                covered_from = None
+            if meta is None or update_last_fetch:
+                last_fetch = datetime.now()
+
+            cursor.execute('''
+                INSERT OR REPLACE INTO ohlcv_meta (symbol, tz, covered_from, full_history, last_fetch)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (symbol, tz, covered_from.isoformat() if covered_from else None, int(full_history), last_fetch))
+
+        self._update_indicator_state(symbol, rows)
+
+    def _update_indicator_state(self, symbol: str, rows: list):
+        """
+        以剛寫入的 K 棒更新串流指標狀態（呼叫端需持有該股票的鎖）
+
+        從最後一根 K 棒開始的尾端補抓只需逐根更新；沒有狀態、往前補抓或改寫了更早的 K 棒時，
+        以本機全部 K 棒從頭重新計算
+        """
+        if not rows:
+            return
+        rows = sorted(rows, key=lambda row: row[1])
+        try:
+            engine = self.indicator_states.load(symbol)
+            if engine is None or rows[0][1] < engine.first_date or rows[0][1] < engine.last_date:
+                engine = self._rebuild_indicator_state(symbol)
+            else:
+                for _, day, open_, high, low, close, volume in rows:
+                    engine.update(open_, high, low, close, volume, date=day)
+            self.indicator_states.save(engine)
+        except Exception as e:
+            logger.error(f"Error updating indicator state for {symbol}: {str(e)}")
+            self.indicator_states.delete(symbol)
+
+    def _rebuild_indicator_state(self, symbol: str) -> StreamingIndicatorEngine:
+        """以本機全部 K 棒建立串流指標狀態"""
+        engine = StreamingIndicatorEngine(symbol)
+        engine.update_frame(self.read_range(symbol))
+        return engine
+
+    def latest_indicators(self, symbol: str) -> Optional[dict]:
+        """
+        從串流指標狀態取得最新的技術指標數值（不讀取 K 棒、不重新計算）
+
+        指標以本機第一根 K 棒為起點計算；尚無狀態（例如升級前已存在的資料）時從本機 K 棒建立
+
+        Returns:
+            {'last_update', 'latest_indicators'}，本機沒有資料時返回 None
+        """
+        engine = self.indicator_states.load(symbol)
+        if engine is None:
+            with self._lock_for(symbol):
+                engine = self.indicator_states.load(symbol)
+                if engine is None:
+                    engine = self._rebuild_indicator_state(symbol)
+                    if engine.last_date is None:
+                        return None
+                    self.indicator_states.save(engine)
+        return {"last_update": engine.last_date, "latest_indicators": engine.latest_indicators()}
+
+    def get_meta(self, symbol: str) -> Optional[dict]:
+        """取得股票的 meta 資料"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT tz, covered_from, full_history, last_fetch FROM ohlcv_meta
+                WHERE symbol = ?
+            ''', (symbol,))
+            row = cursor.fetchone()
+
+        if row is None:
+            return None
+        return {
+            "tz": row[0],
+            "covered_from": row[1],
+            "full_history": bool(row[2]),
+            "last_fetch": row[3],
+        }
+
+    def version(self, symbol: str, start: Optional[date] = None) -> Optional[str]:
+        """
+        本機資料的版本字串（K 棒數、最後一根 K 棒的日期與數值），資料有任何更新時都會改變
+
+        Args:
+            symbol: 股票代號
+            start: 起始日期（包含）
+
+        Returns:
+            版本字串，沒有資料時返回 None
+        """
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT COUNT(*), MAX(date), (
+                    SELECT open || ',' || high || ',' || low || ',' || close || ',' || volume
+                    FROM ohlcv_bars WHERE symbol = ? ORDER BY date DESC LIMIT 1
+                )
+                FROM ohlcv_bars
+                WHERE symbol = ? AND date >= ?
+            ''', (symbol, symbol, start.isoformat() if start else ""))
+            count, last_date, last_bar = cursor.fetchone()
+
+        if not count:
+            return None
+        return f"{count}:{last_date}:{last_bar}"
+
+    def last_bar_date(self, symbol: str) -> Optional[date]:
+        """本機最後一根 K 棒的日期"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT MAX(date) FROM ohlcv_bars WHERE symbol = ?', (symbol,))
+            row = cursor.fetchone()
+        return date.fromisoformat(row[0]) if row and row[0] else None
+
+    def read_range(self, symbol: str, start: Optional[date] = None, end: Optional[date] = None) -> pd.DataFrame:
+        """
+        從本機讀取任意區間的 K 棒（不會呼叫資料來源）
+
+        Args:
+            symbol: 股票代號
+            start: 起始日期（包含）
+            end: 結束日期（包含）
+        """
+        meta = self.get_meta(symbol)
+        if meta is None:
+            return pd.DataFrame(columns=OHLCV_COLUMNS)
+
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT date, open, high, low, close, volume FROM ohlcv_bars
+                WHERE symbol = ? AND date >= ? AND date <= ?
+                ORDER BY date
+            ''', (symbol, start.isoformat() if start else "", end.isoformat() if end else "9999-12-31"))
+            rows = cursor.fetchall()
+
+        df = pd.DataFrame(rows, columns=['Date'] + OHLCV_COLUMNS)
+        index = pd.DatetimeIndex(pd.to_datetime(df.pop('Date')), name='Date').tz_localize(meta['tz'])
+        df.index = index
+        return df
@@ -0,0 +1,174 @@
+"""
+預測預先計算排程模組
+在各交易所收盤資料定案後，預先計算設定清單與熱門股票的預測與指標，
+讓隔天開盤前後的請求幾乎都能直接命中快取
+"""
+import asyncio
+import logging
+import os
+import random
+import uuid
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from utils.cache import DEFAULT_MODEL, CacheManager
+from utils.market_calendar import MARKETS, market_for
+
+logger = logging.getLogger(__name__)
+
+# 預先計算的租約鍵值前綴，與一般預測請求的租約分開
+LEASE_PREFIX = "precompute:"
+
+
+class PrecomputeScheduler:
+    """
+    收盤後的預測預先計算
+
+    每個項目先以 SQLite 租約認領，多個 worker 同時執行時會各自處理不同的股票；
+    快取仍有效（已被其他 worker 計算過）的項目直接略過
+    """
+
+    def __init__(
+        self,
+        cache_manager: CacheManager,
+        warm_history: Callable[[List[str]], Awaitable[object]],
+        warm_prediction: Callable[[str, int], Awaitable[object]],
+        symbols: Iterable[str] = (),
+        days: Iterable[int] = (7,),
+        top_n: int = 20,
+        concurrency: int = 1,
+        lease_ttl: float = 600,
+        model: str = DEFAULT_MODEL
+    ):
+        """
+        Args:
+            cache_manager: 快取管理器（用於檢查快取、認領租約與查詢熱門股票）
+            warm_history: 批次同步股價資料的函式
+            warm_prediction: 計算並快取單一預測的函式
+            symbols: 固定預先計算的股票代號
+            days: 固定股票要預先計算的預測天數
+            top_n: 另外加入最近請求次數最多的前 N 個項目
+            concurrency: 同時進行的預測數
+            lease_ttl: 認領租約的有效秒數
+            model: warm_prediction 使用的預測模型（用於檢查快取與認領租約）
+        """
+        self.cache_manager = cache_manager
+        self.warm_history = warm_history
+        self.warm_prediction = warm_prediction
+        self.symbols = list(symbols)
+        self.days = list(days)
+        self.top_n = top_n
+        self.concurrency = max(1, concurrency)
+        self.lease_ttl = lease_ttl
+        self.model = model
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex}"
+        self.last_run: Optional[dict] = None
+
+    def targets(self, market: Optional[str] = None) -> List[Tuple[str, int]]:
+        """
+        取得要預先計算的 (symbol, days)
+
+        Args:
+            market: 只取得此交易所的股票（None 表示全部）
+        """
+        items = [(symbol, days) for symbol in self.symbols for days in self.days]
+        if self.top_n:
+            items += self.cache_manager.most_requested(self.top_n)
+
+        items = list(dict.fromkeys(items))
+        if market is not None:
+            items = [item for item in items if market_for(item[0]).code == market]
+        return items
+
+    def _claim(self, items: List[Tuple[str, int]]) -> List[Tuple[str, int]]:
+        """略過快取仍有效的項目，並認領其餘項目的租約"""
+        now = datetime.now()
+        claimed = []
+        for symbol, days in items:
+            meta = self.cache_manager.get_prediction_meta(symbol, days, self.model)
+            if meta is not None and meta.expires_at > now:
+                continue
+            if self.cache_manager.acquire_lease(
+                LEASE_PREFIX + symbol, days, self.owner, self.lease_ttl, self.model
+            ):
+                claimed.append((symbol, days))
+        return claimed
+
+    async def run_once(self, market: Optional[str] = None) -> dict:
+        """
+        預先計算一輪
+
+        Args:
+            market: 只處理此交易所的股票（None 表示全部）
+
+        Returns:
+            統計摘要（targets、warmed、skipped、failed）
+        """
+        items = self.targets(market)
+        # 打亂順序，讓同時執行的 worker 從不同的股票開始認領
+        random.shuffle(items)
+        claimed = self._claim(items)
+        summary = {
+            "market": market,
+            "targets": len(items),
+            "warmed": 0,
+            "skipped": len(items) - len(claimed),
+            "failed": 0,
+            "started_at": datetime.now(timezone.utc).isoformat()
+        }
+
+        if claimed:
+            try:
+                # 先一次同步所有認領股票的資料，之後的預測直接讀取本機資料
+                await self.warm_history(list(dict.fromkeys(symbol for symbol, _ in claimed)))
+            except Exception as e:
+                logger.warning(f"Bulk history sync for precompute failed: {str(e)}")
+
+            limit = asyncio.Semaphore(self.concurrency)
+
+            async def warm(symbol: str, days: int) -> bool:
+                async with limit:
+                    try:
+                        await self.warm_prediction(symbol, days)
+                        return True
+                    except Exception as e:
+                        logger.warning(f"Precompute failed for {symbol} ({days} days): {str(e)}")
+                        return False
+                    finally:
+                        self.cache_manager.release_lease(LEASE_PREFIX + symbol, days, self.owner, self.model)
+
+            results = await asyncio.gather(*(warm(symbol, days) for symbol, days in claimed))
+            summary["warmed"] = sum(results)
+            summary["failed"] = len(results) - summary["warmed"]
+
+        logger.info(f"Precompute finished: {summary}")
+        self.last_run = summary
+        return summary
+
+    def next_run(self, now: Optional[datetime] = None) -> Tuple[str, datetime]:
+        """下一個收盤資料定案的交易所與時間"""
+        return min(
+            ((code, market.next_settle(now)) for code, market in MARKETS.items()),
+            key=lambda item: item[1]
+        )
+
+    async def run_forever(self):
+        """背景排程：每個交易所收盤資料定案後預先計算該交易所的股票"""
+        while True:
+            market, run_at = self.next_run()
+            delay = (run_at - datetime.now(timezone.utc)).total_seconds()
+            logger.info(f"Next precompute for {market} at {run_at.isoformat()}")
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            try:
+                await self.run_once(market)
+            except Exception as e:
+                logger.error(f"Precompute run failed: {str(e)}")
+
+            # 避免在定案時間點上重複觸發
+            await asyncio.sleep(1)
+
+    def stats(self) -> Dict[str, object]:
+        """最近一次執行的統計"""
+        return {"last_run": self.last_run}
@@ -0,0 +1,314 @@
+"""
+請求剖析模組
+以背景執行緒定期取樣所有執行緒的呼叫堆疊（不需要外部剖析器），
+輸出 flamegraph.pl / speedscope 可讀取的 collapsed stack 格式；
+可由標頭或查詢參數對單一請求剖析，也可依比例抽樣並保留每小時最慢的 N 個請求。
+只取樣 API 行程內的執行緒：cpu 執行池（ProcessPoolExecutor）worker 行程內的 Prophet 訓練不在取樣範圍，
+只會顯示為等待結果的堆疊
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs
+
+logger = logging.getLogger(__name__)
+
+# 閒置等待中的函式（檔名, 函式名稱），取樣時略過，避免閒置的 worker 佔滿剖析結果
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+}
+
+# X-Profile 標頭或 _profile 查詢參數觸發剖析的值
+TRIGGER_VALUES = {"1", "true", "yes"}
+
+# 執行緒名稱的編號後綴（io-worker_3 -> io-worker），讓相同執行池的堆疊合併
+_THREAD_SUFFIX = re.compile(r"[_-]\d+$")
+
+
+class SamplingProfiler:
+    """
+    取樣式剖析器
+
+    每 interval 秒取樣一次 sys._current_frames()，以 (執行緒, 呼叫堆疊) 計數；
+    同一時間只適合執行一個，否則多個請求的堆疊會混在一起
+    """
+
+    def __init__(self, interval: float = 0.005):
+        """
+        Args:
+            interval: 取樣間隔（秒）
+        """
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """開始取樣"""
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        """停止取樣並返回 {堆疊: 次數}"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.samples
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                    continue
+
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                thread_name = _THREAD_SUFFIX.sub("", names.get(ident, "thread"))
+                stack.append(thread_name)
+                self.samples[tuple(reversed(stack))] += 1
+
+
+class Profile:
+    """單一請求的剖析結果"""
+
+    def __init__(
+        self,
+        method: str,
+        path: str,
+        query: str,
+        status: Optional[int],
+        duration: float,
+        samples: Counter,
+        interval: float,
+        started_at: Optional[datetime] = None,
+        profile_id: Optional[str] = None
+    ):
+        self.id = profile_id or uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.query = query
+        self.status = status
+        self.duration = duration
+        self.samples = samples
+        self.interval = interval
+        self.started_at = started_at or datetime.now()
+
+    def collapsed(self) -> str:
+        """collapsed stack 格式（每行「frame;frame;... 次數」）"""
+        return collapse(self.samples)
+
+    def summary(self) -> dict:
+        """請求資訊與取樣數（不含堆疊）"""
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "query": self.query,
+            "status": self.status,
+            "duration": round(self.duration, 4),
+            "samples": sum(self.samples.values()),
+            "interval": self.interval,
+            "started_at": self.started_at.isoformat(),
+        }
+
+
+def collapse(samples: Counter) -> str:
+    """將 {堆疊: 次數} 轉為 collapsed stack 文字"""
+    return "".join(f"{';'.join(stack)} {count}\n" for stack, count in samples.most_common())
+
+
+class ProfileStore:
+    """
+    剖析結果的磁碟儲存
+
+    單次剖析寫入 {directory}/requests/；抽樣的剖析只保留每小時最慢的 N 個，
+    寫入 {directory}/hourly/{YYYYMMDDHH}/，並維護 index.json 與合併所有保留剖析的 aggregate.collapsed
+    """
+
+    def __init__(self, directory: str, slowest_n: int = 10):
+        self.directory = directory
+        self.slowest_n = slowest_n
+        self._hour: Optional[str] = None
+        self._slowest: List[Profile] = []
+        self._lock = threading.Lock()
+
+    def save(self, profile: Profile) -> str:
+        """寫入單次剖析，返回檔案路徑"""
+        directory = os.path.join(self.directory, "requests")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{profile.started_at:%Y%m%d%H%M%S}-{profile.id}.collapsed")
+        with open(path, "w") as f:
+            f.write(profile.collapsed())
+        with open(path[:-len(".collapsed")] + ".json", "w") as f:
+            json.dump(profile.summary(), f, indent=2)
+        logger.info(f"Profile for {profile.method} {profile.path} written to {path}")
+        return path
+
+    def offer(self, profile: Profile) -> bool:
+        """
+        提交抽樣的剖析，屬於本小時最慢的 N 個時寫入磁碟
+
+        Returns:
+            是否被保留
+        """
+        if self.slowest_n <= 0:
+            return False
+
+        hour = profile.started_at.strftime("%Y%m%d%H")
+        with self._lock:
+            if hour != self._hour:
+                self._hour = hour
+                self._slowest = []
+
+            if len(self._slowest) >= self.slowest_n:
+                fastest = min(self._slowest, key=lambda kept: kept.duration)
+                if profile.duration <= fastest.duration:
+                    return False
+                self._slowest.remove(fastest)
+                self._remove(hour, fastest)
+
+            self._slowest.append(profile)
+            self._write_hour(hour, profile)
+            return True
+
+    def _hour_dir(self, hour: str) -> str:
+        return os.path.join(self.directory, "hourly", hour)
+
+    def _remove(self, hour: str, profile: Profile):
+        try:
+            os.remove(os.path.join(self._hour_dir(hour), f"{profile.id}.collapsed"))
+        except OSError:
+            pass
+
+    def _write_hour(self, hour: str, profile: Profile):
+        directory = self._hour_dir(hour)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"{profile.id}.collapsed"), "w") as f:
+            f.write(profile.collapsed())
+
+        ranked = sorted(self._slowest, key=lambda kept: kept.duration, reverse=True)
+        with open(os.path.join(directory, "index.json"), "w") as f:
+            json.dump([kept.summary() for kept in ranked], f, indent=2)
+
+        aggregate: Counter = Counter()
+        for kept in self._slowest:
+            aggregate.update(kept.samples)
+        with open(os.path.join(directory, "aggregate.collapsed"), "w") as f:
+            f.write(collapse(aggregate))
+
+
+class ProfilingMiddleware:
+    """
+    請求剖析 ASGI 中介軟體
+
+    - 單次剖析：請求帶有 X-Profile: 1 標頭或 ?_profile=1，且 authorize 允許時剖析該請求，
+      結果寫入 ProfileStore，回應標頭 X-Profile-Id 為剖析識別碼
+    - 抽樣剖析：依 sample_rate 比例剖析一般請求，只保留每小時最慢的 N 個
+
+    剖析器會取樣整個行程，同一時間只剖析一個請求；剖析進行中的其他請求不剖析
+    """
+
+    def __init__(
+        self,
+        app,
+        store: ProfileStore,
+        authorize: Callable[[Dict[str, str]], bool],
+        sample_rate: float = 0.0,
+        interval: float = 0.005
+    ):
+        """
+        Args:
+            app: 下一層 ASGI 應用
+            store: 剖析結果儲存
+            authorize: 依請求標頭判斷是否允許單次剖析
+            sample_rate: 抽樣剖析的比例（0 表示停用）
+            interval: 取樣間隔（秒）
+        """
+        self.app = app
+        self.store = store
+        self.authorize = authorize
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self._busy = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1").lower(): value.decode("latin-1") for key, value in scope["headers"]}
+        query = scope.get("query_string", b"").decode("latin-1")
+        requested = self._requested(headers, query)
+        if requested and not self.authorize(headers):
+            logger.warning(f"Profiling request for {scope['path']} denied")
+            requested = False
+        sampled = not requested and self.sample_rate > 0 and random.random() < self.sample_rate
+
+        if not (requested or sampled) or not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = uuid.uuid4().hex[:12]
+        status: List[Optional[int]] = [None]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if requested:
+                    message = {
+                        **message,
+                        "headers": [*message.get("headers", []), (b"x-profile-id", profile_id.encode())],
+                    }
+            await send(message)
+
+        profiler = SamplingProfiler(self.interval)
+        started_at = datetime.now()
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # join 取樣執行緒最多需要一個取樣間隔，不在事件迴圈上等待
+            samples = await asyncio.to_thread(profiler.stop)
+            duration = time.perf_counter() - started
+            self._busy.release()
+            profile = Profile(
+                scope["method"], scope["path"], query, status[0], duration, samples, self.interval,
+                started_at=started_at, profile_id=profile_id
+            )
+            await asyncio.to_thread(self._store, profile, requested)
+
+    def _store(self, profile: Profile, requested: bool):
+        try:
+            if requested:
+                self.store.save(profile)
+            self.store.offer(profile)
+        except Exception as e:
+            logger.error(f"Error writing profile: {str(e)}")
+
+    @staticmethod
+    def _requested(headers: Dict[str, str], query: str) -> bool:
+        if headers.get("x-profile", "").lower() in TRIGGER_VALUES:
+            return True
+        return any(value.lower() in TRIGGER_VALUES for value in parse_qs(query).get("_profile", []))
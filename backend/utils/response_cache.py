@@ -0,0 +1,138 @@
+"""
+行程內回應快取模組
+以位元組數為上限的 LRU 快取，保存已編碼完成的回應內容，
+命中時直接回傳 bytes，不需要查詢 SQLite、解析 JSON 或重新編碼
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CachedResponse:
+    """一筆已編碼的回應、其 ETag 與到期時間（epoch 秒）"""
+
+    __slots__ = ("body", "etag", "expires_at")
+
+    def __init__(self, body: bytes, etag: Optional[str], expires_at: float):
+        self.body = body
+        self.etag = etag
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    """
+    TTL + LRU 的回應 bytes 快取
+
+    每筆資料的到期時間沿用 SQLite 快取的 expires_at（可再以 max_ttl 縮短，
+    讓其他 worker 的強制刷新最多延遲 max_ttl 秒生效），總大小超過 max_bytes 時
+    淘汰最久未使用的資料
+    """
+
+    def __init__(self, max_bytes: int, max_ttl: Optional[float] = None):
+        """
+        Args:
+            max_bytes: 快取內容的總大小上限（bytes），0 表示停用
+            max_ttl: 單筆資料最長保留秒數，None 表示只依 SQLite 的到期時間
+        """
+        self.max_bytes = max_bytes
+        self.max_ttl = max_ttl
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        """取得未過期的回應，命中時移到 LRU 最新的位置"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+
+            if entry.expires_at <= time.time():
+                self._remove(key)
+                self.counters["expirations"] += 1
+                self.counters["misses"] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry
+
+    def put(self, key: Hashable, body: bytes, expires_at: datetime, etag: Optional[str] = None):
+        """
+        存入已編碼的回應內容
+
+        Args:
+            key: 快取鍵值
+            body: 回應內容
+            expires_at: SQLite 快取的到期時間
+            etag: 回應的 ETag
+        """
+        if not self.max_bytes or len(body) > self.max_bytes:
+            return
+
+        expires = expires_at.timestamp()
+        if self.max_ttl:
+            expires = min(expires, time.time() + self.max_ttl)
+        if expires <= time.time():
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = CachedResponse(body, etag, expires)
+            self._size += len(body)
+
+            while self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.counters["evictions"] += 1
+
+    def invalidate(self, symbol: str, days: Optional[int] = None):
+        """
+        移除特定股票的回應（鍵值的前兩個元素為 symbol 與 days）
+
+        Args:
+            symbol: 股票代號
+            days: 預測天數（可選，如果不指定則移除該股票所有回應）
+        """
+        with self._lock:
+            keys = [
+                key for key in self._entries
+                if key[0] == symbol and (days is None or key[1] == days)
+            ]
+            for key in keys:
+                self._remove(key)
+
+    def clear(self):
+        """清空快取"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key)
+        self._size -= len(entry.body)
+
+    def stats(self) -> dict:
+        """命中、未命中與淘汰次數，以及目前的筆數與大小"""
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,85 @@
+"""
+回應序列化模組
+以向量化的方式四捨五入與遮罩 NaN，並提供逐列（預設）與欄式（?format=columnar）兩種輸出
+"""
+import json
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:  # orjson 為選用套件，未安裝時退回標準庫
+    orjson = None
+
+RESPONSE_FORMATS = ("rows", "columnar")
+
+
+def encode_json(payload) -> bytes:
+    """將回應編碼為 JSON bytes（優先使用 orjson）"""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _dates(index: pd.DatetimeIndex) -> list:
+    return list(index.strftime("%Y-%m-%d"))
+
+
+def _masked_columns(values: np.ndarray) -> list:
+    """四捨五入到小數兩位，非有限值轉為 None，回傳每個欄位一個 list"""
+    rounded = np.round(values, 2).astype(object)
+    rounded[~np.isfinite(values)] = None
+    return rounded.T.tolist()
+
+
+def history_records(df: pd.DataFrame) -> list:
+    """OHLCV 資料的逐列格式（date, open, high, low, close, volume）"""
+    ohlc = np.round(df[['Open', 'High', 'Low', 'Close']].to_numpy(dtype=float), 2).tolist()
+    volume = df['Volume'].to_numpy(dtype=np.int64).tolist()
+    return [
+        {"date": date, "open": open_, "high": high, "low": low, "close": close, "volume": shares}
+        for date, (open_, high, low, close), shares in zip(_dates(df.index), ohlc, volume)
+    ]
+
+
+def history_columns(df: pd.DataFrame) -> dict:
+    """OHLCV 資料的欄式格式，每個欄位一個陣列"""
+    opens, highs, lows, closes = _masked_columns(df[['Open', 'High', 'Low', 'Close']].to_numpy(dtype=float))
+    return {
+        "date": _dates(df.index),
+        "open": opens,
+        "high": highs,
+        "low": lows,
+        "close": closes,
+        "volume": df['Volume'].to_numpy(dtype=np.int64).tolist(),
+    }
+
+
+def indicator_columns(index: pd.DatetimeIndex, matrix: np.ndarray, columns: dict) -> dict:
+    """指標矩陣的欄式格式，NaN 以 null 表示"""
+    keys = list(columns.keys())
+    result = {"date": _dates(index)}
+    if len(keys) == 0:
+        return result
+    values = _masked_columns(matrix[:, [columns[key] for key in keys]])
+    result.update(zip(keys, values))
+    return result
+
+
+def records_to_columns(records: list) -> dict:
+    """將逐列資料轉為欄式格式（用於已快取的逐列回應），缺少的欄位以 null 表示"""
+    keys = []
+    for record in records:
+        for key in record:
+            if key not in keys:
+                keys.append(key)
+    return {key: [record.get(key) for record in records] for key in keys}
+
+
+def payload_to_columns(payload: dict) -> dict:
+    """將回應中所有逐列的 list 欄位轉為欄式格式"""
+    return {
+        key: records_to_columns(value) if isinstance(value, list) else value
+        for key, value in payload.items()
+    }
@@ -0,0 +1,135 @@
+"""
+Single-flight 請求合併模組
+相同 key 的並行請求只執行一次實際工作，其餘請求等待同一個結果
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from fastapi import Request
+
+from utils.executor import ClientDisconnectedError, wait_for_disconnect
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """一次進行中的工作與等待它的請求數"""
+
+    def __init__(self, task: asyncio.Task, detached: bool = False):
+        self.task = task
+        self.waiters = 0
+        # 背景工作沒有發起的請求，不會因等待者離開而被取消
+        self.detached = detached
+
+
+class SingleFlight:
+    """
+    行程內的 single-flight 合併器
+
+    第一個請求（leader）啟動工作，之後相同 key 的請求（follower）直接等待同一個 task。
+    工作以獨立 task 執行，leader 中斷連線不會影響 follower；
+    只有當所有等待者都離開時才取消工作
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.counters: Dict[str, int] = {
+            "leaders": 0,
+            "coalesced_local": 0,
+            "coalesced_remote": 0,
+            "background": 0,
+        }
+
+    def record(self, counter: str, amount: int = 1):
+        """累加計數器"""
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def __contains__(self, key: Hashable) -> bool:
+        """相同 key 是否有進行中的工作"""
+        return key in self._flights
+
+    def in_flight(self) -> int:
+        """目前進行中的工作數"""
+        return len(self._flights)
+
+    async def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Awaitable[Any]],
+        request: Optional[Request] = None,
+    ) -> Any:
+        """
+        執行或加入相同 key 的工作
+
+        Args:
+            key: 合併用的鍵值
+            fn: 產生結果的 coroutine 函式（只有 leader 會呼叫）
+            request: 目前的 HTTP 請求，用於偵測客戶端中斷連線
+
+        Raises:
+            ClientDisconnectedError: 客戶端在結果產生前中斷連線
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            task = asyncio.ensure_future(fn())
+            flight = _Flight(task)
+            self._flights[key] = flight
+            task.add_done_callback(lambda t, k=key, f=flight: self._finish(k, f))
+            self.record("leaders")
+        else:
+            self.record("coalesced_local")
+            logger.info(f"Coalesced {self.name} request for {key}")
+
+        flight.waiters += 1
+        try:
+            if request is None:
+                return await asyncio.shield(flight.task)
+
+            watcher = asyncio.ensure_future(wait_for_disconnect(request))
+            try:
+                await asyncio.wait({flight.task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                watcher.cancel()
+
+            if not flight.task.done():
+                raise ClientDisconnectedError("Client disconnected before the task finished")
+            return flight.task.result()
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.detached and not flight.task.done():
+                flight.task.cancel()
+
+    def spawn(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> bool:
+        """
+        在背景啟動工作（不等待結果），相同 key 已有進行中的工作時不重複啟動
+
+        之後相同 key 的 do() 會直接加入這個工作
+
+        Returns:
+            是否啟動了新的工作
+        """
+        if key in self._flights:
+            return False
+
+        task = asyncio.ensure_future(fn())
+        flight = _Flight(task, detached=True)
+        self._flights[key] = flight
+        task.add_done_callback(lambda t, k=key, f=flight: self._finish(k, f))
+        self.record("background")
+        logger.info(f"Started background {self.name} task for {key}")
+        return True
+
+    def _finish(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # 避免沒有等待者時出現 "exception was never retrieved" 警告
+        if not flight.task.cancelled():
+            error = flight.task.exception()
+            if error is not None and flight.detached:
+                logger.warning(f"Background {self.name} task for {key} failed: {error!r}")
+
+    def stats(self) -> dict:
+        """計數器與進行中的工作數"""
+        return {**self.counters, "in_flight": self.in_flight()}
@@ -0,0 +1,478 @@
+"""
+串流技術指標引擎
+為每個股票保存各指標的運算狀態，新增一根 K 棒時只需 O(1) 更新，不必重新計算整個 DataFrame
+
+數值與 indicators.py 的批次函式一致（以第一根送入的 K 棒為起點），
+狀態可透過 snapshot() / restore() 序列化為 JSON，重新啟動後接續計算。
+OHLCVStore 寫入 K 棒時以 IndicatorStateStore 更新每個股票的狀態
+"""
+import json
+import logging
+import math
+from collections import deque
+from datetime import datetime
+from typing import Dict, Optional
+
+import pandas as pd
+
+from utils.db import ConnectionPool
+
+logger = logging.getLogger(__name__)
+
+NAN = float('nan')
+SNAPSHOT_VERSION = 1
+
+
+def _div(a: float, b: float) -> float:
+    """與 pandas/numpy 相同語意的除法（除以 0 得到 inf 或 NaN）"""
+    if math.isnan(a) or math.isnan(b):
+        return NAN
+    if b == 0:
+        return NAN if a == 0 else math.copysign(math.inf, a)
+    return a / b
+
+
+class RollingMean:
+    """固定視窗的移動平均，視窗內有 NaN 時結果為 NaN（同 pandas rolling(...).mean()）"""
+
+    def __init__(self, period: int):
+        self.period = period
+        self.values = deque()
+        self.total = 0.0
+        self.nan_count = 0
+
+    def update(self, x: float) -> float:
+        self.values.append(x)
+        if math.isnan(x):
+            self.nan_count += 1
+        else:
+            self.total += x
+
+        if len(self.values) > self.period:
+            old = self.values.popleft()
+            if math.isnan(old):
+                self.nan_count -= 1
+            else:
+                self.total -= old
+
+        if len(self.values) < self.period or self.nan_count > 0:
+            return NAN
+        return self.total / self.period
+
+    def to_state(self) -> dict:
+        return {"values": list(self.values), "total": self.total, "nan_count": self.nan_count}
+
+    def load_state(self, state: dict):
+        self.values = deque(state["values"])
+        self.total = state["total"]
+        self.nan_count = state["nan_count"]
+
+
+class RollingStd:
+    """固定視窗的樣本標準差（ddof=1），以滑動視窗版 Welford 演算法維持數值穩定"""
+
+    def __init__(self, period: int):
+        self.period = period
+        self.values = deque()
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, x: float) -> float:
+        self.values.append(x)
+        n = len(self.values)
+        delta = x - self.mean
+        self.mean += delta / n
+        self.m2 += delta * (x - self.mean)
+
+        if n > self.period:
+            old = self.values.popleft()
+            n -= 1
+            delta = old - self.mean
+            self.mean -= delta / n
+            self.m2 -= delta * (old - self.mean)
+
+        if n < self.period:
+            return NAN
+        # 變異數相對於數值很小時（例如整段平盤），累積的捨入誤差會被開根號放大，改以兩次走訪重新計算
+        if self.m2 <= 1e-8 * n * self.mean * self.mean:
+            self.mean = sum(self.values) / n
+            self.m2 = sum((v - self.mean) ** 2 for v in self.values)
+        return math.sqrt(max(self.m2, 0.0) / (n - 1))
+
+    def to_state(self) -> dict:
+        return {"values": list(self.values), "mean": self.mean, "m2": self.m2}
+
+    def load_state(self, state: dict):
+        self.values = deque(state["values"])
+        self.mean = state["mean"]
+        self.m2 = state["m2"]
+
+
+class EMA:
+    """指數移動平均（同 pandas ewm(span=period, adjust=False)）"""
+
+    def __init__(self, period: int):
+        self.alpha = 2 / (period + 1)
+        self.value: Optional[float] = None
+
+    def update(self, x: float) -> float:
+        if self.value is None:
+            self.value = x
+        else:
+            self.value += self.alpha * (x - self.value)
+        return self.value
+
+    def to_state(self) -> dict:
+        return {"value": self.value}
+
+    def load_state(self, state: dict):
+        self.value = state["value"]
+
+
+class RollingExtreme:
+    """以單調佇列維護的移動最大值 / 最小值，每次更新攤銷 O(1)"""
+
+    def __init__(self, period: int, mode: str):
+        self.period = period
+        self.mode = mode
+        self.window = deque()  # (序號, 數值)，數值單調
+        self.count = 0
+
+    def update(self, x: float) -> float:
+        if self.mode == "max":
+            while self.window and self.window[-1][1] <= x:
+                self.window.pop()
+        else:
+            while self.window and self.window[-1][1] >= x:
+                self.window.pop()
+        self.window.append((self.count, x))
+        self.count += 1
+
+        while self.window[0][0] <= self.count - 1 - self.period:
+            self.window.popleft()
+
+        if self.count < self.period:
+            return NAN
+        return self.window[0][1]
+
+    def to_state(self) -> dict:
+        return {"window": [list(item) for item in self.window], "count": self.count}
+
+    def load_state(self, state: dict):
+        self.window = deque(tuple(item) for item in state["window"])
+        self.count = state["count"]
+
+
+class RollingMeanDeviation:
+    """
+    CCI 使用的移動平均與平均絕對偏差
+
+    平均絕對偏差無法以常數時間更新，每根 K 棒需走訪一次固定大小的視窗（O(period)）
+    """
+
+    def __init__(self, period: int):
+        self.period = period
+        self.values = deque()
+        self.total = 0.0
+
+    def update(self, x: float) -> tuple:
+        self.values.append(x)
+        self.total += x
+        if len(self.values) > self.period:
+            self.total -= self.values.popleft()
+
+        if len(self.values) < self.period:
+            return NAN, NAN
+        mean = self.total / self.period
+        mad = sum(abs(v - mean) for v in self.values) / self.period
+        return mean, mad
+
+    def to_state(self) -> dict:
+        return {"values": list(self.values), "total": self.total}
+
+    def load_state(self, state: dict):
+        self.values = deque(state["values"])
+        self.total = state["total"]
+
+
+class StreamingIndicatorEngine:
+    """
+    單一股票的串流指標引擎
+
+    指標與參數與 calculate_all_indicators 相同，update() 回傳新 K 棒的 19 個指標值
+    """
+
+    def __init__(self, symbol: str = ""):
+        self.symbol = symbol
+        self.first_date: Optional[str] = None
+        self.last_date: Optional[str] = None
+        self.latest: Dict[str, float] = {}
+        self.prev_close: Optional[float] = None
+        self.prev_high: Optional[float] = None
+        self.prev_low: Optional[float] = None
+        self.obv = 0.0
+        self.cum_pv = 0.0
+        self.cum_volume = 0.0
+        self._checkpoint: Optional[dict] = None
+
+        self.states = {
+            "sma_20": RollingMean(20),
+            "sma_50": RollingMean(50),
+            "ema_12": EMA(12),
+            "ema_26": EMA(26),
+            "macd_signal": EMA(9),
+            "rsi_gain": RollingMean(14),
+            "rsi_loss": RollingMean(14),
+            "bb_std": RollingStd(20),
+            "stoch_low": RollingExtreme(14, "min"),
+            "stoch_high": RollingExtreme(14, "max"),
+            "stoch_d": RollingMean(3),
+            "atr": RollingMean(14),
+            "adx_plus_dm": RollingMean(14),
+            "adx_minus_dm": RollingMean(14),
+            "adx_tr": RollingMean(14),
+            "adx": RollingMean(14),
+            "cci": RollingMeanDeviation(20),
+            "williams_high": RollingExtreme(14, "max"),
+            "williams_low": RollingExtreme(14, "min"),
+        }
+
+    def update(
+        self,
+        open_: float,
+        high: float,
+        low: float,
+        close: float,
+        volume: float,
+        date: Optional[str] = None,
+    ) -> Dict[str, float]:
+        """
+        加入一根 K 棒並回傳最新的指標值
+
+        Args:
+            date: K 棒日期（YYYY-MM-DD）；與上一根相同時視為修正（例如盤中資料更新），
+                  會先還原到上一根加入前的狀態再重新計算
+        """
+        if date is not None:
+            if date == self.last_date and self._checkpoint is not None:
+                self._load(self._checkpoint)
+            self._checkpoint = self._dump()
+            if self.first_date is None:
+                self.first_date = date
+            self.last_date = date
+
+        s = self.states
+        high, low, close, volume = float(high), float(low), float(close), float(volume)
+        prev_close, prev_high, prev_low = self.prev_close, self.prev_high, self.prev_low
+        first = prev_close is None
+
+        # 移動平均線
+        sma_20 = s["sma_20"].update(close)
+        sma_50 = s["sma_50"].update(close)
+        ema_12 = s["ema_12"].update(close)
+        ema_26 = s["ema_26"].update(close)
+
+        # RSI（第一根 K 棒的漲跌視為 0）
+        delta = 0.0 if first else close - prev_close
+        gain = s["rsi_gain"].update(delta if delta > 0 else 0.0)
+        loss = s["rsi_loss"].update(-delta if delta < 0 else 0.0)
+        rs = _div(gain, loss)
+        rsi = NAN if math.isnan(rs) else 100 - 100 / (1 + rs)
+
+        # MACD
+        macd = ema_12 - ema_26
+        macd_signal = s["macd_signal"].update(macd)
+
+        # 布林通道
+        std = s["bb_std"].update(close)
+
+        # 隨機指標
+        low_min = s["stoch_low"].update(low)
+        high_max = s["stoch_high"].update(high)
+        stoch_k = 100 * _div(close - low_min, high_max - low_min)
+        stoch_d = s["stoch_d"].update(stoch_k)
+
+        # ATR
+        if first:
+            true_range = high - low
+        else:
+            true_range = max(high - low, abs(high - prev_close), abs(low - prev_close))
+        atr = s["atr"].update(true_range)
+
+        # OBV
+        if not first and delta != 0:
+            self.obv += math.copysign(volume, delta)
+
+        # ADX
+        if first:
+            plus_dm = minus_dm = 0.0
+        else:
+            high_diff = high - prev_high
+            low_diff = prev_low - low
+            plus_dm = high_diff if high_diff > low_diff and high_diff > 0 else 0.0
+            minus_dm = low_diff if low_diff > high_diff and low_diff > 0 else 0.0
+        tr_mean = s["adx_tr"].update(true_range)
+        plus_di = 100 * _div(s["adx_plus_dm"].update(plus_dm), tr_mean)
+        minus_di = 100 * _div(s["adx_minus_dm"].update(minus_dm), tr_mean)
+        dx = 100 * _div(abs(plus_di - minus_di), plus_di + minus_di)
+        adx = s["adx"].update(dx)
+
+        # CCI
+        typical_price = (high + low + close) / 3
+        sma_tp, mad = s["cci"].update(typical_price)
+        cci = _div(typical_price - sma_tp, 0.015 * mad)
+
+        # Williams %R
+        highest_high = s["williams_high"].update(high)
+        lowest_low = s["williams_low"].update(low)
+        williams_r = -100 * _div(highest_high - close, highest_high - lowest_low)
+
+        # VWAP
+        self.cum_pv += typical_price * volume
+        self.cum_volume += volume
+        vwap = _div(self.cum_pv, self.cum_volume)
+
+        self.prev_close, self.prev_high, self.prev_low = close, high, low
+
+        self.latest = {
+            'sma_20': sma_20,
+            'sma_50': sma_50,
+            'ema_12': ema_12,
+            'ema_26': ema_26,
+            'rsi': rsi,
+            'macd': macd,
+            'macd_signal': macd_signal,
+            'macd_histogram': macd - macd_signal,
+            'bb_upper': sma_20 + std * 2,
+            'bb_middle': sma_20,
+            'bb_lower': sma_20 - std * 2,
+            'stoch_k': stoch_k,
+            'stoch_d': stoch_d,
+            'atr': atr,
+            'obv': self.obv,
+            'adx': adx,
+            'cci': cci,
+            'williams_r': williams_r,
+            'vwap': vwap,
+        }
+        return self.latest
+
+    def latest_indicators(self) -> dict:
+        """最新 K 棒的指標值（四捨五入到小數兩位並略過 NaN，與 latest_indicators_from_matrix 相同格式）"""
+        return {key: round(value, 2) for key, value in self.latest.items() if math.isfinite(value)}
+
+    def update_frame(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        依序加入 DataFrame 中尚未處理的 K 棒（日期晚於或等於 last_date）
+
+        Returns:
+            新加入 K 棒的指標值，索引與輸入相同
+        """
+        rows = []
+        index = []
+        for ts, open_, high, low, close, volume in zip(
+            df.index, df['Open'], df['High'], df['Low'], df['Close'], df['Volume']
+        ):
+            date = ts.strftime("%Y-%m-%d")
+            if self.last_date is not None and date < self.last_date:
+                continue
+            rows.append(self.update(open_, high, low, close, volume, date=date))
+            index.append(ts)
+        return pd.DataFrame(rows, index=pd.Index(index, name=df.index.name))
+
+    def _dump(self) -> dict:
+        return {
+            "first_date": self.first_date,
+            "last_date": self.last_date,
+            "latest": dict(self.latest),
+            "prev_close": self.prev_close,
+            "prev_high": self.prev_high,
+            "prev_low": self.prev_low,
+            "obv": self.obv,
+            "cum_pv": self.cum_pv,
+            "cum_volume": self.cum_volume,
+            "states": {name: state.to_state() for name, state in self.states.items()},
+        }
+
+    def _load(self, data: dict):
+        self.first_date = data["first_date"]
+        self.last_date = data["last_date"]
+        self.latest = dict(data["latest"])
+        self.prev_close = data["prev_close"]
+        self.prev_high = data["prev_high"]
+        self.prev_low = data["prev_low"]
+        self.obv = data["obv"]
+        self.cum_pv = data["cum_pv"]
+        self.cum_volume = data["cum_volume"]
+        for name, state in data["states"].items():
+            self.states[name].load_state(state)
+
+    def snapshot(self) -> dict:
+        """將目前狀態序列化為可 JSON 化的字典"""
+        return {
+            "version": SNAPSHOT_VERSION,
+            "symbol": self.symbol,
+            "state": self._dump(),
+            "checkpoint": self._checkpoint,
+        }
+
+    @classmethod
+    def restore(cls, snapshot: dict) -> "StreamingIndicatorEngine":
+        """從 snapshot() 的結果還原引擎"""
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"不支援的指標狀態版本: {snapshot.get('version')}")
+
+        engine = cls(snapshot.get("symbol", ""))
+        engine._load(snapshot["state"])
+        engine._checkpoint = snapshot.get("checkpoint")
+        return engine
+
+
+class IndicatorStateStore:
+    """
+    以 SQLite 保存各股票的串流指標狀態，讓狀態在重新啟動後延續
+
+    與 OHLCVStore 共用同一個資料庫與連線池
+    """
+
+    def __init__(self, pool: ConnectionPool):
+        self.pool = pool
+        self.init_db()
+
+    def init_db(self):
+        """初始化資料庫"""
+        with self.pool.connection() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS indicator_state (
+                    symbol TEXT PRIMARY KEY,
+                    last_date TEXT,
+                    state TEXT NOT NULL,
+                    updated_at TIMESTAMP NOT NULL
+                )
+            ''')
+
+    def load(self, symbol: str) -> Optional[StreamingIndicatorEngine]:
+        """讀取股票的指標狀態，不存在或版本不符時返回 None"""
+        with self.pool.connection() as conn:
+            row = conn.execute('SELECT state FROM indicator_state WHERE symbol = ?', (symbol,)).fetchone()
+
+        if row is None:
+            return None
+        try:
+            return StreamingIndicatorEngine.restore(json.loads(row[0]))
+        except (ValueError, KeyError) as e:
+            logger.warning(f"Discarding indicator state for {symbol}: {str(e)}")
+            return None
+
+    def save(self, engine: StreamingIndicatorEngine):
+        """儲存股票的指標狀態"""
+        with self.pool.connection() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO indicator_state (symbol, last_date, state, updated_at)
+                VALUES (?, ?, ?, ?)
+            ''', (engine.symbol, engine.last_date, json.dumps(engine.snapshot()), datetime.now()))
+
+    def delete(self, symbol: str):
+        """刪除股票的指標狀態（下次寫入 K 棒時從頭重新計算）"""
+        with self.pool.connection() as conn:
+            conn.execute('DELETE FROM indicator_state WHERE symbol = ?', (symbol,))